@@ -1,81 +1,34 @@
 import streamlit as st
 import matplotlib.pyplot as plt
 import seaborn as sns
-import pymysql
-import pandas as pd
-from dotenv import load_dotenv
-import os
 
-load_dotenv()
-
-Host=os.getenv('host')
-User=os.getenv('user')
-Password=os.getenv('password')
-Database=os.getenv('database')
-
-
-
-def connect_db():
-    return pymysql.connect(
-        host= Host,       
-        user=User,            
-        password=Password,     
-        database=Database,
-        cursorclass=pymysql.cursors.DictCursor  
-    )
-
-# Function to execute SQL query
-def run_query(query):
-    conn = connect_db()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(query)
-            result = pd.DataFrame(cursor.fetchall())
-        return result
-    finally:
-        conn.close()
+# Queries run on the shared connection pool (see db.py) through an in-process result cache
+# (see query_cache.py); both live for the whole Streamlit process, so reruns and other
+# sessions are served from memory until the TTL expires or a loader bumps the data version
+from query_cache import cache_stats, cached_query
+# Charts are rendered once per data version and served as cached images (see figure_cache.py)
+from figure_cache import figure_cache_stats, show_figure
+from chart_data import chart_data
+from mart_browser import mart_columns, render_mart_browser
+from kpis import load_kpi_snapshot
+# Every query that reaches the database is timed and attributed to the line that issued it
+from query_profiler import SLOW_QUERY_SECONDS, latency_histogram, profile_stats, reset_profile, slow_queries
+from db import pool_stats
 
 
 # --- KPI Functions ---
+# Served from the precomputed KPI snapshot (see kpis.py): one primary-key lookup per page
 def get_total_revenue():
-    query = "SELECT SUM(total_bill) AS total_revenue FROM hospital_visits_fact"
-    return run_query(query).iloc[0, 0]
+    return load_kpi_snapshot().total_revenue
 
 def get_total_visits():
-    query = "SELECT COUNT(DISTINCT visit_id) AS total_visits FROM hospital_visits_fact"
-    return run_query(query).iloc[0, 0]
+    return load_kpi_snapshot().total_visits
 
 def get_total_patients():
-    query = "SELECT COUNT(DISTINCT patient_id) AS total_patients FROM hospital_visits_fact"
-    return run_query(query).iloc[0, 0]
+    return load_kpi_snapshot().total_patients
 
 def get_most_common_specialization():
-    query = """
-    SELECT d.specialization, COUNT(f.doctor_id) AS count
-    FROM hospital_visits_fact f
-    JOIN doctor_dim d USING (doctor_id)
-    GROUP BY d.specialization
-    ORDER BY count DESC
-    LIMIT 1;
-    """
-    return run_query(query).iloc[0, 0]
-
-
-# --- Data Mart Queries ---
-def get_patient_data_mart():
-    return run_query("SELECT * FROM patient_data_mart")
-
-def get_disease_data_mart():
-    return run_query("SELECT * FROM disease_data_mart")
-
-def get_doctor_data_mart():
-    return run_query("SELECT * FROM doctor_data_mart")
-
-def get_hospital_data_mart():
-    return run_query("SELECT * FROM hospital_data_mart")
-
-def get_billing_data_mart():
-    return run_query("SELECT * FROM billing_data_mart")
+    return load_kpi_snapshot().most_common_specialization
 
 
 # --- Streamlit Dashboard ---
@@ -83,7 +36,7 @@ st.set_page_config(page_title="Healthcare Dashboard", layout="wide")
 st.title("Healthcare Data Dashboard")
 
 # Navigation Menu
-menu = st.sidebar.radio("NAVIGATION", ["Schema", "KPIs", "Aggregations", "Data Marts"])
+menu = st.sidebar.radio("NAVIGATION", ["Schema", "KPIs", "Aggregations", "Data Marts", "Performance"])
 
 # --- Schema Section ---
 if menu == "Schema":
@@ -106,16 +59,18 @@ elif menu == "KPIs":
         st.metric(label="Total Revenue", value=f"${total_revenue:,.2f}")
 
         # 📊 **Bar Chart for Total Revenue**
-        fig, ax = plt.subplots(figsize=(5, 3))
-        ax.barh(["Total Revenue"], [total_revenue], color="orange")
-        ax.set_xlabel("Revenue ($)")
-        ax.set_title("💰 Total Revenue Generated")
+        def draw():
+            fig, ax = plt.subplots(figsize=(5, 3))
+            ax.barh(["Total Revenue"], [total_revenue], color="orange")
+            ax.set_xlabel("Revenue ($)")
+            ax.set_title("💰 Total Revenue Generated")
 
-        # Display value inside the bar
-        for i, v in enumerate([total_revenue]):
-            ax.text(v, i, f"${v:,.2f}", va='center', fontsize=12, fontweight="bold")
+            # Display value inside the bar
+            for i, v in enumerate([total_revenue]):
+                ax.text(v, i, f"${v:,.2f}", va='center', fontsize=12, fontweight="bold")
 
-        st.pyplot(fig)
+            return fig
+        show_figure("total_revenue_bar", draw)
 
     elif kpi_choice == "Total Visits":
         total_visits = get_total_visits()
@@ -127,11 +82,13 @@ elif menu == "KPIs":
         sizes = [total_visits]
         colors = ["#FF6F61"]
 
-        fig, ax = plt.subplots()
-        ax.pie(sizes, labels=labels, autopct="%1.1f%%", colors=colors, startangle=90)
-        ax.set_title("🏥 Total Visits Breakdown")
+        def draw():
+            fig, ax = plt.subplots()
+            ax.pie(sizes, labels=labels, autopct="%1.1f%%", colors=colors, startangle=90)
+            ax.set_title("🏥 Total Visits Breakdown")
 
-        st.pyplot(fig)
+            return fig
+        show_figure("total_visits_pie", draw)
 
     elif kpi_choice == "Total Patients Treated":
         total_patients = get_total_patients()
@@ -139,16 +96,18 @@ elif menu == "KPIs":
         st.metric(label="Total Patients", value=f"{total_patients:,}")
 
         # 📊 **Gauge Chart for Total Patients**
-        fig, ax = plt.subplots(figsize=(5, 3))
-        ax.barh(["Patients Treated"], [total_patients], color="seagreen")
-        ax.set_xlabel("Patients")
-        ax.set_title("🩺 Total Patients Treated")
+        def draw():
+            fig, ax = plt.subplots(figsize=(5, 3))
+            ax.barh(["Patients Treated"], [total_patients], color="seagreen")
+            ax.set_xlabel("Patients")
+            ax.set_title("🩺 Total Patients Treated")
 
-        # Display value inside the bar
-        for i, v in enumerate([total_patients]):
-            ax.text(v, i, f"{v:,}", va='center', fontsize=12, fontweight="bold")
+            # Display value inside the bar
+            for i, v in enumerate([total_patients]):
+                ax.text(v, i, f"{v:,}", va='center', fontsize=12, fontweight="bold")
 
-        st.pyplot(fig)
+            return fig
+        show_figure("total_patients_bar", draw)
 
     elif kpi_choice == "Most Common Specialization Consulted":
         common_specialization = get_most_common_specialization()
@@ -160,11 +119,13 @@ elif menu == "KPIs":
         sizes = [70, 30]  # Assume 70% consultations for top specialization
         colors = ["#0073e6", "#d3d3d3"]
 
-        fig, ax = plt.subplots()
-        ax.pie(sizes, labels=labels, autopct="%1.1f%%", colors=colors, startangle=90, wedgeprops={'edgecolor': 'white'})
-        ax.set_title("🧑‍⚕️ Specialization Popularity")
+        def draw():
+            fig, ax = plt.subplots()
+            ax.pie(sizes, labels=labels, autopct="%1.1f%%", colors=colors, startangle=90, wedgeprops={'edgecolor': 'white'})
+            ax.set_title("🧑‍⚕️ Specialization Popularity")
 
-        st.pyplot(fig)
+            return fig
+        show_figure("top_specialization_donut", draw)
 # --- Aggregations Section ---
 elif menu == "Aggregations":
     st.header("Aggregations and Insights")
@@ -183,11 +144,13 @@ elif menu == "Aggregations":
         JOIN disease_dim d USING (disease_id)
         GROUP BY d.category;
         """
-        df = run_query(query)
-        fig, ax = plt.subplots()
-        ax.pie(df["disease_count"], labels=df["category"], autopct='%1.1f%%', startangle=90)
-        ax.set_title("Disease Category Distribution")
-        st.pyplot(fig)
+        def draw():
+            df = cached_query(query)
+            fig, ax = plt.subplots()
+            ax.pie(df["disease_count"], labels=df["category"], autopct='%1.1f%%', startangle=90)
+            ax.set_title("Disease Category Distribution")
+            return fig
+        show_figure("disease_category_counts", draw)
 
     elif agg_choice == "Hospital Revenue":
         query = """
@@ -196,11 +159,13 @@ elif menu == "Aggregations":
         JOIN hospital_dim h USING (hospital_id)
         GROUP BY h.hospital_name;
         """
-        df = run_query(query)
-        fig, ax = plt.subplots()
-        ax.pie(df["revenue"], labels=df["hospital_name"], autopct='%1.1f%%', startangle=90)
-        ax.set_title("Revenue by Hospital")
-        st.pyplot(fig)
+        def draw():
+            df = cached_query(query)
+            fig, ax = plt.subplots()
+            ax.pie(df["revenue"], labels=df["hospital_name"], autopct='%1.1f%%', startangle=90)
+            ax.set_title("Revenue by Hospital")
+            return fig
+        show_figure("hospital_revenue_pie", draw)
     elif agg_choice == "Average Bill by Insurance Type":
         query = """
         SELECT b.insurance_type, AVG(f.total_bill) AS avg_bill
@@ -208,13 +173,15 @@ elif menu == "Aggregations":
         JOIN billing_dim b USING (billing_id)
         GROUP BY b.insurance_type;
         """
-        df = run_query(query)
-        fig, ax = plt.subplots()
-        sns.barplot(x="insurance_type", y="avg_bill", data=df, ax=ax)
-        ax.set_title("Average Bill by Insurance Type")
-        ax.set_xlabel("Insurance Type")
-        ax.set_ylabel("Average Bill ($)")
-        st.pyplot(fig)
+        def draw():
+            df = cached_query(query)
+            fig, ax = plt.subplots()
+            sns.barplot(x="insurance_type", y="avg_bill", data=df, ax=ax)
+            ax.set_title("Average Bill by Insurance Type")
+            ax.set_xlabel("Insurance Type")
+            ax.set_ylabel("Average Bill ($)")
+            return fig
+        show_figure("avg_bill_by_insurance_type", draw)
 
     elif agg_choice == "Patient Visits by Age Group":
         query = """
@@ -232,13 +199,15 @@ elif menu == "Aggregations":
         GROUP BY age_group
         ORDER BY age_group;
         """
-        df = run_query(query)
-        fig, ax = plt.subplots()
-        sns.barplot(x="age_group", y="visit_count", data=df, ax=ax)
-        ax.set_title("Patient Visits by Age Group")
-        ax.set_xlabel("Age Group")
-        ax.set_ylabel("Number of Visits")
-        st.pyplot(fig)
+        def draw():
+            df = cached_query(query)
+            fig, ax = plt.subplots()
+            sns.barplot(x="age_group", y="visit_count", data=df, ax=ax)
+            ax.set_title("Patient Visits by Age Group")
+            ax.set_xlabel("Age Group")
+            ax.set_ylabel("Number of Visits")
+            return fig
+        show_figure("visits_by_age_group", draw)
 
 
 
@@ -249,95 +218,156 @@ elif menu == "Data Marts":
     mart_choice = st.selectbox("Select a Data Mart", mart_options)
 
     if mart_choice == "Patient Data Mart":
-        df = get_patient_data_mart()
         st.subheader("Patient Data Mart")
-        st.dataframe(df)
+        render_mart_browser("patient_data_mart")
 
         st.subheader("Patient Age Distribution")
-        fig, ax = plt.subplots()
-        sns.histplot(df["age"], bins=20, kde=True, ax=ax)
-        ax.set_xlabel("Age")
-        ax.set_ylabel("Frequency")
-        st.pyplot(fig)
+        def draw():
+            bins = chart_data("patient_age_histogram")
+            fig, ax = plt.subplots()
+            sns.histplot(
+                x=(bins["bin_start"] + bins["bin_end"]) / 2, weights=bins["count"],
+                bins=list(bins["bin_start"]) + list(bins["bin_end"][-1:]), kde=True, ax=ax
+            )
+            ax.set_xlabel("Age")
+            ax.set_ylabel("Frequency")
+            return fig
+        show_figure("patient_age_histogram", draw)
 
     elif mart_choice == "Disease Data Mart":
-        df = get_disease_data_mart()
         st.subheader("Disease Data Mart")
-        st.dataframe(df)
+        render_mart_browser("disease_data_mart")
 
         st.subheader("Most Common Diseases")
-        disease_counts = df.set_index("disease_name")["total_cases"].sort_values(ascending=False)
-        fig, ax = plt.subplots()
-        disease_counts.head(10).plot(kind="bar", color="lightblue", ax=ax)
-        ax.set_ylabel("Total Cases")
-        st.pyplot(fig)
+        def draw():
+            disease_counts = chart_data("top_diseases").set_index("disease_name")["total_cases"]
+            fig, ax = plt.subplots()
+            disease_counts.plot(kind="bar", color="lightblue", ax=ax)
+            ax.set_ylabel("Total Cases")
+            return fig
+        show_figure("top_diseases", draw)
 
     elif mart_choice == "Doctor Data Mart":
-        df = get_doctor_data_mart()
         st.subheader("Doctor Data Mart")
-        st.dataframe(df)
+        render_mart_browser("doctor_data_mart")
 
         st.subheader("Top Specializations by Patients Seen")
-        specialization_counts = df.groupby("specialization")["total_patients_seen"].sum().sort_values(ascending=False)
-        fig, ax = plt.subplots()
-        specialization_counts.head(10).plot(kind="bar", color="orange", ax=ax)
-        ax.set_ylabel("Patients Seen")
-        st.pyplot(fig)
+        def draw():
+            specialization_counts = chart_data("top_specializations").set_index("specialization")["total_patients_seen"]
+            fig, ax = plt.subplots()
+            specialization_counts.plot(kind="bar", color="orange", ax=ax)
+            ax.set_ylabel("Patients Seen")
+            return fig
+        show_figure("top_specializations", draw)
 
     elif mart_choice == "Hospital Data Mart":
-        df = get_hospital_data_mart()
         st.subheader("Hospital Data Mart")
-        st.dataframe(df)
+        render_mart_browser("hospital_data_mart")
 
     # Debugging: Show column names
-        st.write("Hospital Data Mart Columns:", df.columns)
-
-    # 📊 Plot: Hospital Revenue Distribution
-        st.subheader("Hospital Revenue Distribution")
-        fig, ax = plt.subplots()
-        sns.barplot(x="hospital_name", y="total_revenue", data=df, ax=ax)
-        ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha="right")
-        ax.set_ylabel("Total Revenue ($)")
-        st.pyplot(fig)
-
-    # 📊 Plot: Hospital Patient Count
-        st.subheader("Number of Patients Treated Per Hospital")
-        fig, ax = plt.subplots()
-
-    # ✅ Fixed column name from total_patients_treated → total_patients
-        sns.barplot(x="hospital_name", y="total_patients", data=df, ax=ax, color="lightblue")  
-    
-        ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha="right")
-        ax.set_ylabel("Total Patients Treated")
-        st.pyplot(fig)
+        st.write("Hospital Data Mart Columns:", mart_columns("hospital_data_mart"))
+
+    # 📊 Plot: Hospital Revenue Distribution (top hospitals)
+        st.subheader("Hospital Revenue Distribution (Top 20 Hospitals)")
+        def draw():
+            fig, ax = plt.subplots()
+            sns.barplot(x="hospital_name", y="total_revenue", data=chart_data("hospital_revenue"), ax=ax)
+            ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha="right")
+            ax.set_ylabel("Total Revenue ($)")
+            return fig
+        show_figure("hospital_revenue", draw)
+
+    # 📊 Plot: Hospital Visit Count (top hospitals)
+        st.subheader("Number of Visits Per Hospital (Top 20 Hospitals)")
+        def draw():
+            fig, ax = plt.subplots()
+
+            # ✅ The mart has no total_patients column; it counts visits per hospital
+            sns.barplot(x="hospital_name", y="total_visits", data=chart_data("hospital_visits"), ax=ax, color="lightblue")
+
+            ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha="right")
+            ax.set_ylabel("Total Visits")
+            return fig
+        show_figure("hospital_visits", draw)
 
 
     elif mart_choice == "Billing Data Mart":
-        df = get_billing_data_mart()
         st.subheader("Billing Data Mart")
-        st.dataframe(df)
+        render_mart_browser("billing_data_mart")
 
     # Debugging: Show column names
-        st.write("Billing Data Mart Columns:", df.columns)
+        st.write("Billing Data Mart Columns:", mart_columns("billing_data_mart"))
 
     # 📊 Plot: Total Revenue by Payment Method
         st.subheader("Total Revenue by Payment Method")
-        fig, ax = plt.subplots()
-        sns.barplot(x="payment_method", y="total_billed", data=df, ax=ax, palette="coolwarm")  # ✅ Fixed column name
-        ax.set_ylabel("Total Billed ($)")
-        st.pyplot(fig)
-
-    # 📊 Plot: Claim Status Distribution
+        def draw():
+            fig, ax = plt.subplots()
+            sns.barplot(x="payment_method", y="total_billed", data=chart_data("billing_by_payment_method"), ax=ax,
+                        palette="coolwarm")
+            ax.set_ylabel("Total Billed ($)")
+            return fig
+        show_figure("billing_by_payment_method", draw)
+
+    # 📊 Plot: Claim Status Distribution (NULL statuses are left out in SQL)
         st.subheader("Insurance Claim Status Distribution")
-    
-    # Handle NaN values before plotting
-        df = df.dropna(subset=["claim_status"])
-    
-        fig, ax = plt.subplots()
-        df["claim_status"].value_counts().plot(kind="pie", autopct="%1.1f%%", startangle=90, ax=ax)
-        ax.set_ylabel("")
-        st.pyplot(fig)
-
-
-
-    
+        def draw():
+            claim_counts = chart_data("claim_statuses").set_index("claim_status")["count"]
+            fig, ax = plt.subplots()
+            claim_counts.plot(kind="pie", autopct="%1.1f%%", startangle=90, ax=ax)
+            ax.set_ylabel("")
+            return fig
+        show_figure("claim_statuses", draw)
+
+
+# --- Performance Section ---
+elif menu == "Performance":
+    st.header("⚙️ Query Performance")
+    st.caption(
+        "Queries that reached the database since this dashboard process started (cached results never do). "
+        f"Queries over {SLOW_QUERY_SECONDS}s are logged as slow."
+    )
+    if st.button("Reset profile"):
+        reset_profile()
+
+    stats = profile_stats()
+    if stats.empty:
+        st.info("No queries profiled yet: open the other pages first.")
+    else:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Queries", f"{stats['calls'].sum():,}")
+        col2.metric("Database Time", f"{stats['total_ms'].sum() / 1000:,.2f}s")
+        col3.metric("Slow Queries", f"{stats['slow'].sum():,}")
+
+        # 📊 Which widgets cost the most database time
+        st.subheader("Database Time by Widget (ms)")
+        st.bar_chart(stats.groupby("caller")["total_ms"].sum().sort_values(ascending=False))
+
+        st.subheader("Queries")
+        st.dataframe(stats, use_container_width=True)
+
+        # 📊 Latency histogram, for every query or one of them
+        st.subheader("Latency Histogram")
+        query_options = {"All queries": (None, None)}
+        query_options.update({f"{row.caller} | {row.query[:80]}": (row.caller, row.query) for row in stats.itertuples()})
+        query_choice = st.selectbox("Select a Query", list(query_options))
+        st.bar_chart(latency_histogram(*query_options[query_choice]))
+
+    st.subheader("🐢 Slow Queries")
+    slow = slow_queries()
+    if not slow:
+        st.write("None so far.")
+    for entry in reversed(slow):
+        with st.expander(f"{entry['seconds']:.2f}s, {entry['rows']:,} rows: {entry['caller']} ({entry['at']})"):
+            st.code(entry["query"], language="sql")
+            st.write(f"Execute {entry['execute_seconds']:.3f}s, fetch {entry['fetch_seconds']:.3f}s")
+            if "plan" in entry:
+                st.write(entry["plan"])
+
+    st.subheader("Caches and Connection Pool")
+    col1, col2, col3 = st.columns(3)
+    col1.write("Connection Pool")
+    col1.json(pool_stats())
+    col2.write("Query Cache")
+    col2.json(cache_stats())
+    col3.write("Figure Cache")
+    col3.json(figure_cache_stats())
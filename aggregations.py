@@ -1,31 +1,16 @@
-import pymysql
-import pandas as pd
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
+import sys
 
-Host=os.getenv('host')
-User=os.getenv('user')
-Password=os.getenv('password')
-Database=os.getenv('database')
+import pandas as pd
 
-# DB_CONFIG = {
-#         "host": Host,       
-#         "user":User,            
-#         "password":Password,     
-#         "database":Database  
-# }
+from db import DB_BACKEND, get_connection, query_cursor, run_query as run_db_query
+from instrumentation import traced
+from query_profiler import run_profiled
+from star_engine import get_star_engine
 
 # --- Database Connection ---
 def connect_db():
-    return pymysql.connect(
-        host= Host,       
-        user=User,            
-        password=Password,     
-        database=Database,
-        cursorclass=pymysql.cursors.DictCursor  # Returns results as dictionaries
-    )
+    # Pooled connection (see db.py) returning rows as dictionaries; close() returns it to the pool
+    return get_connection()
 
 # --- SQL Aggregation Queries ---
 QUERIES = {
@@ -74,23 +59,246 @@ QUERIES = {
 }
 
 # --- Function to Execute SQL Queries ---
+@traced("aggregation_query")
 def run_query(query):
     conn = connect_db()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(query)
-            result = cursor.fetchall()
+        with query_cursor(conn) as cursor:
+            result = run_profiled(cursor, query, None, lambda c: c.fetchall())
         return result
     finally:
         conn.close()
 
+# --- Server-Side Aggregation Engine ---
+# Every requested metric comes back from one statement that reads the fact table once: each visit
+# is joined to the dimensions the metrics need, repeated once per metric through a small CROSS
+# JOIN, and a single GROUP BY (metric, label) builds every metric's groups side by side. That is
+# GROUPING SETS done by hand, which MySQL lacks. Each metric's groups come back as (label, visits,
+# non-null bills, revenue, distinct patients, average patient age) rows.
+# DuckDB scans the joined visits faster than it fans them out, so there the join is materialized
+# once in a CTE and each metric groups its own copy of it, combined with UNION ALL.
+
+# Dimensions a metric can group on, by the alias its label expression uses: table and key column.
+# Each is LEFT JOINed once, and a metric only counts the visits its own dimension row matched,
+# like the inner join of the equivalent single query.
+DIMENSION_JOINS = {
+    "p": ("patient_dim", "patient_id"),
+    "dis": ("disease_dim", "disease_id"),
+    "doc": ("doctor_dim", "doctor_id"),
+    "h": ("hospital_dim", "hospital_id"),
+    "b": ("billing_dim", "billing_id"),
+}
+
+
+def _quoted(names):
+    return ", ".join(f"'{name}'" for name in names)
+
+
+def _joins(aliases):
+    return "\n        ".join(
+        f"LEFT JOIN {table} {alias} ON {alias}.{key} = f.{key}"
+        for alias, (table, key) in ((alias, DIMENSION_JOINS[alias]) for alias in aliases)
+    )
+
+
+def _materialized_query(branches, distinct, aliases):
+    # Label expressions are worked out once in the CTE, under a column name each
+    labels = {}
+    for label, _ in branches.values():
+        if label is not None:
+            labels.setdefault(label, f"label_{len(labels)}")
+    columns = ["f.patient_id", "f.total_bill"]
+    columns += [f"{alias}.{DIMENSION_JOINS[alias][1]} IS NOT NULL AS matched_{alias}" for alias in aliases]
+    columns += ["p.age"] if "p" in aliases else []
+    columns += [f"{label} AS {column}" for label, column in labels.items()]
+
+    average_age = "AVG(age)" if "p" in aliases else "NULL"
+    selects = []
+    for name, (label, alias) in branches.items():
+        column = labels[label] if label is not None else "NULL"
+        patients = "COUNT(DISTINCT patient_id)" if name in distinct else ("0" if distinct else "NULL")
+        select = (
+            f"SELECT '{name}' AS metric, {column} AS label, COUNT(*) AS visits, COUNT(total_bill) AS bills, "
+            f"SUM(total_bill) AS revenue, {patients} AS patients, {average_age} AS average_age FROM joined"
+        )
+        if alias is not None:
+            select += f" WHERE matched_{alias}"
+        if label is not None:
+            select += f" GROUP BY {column}"
+        selects.append(select)
+    newline = "\n        "
+    return f"""
+        WITH joined AS MATERIALIZED (
+            SELECT {", ".join(columns)}
+            FROM hospital_visits_fact f
+            {_joins(aliases)}
+        )
+        {f"{newline}UNION ALL{newline}".join(selects)}
+    """
+
+
+def grouping_query(branches, distinct=(), backend=None):
+    """One pass over the fact table `f` for `branches`: name -> (label expression or None, dimension alias or None).
+
+    COUNT(DISTINCT patient_id) is only worked out for the metrics named in `distinct`, and the
+    average patient age only when the patient dimension is joined.
+    """
+    aliases = list(dict.fromkeys(alias for _, alias in branches.values() if alias is not None))
+    if (backend or DB_BACKEND) == "duckdb":
+        return _materialized_query(branches, distinct, aliases)
+
+    labelled = [f"WHEN '{name}' THEN {label}" for name, (label, _) in branches.items() if label is not None]
+    label = f"CASE g.metric {' '.join(labelled)} END" if labelled else "NULL"
+
+    patients = f"COUNT(DISTINCT CASE WHEN g.metric IN ({_quoted(distinct)}) THEN f.patient_id END)" if distinct else "NULL"
+    average_age = "AVG(p.age)" if "p" in aliases else "NULL"
+
+    # Each metric keeps the visits its dimension row matched; metrics without one keep them all
+    conditions = []
+    for alias in [None] + aliases:
+        metrics = _quoted(name for name, (_, joined) in branches.items() if joined == alias)
+        if not metrics:
+            continue
+        if alias is None:
+            conditions.append(f"g.metric IN ({metrics})")
+        else:
+            conditions.append(f"(g.metric IN ({metrics}) AND {alias}.{DIMENSION_JOINS[alias][1]} IS NOT NULL)")
+
+    metric_rows = " UNION ALL ".join(f"SELECT '{name}' AS metric" for name in branches)
+    return f"""
+        SELECT g.metric, {label} AS label, COUNT(*) AS visits, COUNT(f.total_bill) AS bills,
+            SUM(f.total_bill) AS revenue, {patients} AS patients, {average_age} AS average_age
+        FROM hospital_visits_fact f
+        {_joins(aliases)}
+        CROSS JOIN ({metric_rows}) g
+        WHERE {" OR ".join(conditions)}
+        GROUP BY g.metric, label
+    """
+
+
+def run_grouped(branches, distinct=()):
+    """Run `branches` as one statement and split the rows back into a frame per branch."""
+    if not branches:
+        return {}
+    columns = ["label", "visits", "bills", "revenue", "patients", "average_age"]
+    df = run_db_query(grouping_query(branches, distinct))
+    if df.empty:
+        df = pd.DataFrame(columns=["metric"] + columns)
+    # MySQL returns SUM() and AVG() as Decimal, and NULL for groups without a bill
+    df["revenue"] = df["revenue"].astype(float).fillna(0.0)
+    df["average_age"] = df["average_age"].astype(float)
+    return {name: df.loc[df["metric"] == name, columns].reset_index(drop=True) for name in branches}
+
+
+def _patient_statistics_rollup(totals):
+    return [{
+        "total_patients": int(row.patients), "average_age": row.average_age, "total_visits": int(row.visits)
+    } for row in totals.itertuples()]
+
+
+def _financial_metrics(totals):
+    bills = totals["bills"].sum()
+    return [{
+        "average_bill_per_visit": totals["revenue"].sum() / bills if bills else None,
+        "total_revenue": totals["revenue"].sum(),
+    }]
+
+
+def _hospital_revenue(totals):
+    return [{"hospital_name": row.label, "revenue": row.revenue} for row in totals.itertuples()]
+
+
+def _patients_per_doctor_rollup(totals):
+    return [{"doctor_name": row.label, "patient_count": int(row.patients)} for row in totals.itertuples()]
+
+
+def _disease_category_counts(totals):
+    return [{"category": row.label, "disease_count": int(row.visits)} for row in totals.itertuples()]
+
+
+# In-process equivalents of the COUNT(DISTINCT) metrics, for the star engine
+def _patient_statistics(star):
+    parts = star.fact_parts(["patient_id"]).merge(star.dims["patient_dim"][["patient_id", "age"]], on="patient_id")
+    aged = parts[parts["age"].notna()]
+    return [{
+        "total_patients": parts["patient_id"].nunique(),
+        "average_age": (aged["age"] * aged["visits"]).sum() / aged["visits"].sum(),
+        "total_visits": int(parts["visits"].sum()),
+    }]
+
+
+def _patients_per_doctor(star):
+    parts = star.fact_parts(["doctor_id", "patient_id"])
+    joined = parts.merge(star.dims["doctor_dim"][["doctor_id", "doctor_name"]], on="doctor_id")
+    result = joined.groupby("doctor_name", as_index=False).agg(patient_count=("patient_id", "nunique"))
+    return result.to_dict("records")
+
+
+# Every metric of QUERIES: its branch of the grouping query and how its rows are rolled up.
+# On the star engine, additive metrics are rolled up from the same totals grouped by "dimension";
+# COUNT(DISTINCT) metrics ("distinct") can't be, and are computed by "compute" instead.
+METRICS = {
+    "patient_statistics": {
+        "branch": (None, "p"),
+        "distinct": True,
+        "rollup": _patient_statistics_rollup,
+        "compute": _patient_statistics,
+    },
+    "financial_metrics": {
+        "branch": (None, None),
+        "dimension": (None, None),
+        "rollup": _financial_metrics,
+    },
+    "hospital_revenue": {
+        "branch": ("h.hospital_name", "h"),
+        "dimension": ("hospital_dim", "hospital_name"),
+        "rollup": _hospital_revenue,
+    },
+    "patients_per_doctor": {
+        "branch": ("doc.doctor_name", "doc"),
+        "distinct": True,
+        "rollup": _patients_per_doctor_rollup,
+        "compute": _patients_per_doctor,
+    },
+    "disease_category_counts": {
+        "branch": ("dis.category", "dis"),
+        "dimension": ("disease_dim", "category"),
+        "rollup": _disease_category_counts,
+    },
+}
+
+
+@traced("aggregations")
+def run_aggregations(names=None, metrics=METRICS, engine="sql"):
+    """Compute several `metrics` (QUERIES by default) in one statement over one connection.
+
+    With engine="numpy" they run in-process on the star engine (see star_engine.py) instead.
+    """
+    names = list(names or metrics)
+
+    if engine == "numpy":
+        star = get_star_engine()
+        return {
+            name: metrics[name]["compute"](star) if metrics[name].get("distinct")
+            else metrics[name]["rollup"](star.totals_by(*metrics[name]["dimension"]))
+            for name in names
+        }
+
+    totals = run_grouped(
+        {name: metrics[name]["branch"] for name in names},
+        distinct=[name for name in names if metrics[name].get("distinct")],
+    )
+    return {name: metrics[name]["rollup"](totals[name]) for name in names}
+
+
 # --- Main Execution ---
 if __name__ == "__main__":
-    patient_stats = run_query(QUERIES["patient_statistics"])
-    financial_metrics = run_query(QUERIES["financial_metrics"])
-    hospital_revenue = run_query(QUERIES["hospital_revenue"])
-    patients_per_doctor = run_query(QUERIES["patients_per_doctor"])
-    disease_counts = run_query(QUERIES["disease_category_counts"])
+    results = run_aggregations(engine="numpy" if "--numpy" in sys.argv else "sql")
+    patient_stats = results["patient_statistics"]
+    financial_metrics = results["financial_metrics"]
+    hospital_revenue = results["hospital_revenue"]
+    patients_per_doctor = results["patients_per_doctor"]
+    disease_counts = results["disease_category_counts"]
 
     # Display Results
     print("\n📊 Patient Statistics:", patient_stats)
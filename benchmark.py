@@ -0,0 +1,405 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from clean import OUTPUT_TABLES
+from schema import PRIMARY_KEYS, STAR_SCHEMA
+from star_engine import FACT_TABLE, FOREIGN_KEYS
+from storage import read_table
+
+# Scaling benchmark for the pipeline: a synthetic raw extract modeled on the cleaned_* tables is
+# generated at each scale, run through clean.py, and every mart, KPI and aggregation query is
+# timed on the embedded DuckDB backend and the NumPy star engine. Each scale runs in its own
+# process, and the peak RSS is reset before every stage so each stage reports its own. Data marts
+# are timed as SELECT * over DuckDB's mart views, not through datamart.py, which needs MySQL.
+# Results are appended to a JSON history and compared with the previous run at the same scale.
+
+DEFAULT_SCALES = ["10k", "100k", "1M"]
+MAX_VISITS = 100_000_000
+
+# Dimensions that grow with the number of visits; the others are reference tables of fixed size
+SCALED_DIMENSIONS = ["patient_dim", "billing_dim"]
+
+# Raw rows generated and written per chunk
+GENERATE_CHUNK_SIZE = 1_000_000
+
+# Timed runs per query; the fastest is kept
+REPEAT = 3
+
+BENCHMARK_HISTORY = "benchmark_history.json"
+
+# A stage is flagged when it is this much slower (or uses this much more memory) than in the
+# previous run at the same scale, ignoring differences below the noise floor
+REGRESSION_THRESHOLD = 0.20
+REGRESSION_MIN_SECONDS = 0.01
+RSS_REGRESSION_THRESHOLD = 0.20
+
+KPI_QUERIES = [
+    "get_total_revenue", "get_revenue_by_disease", "get_revenue_by_doctor", "get_revenue_by_hospital",
+    "get_total_visits", "get_avg_revenue_per_visit", "get_revenue_per_patient", "get_visits_by_gender",
+    "get_visits_by_age_group", "get_claim_status_breakdown", "get_revenue_by_insurance_type",
+    "get_hospital_visits_trend",
+]
+
+QUANTILES = np.linspace(0, 1, 101)
+
+
+def parse_scale(text):
+    """'10k' -> 10_000, '1M' -> 1_000_000."""
+    multiplier = {"k": 10**3, "m": 10**6}.get(text[-1].lower(), 1)
+    visits = int(float(text.rstrip("kKmM")) * multiplier)
+    if not 0 < visits <= MAX_VISITS:
+        raise argparse.ArgumentTypeError(f"scale must be between 1 and {MAX_VISITS:,} visits")
+    return visits
+
+
+# --- Profile of the cleaned tables ---
+
+def profile_column(series, kind):
+    if kind in ("category", "string"):
+        frequencies = series.value_counts(dropna=False, normalize=True)
+        return {
+            "values": [None if pd.isna(value) else value for value in frequencies.index],
+            "cumulative": frequencies.cumsum().tolist(),
+        }
+    if kind == "date":
+        series = (pd.to_datetime(series) - pd.Timestamp(0)).dt.days
+    return {
+        "kind": kind,
+        "null_rate": float(series.isna().mean()),
+        "quantiles": series.dropna().quantile(QUANTILES).tolist(),
+    }
+
+
+def profile_tables():
+    """Value distributions, table sizes and orphan foreign key rates of the cleaned tables."""
+    tables = {table_name: read_table(table_name, compact=False) for table_name in STAR_SCHEMA}
+    fact = tables[FACT_TABLE]
+    return {
+        "visits": len(fact),
+        "rows": {
+            table_name: int(df[PRIMARY_KEYS[table_name]].nunique()) for table_name, df in tables.items()
+        },
+        "columns": {
+            table_name: {
+                column: profile_column(tables[table_name][column], kind)
+                for column, kind in columns.items() if kind != "uuid"
+            }
+            for table_name, columns in STAR_SCHEMA.items()
+        },
+        # Share of visits whose key has no row in the dimension
+        "orphan_rates": {
+            key: float((~fact[key].isin(tables[dim][key])).mean()) for key, dim in FOREIGN_KEYS.items()
+        },
+    }
+
+
+# --- Synthetic raw extract ---
+# Every value is a hash of (row number, column), so a dimension row has the same attributes on
+# every visit that references it no matter which chunk the visit falls in.
+
+def _salt(*names):
+    return zlib.crc32(".".join(names).encode())
+
+
+def _hash(values, salt):
+    # splitmix64 finaliser over (value, salt)
+    with np.errstate(over="ignore"):
+        x = np.asarray(values, dtype=np.uint64) + np.uint64(salt) * np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def _uniform(values, salt):
+    return (_hash(values, salt) >> np.uint64(11)) * 2.0**-53
+
+
+def synthetic_uuids(values, salt):
+    high, low = _hash(values, salt).tolist(), _hash(values, salt + 1).tolist()
+    return [
+        f"{h >> 32:08x}-{h >> 16 & 0xffff:04x}-{h & 0xffff:04x}-{l >> 48:04x}-{l & 0xffffffffffff:012x}"
+        for h, l in zip(high, low)
+    ]
+
+
+def sample_column(spec, values, salt):
+    u = _uniform(values, salt)
+    if "values" in spec:
+        positions = np.searchsorted(spec["cumulative"], u, side="right").clip(max=len(spec["values"]) - 1)
+        return np.asarray(spec["values"], dtype=object)[positions]
+
+    sampled = np.interp(u, QUANTILES, spec["quantiles"])
+    missing = _uniform(values, salt + 1) < spec["null_rate"]
+    if spec["kind"] == "date":
+        return pd.to_datetime(np.where(missing, np.nan, np.floor(sampled)), unit="D")
+    if spec["kind"] == "int":
+        sampled = pd.array(np.round(sampled).astype("int64"), dtype="Int64")
+        sampled[missing] = pd.NA
+        return sampled
+    return np.where(missing, np.nan, np.round(sampled, 2))
+
+
+def raw_columns():
+    """Raw extract column -> (output table, column) it is cleaned into, in raw column order."""
+    columns = {}
+    for table_name, spec in OUTPUT_TABLES.items():
+        for raw in spec["columns"]:
+            columns.setdefault(raw, (table_name, spec["rename"].get(raw, raw)))
+    return columns
+
+
+def dimension_sizes(profile, visits):
+    sizes = {}
+    for dim in FOREIGN_KEYS.values():
+        rows = profile["rows"][dim]
+        if dim in SCALED_DIMENSIONS:
+            rows = round(rows * visits / profile["visits"])
+        sizes[dim] = min(max(rows, 1), visits)
+    return sizes
+
+
+def generate_chunk(profile, sizes, start, stop, seed=0):
+    visit = np.arange(start, stop, dtype=np.uint64)
+    # The first `size` visits reference every dimension row once, the rest pick one at random
+    rows = {
+        dim: np.where(visit < size, visit, _hash(visit, _salt(dim) + seed) % np.uint64(size))
+        for dim, size in sizes.items()
+    }
+    columns = raw_columns()
+    separate_keys = {column for table_name, column in columns.values() if table_name != FACT_TABLE}
+
+    chunk = {}
+    for raw, (table_name, column) in columns.items():
+        salt = _salt(table_name, column) + seed
+        if table_name == FACT_TABLE and column == "visit_id":
+            chunk[raw] = synthetic_uuids(visit, salt)
+        elif table_name == FACT_TABLE and column in FOREIGN_KEYS:
+            dim = FOREIGN_KEYS[column]
+            keys = np.asarray(synthetic_uuids(rows[dim], _salt(dim, column) + seed), dtype=object)
+            # Only keys the extract also carries on the dimension side (patient_id_x/_y) can dangle
+            if column in separate_keys:
+                orphans = _uniform(visit, salt) < profile["orphan_rates"][column]
+                keys[orphans] = synthetic_uuids(visit[orphans], salt + 1)
+            chunk[raw] = keys
+        elif table_name == FACT_TABLE:
+            chunk[raw] = sample_column(profile["columns"][table_name][column], visit, salt)
+        elif column == PRIMARY_KEYS[table_name]:
+            chunk[raw] = synthetic_uuids(rows[table_name], salt)
+        else:
+            chunk[raw] = sample_column(profile["columns"][table_name][column], rows[table_name], salt)
+    return pd.DataFrame(chunk)
+
+
+def generate_raw_extract(profile, visits, path, chunk_size=GENERATE_CHUNK_SIZE, seed=0):
+    """Write a raw extract of `visits` rows in the layout clean.py reads."""
+    sizes = dimension_sizes(profile, visits)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for start in range(0, visits, chunk_size):
+            chunk = generate_chunk(profile, sizes, start, min(start + chunk_size, visits), seed)
+            chunk.to_csv(f, index=False, header=start == 0)
+    return sizes
+
+
+# --- One scale ---
+
+def reset_peak_rss():
+    """Start a new peak-RSS window; only Linux can reset it, so elsewhere this returns False."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak RSS since the last reset_peak_rss() (VmHWM)."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 2**10, 1)
+    return None
+
+
+def run_scale(visits, workdir, profile, repeat=REPEAT, seed=0):
+    """Generate, clean and query one scale inside `workdir`; returns per-stage timings."""
+    os.chdir(workdir)
+    os.environ["db_backend"] = "duckdb"
+
+    # Imported here so the embedded backend is the one picked up and reads this scale's files
+    import aggregations
+    import kpis
+    from clean import clean
+    from datamart import DATA_MART_QUERIES
+    from db import run_query
+    from star_engine import get_star_engine
+
+    stages = {}
+
+    def timed(stage, fn, runs=1):
+        # Without a reset the peak would be the process-wide maximum so far, not this stage's
+        measured = reset_peak_rss()
+        best = float("inf")
+        for _ in range(runs):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        stages[stage] = {
+            "seconds": round(best, 6),
+            "rows_per_second": round(visits / best) if best else None,
+            "peak_rss_mb": peak_rss_mb() if measured else None,
+        }
+        print(f"⏱️ {visits:,} visits | {stage}: {best:.3f}s")
+
+    timed("generate", lambda: generate_raw_extract(profile, visits, "raw.csv", seed=seed))
+    timed("clean", lambda: clean("raw.csv"))
+    os.remove("raw.csv")
+
+    timed("star_engine_load", lambda: get_star_engine(reload=True))
+    # Reads of the mart views the embedded backend defines over the star schema
+    for mart_name in DATA_MART_QUERIES:
+        timed(f"mart:{mart_name}", lambda: run_query(f"SELECT * FROM {mart_name}"), repeat)
+    for name in KPI_QUERIES:
+        timed(f"kpi:{name[len('get_'):]}", getattr(kpis, name), repeat)
+    for name, query in aggregations.QUERIES.items():
+        timed(f"aggregation:{name}", lambda: aggregations.run_query(query), repeat)
+    for engine in ("sql", "numpy"):
+        timed(f"aggregations:{engine}", lambda: aggregations.run_aggregations(engine=engine), repeat)
+        timed(f"kpi_snapshot:{engine}", lambda: kpis.compute_kpi_snapshot(engine), repeat)
+    return stages
+
+
+# --- History and regressions ---
+
+def load_history(path=BENCHMARK_HISTORY):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(history, path=BENCHMARK_HISTORY):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(history, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def find_regressions(run, history):
+    """Stages of `run` that got slower or bigger than in the latest earlier run at the same scale."""
+    regressions = []
+    for scale, stages in run["scales"].items():
+        previous = next((r["scales"][scale] for r in reversed(history) if scale in r["scales"]), None)
+        if previous is None:
+            continue
+        for stage, result in stages.items():
+            before = previous.get(stage)
+            if before is None:
+                continue
+            slower = result["seconds"] - before["seconds"]
+            if slower > REGRESSION_MIN_SECONDS and slower > REGRESSION_THRESHOLD * before["seconds"]:
+                regressions.append(
+                    f"{int(scale):,} visits | {stage}: {before['seconds']:.3f}s -> {result['seconds']:.3f}s"
+                )
+            if result["peak_rss_mb"] and before["peak_rss_mb"] and (
+                    result["peak_rss_mb"] > (1 + RSS_REGRESSION_THRESHOLD) * before["peak_rss_mb"]):
+                regressions.append(
+                    f"{int(scale):,} visits | {stage}: peak RSS "
+                    f"{before['peak_rss_mb']:.0f} MB -> {result['peak_rss_mb']:.0f} MB"
+                )
+    return regressions
+
+
+def run_benchmark(scales, repeat=REPEAT, seed=0, keep=False, history_path=BENCHMARK_HISTORY):
+    profile = profile_tables()
+    run = {
+        "run_at": datetime.now().replace(microsecond=0).isoformat(),
+        "revision": git_revision(),
+        "repeat": repeat,
+        "scales": {},
+    }
+
+    for visits in scales:
+        workdir = tempfile.mkdtemp(prefix=f"benchmark_{visits}_")
+        try:
+            with open(os.path.join(workdir, "profile.json"), "w") as f:
+                json.dump(profile, f)
+            # A fresh process per scale: peak RSS, caches and the embedded database start empty
+            subprocess.run([
+                sys.executable, os.path.abspath(__file__), "--run-scale", str(visits),
+                "--workdir", workdir, "--repeat", str(repeat), "--seed", str(seed),
+            ], check=True)
+            with open(os.path.join(workdir, "stages.json")) as f:
+                run["scales"][str(visits)] = json.load(f)
+        finally:
+            if keep:
+                print(f"📁 Kept {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    history = load_history(history_path)
+    regressions = find_regressions(run, history)
+    run["regressions"] = regressions
+    save_history(history + [run], history_path)
+    return run, regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the pipeline on synthetic star schemas of growing size.")
+    parser.add_argument("scales", nargs="*", type=parse_scale, default=[parse_scale(s) for s in DEFAULT_SCALES],
+                        help=f"visits per scale, e.g. 10k 1M 100M (default {' '.join(DEFAULT_SCALES)})")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs per query (best is kept)")
+    parser.add_argument("--seed", type=int, default=0, help="changes every generated value")
+    parser.add_argument("--history", default=BENCHMARK_HISTORY, help="JSON file the runs are appended to")
+    parser.add_argument("--keep", action="store_true", help="keep each scale's generated files")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on regressions")
+    parser.add_argument("--run-scale", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scale:
+        with open(os.path.join(args.workdir, "profile.json")) as f:
+            profile = json.load(f)
+        stages = run_scale(args.run_scale, args.workdir, profile, repeat=args.repeat, seed=args.seed)
+        with open(os.path.join(args.workdir, "stages.json"), "w") as f:
+            json.dump(stages, f)
+        sys.exit()
+
+    run, regressions = run_benchmark(args.scales, repeat=args.repeat, seed=args.seed, keep=args.keep,
+                                     history_path=args.history)
+
+    report = pd.DataFrame([
+        {"visits": int(scale), "stage": stage, **result}
+        for scale, stages in run["scales"].items() for stage, result in stages.items()
+    ])
+    print("\n📊 Benchmark results:")
+    print(report.to_string(index=False))
+
+    if regressions:
+        print(f"\n🐢 {len(regressions)} regressions since the previous run:")
+        for regression in regressions:
+            print(f"  {regression}")
+        if args.fail_on_regression:
+            sys.exit(1)
+    else:
+        print("\n✅ No regressions since the previous run")
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import time
+
+from instrumentation import counted
+
+# Rows per INSERT batch when LOAD DATA LOCAL INFILE is unavailable
+DEFAULT_BATCH_SIZE = 10_000
+
+
+def _write_infile(df, path, batch_size):
+    # Missing values are written as empty fields and turned back into NULL by NULLIF below
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for start in range(0, len(df), batch_size):
+            df.iloc[start:start + batch_size].to_csv(
+                f, index=False, header=False, na_rep="",
+                doublequote=False, escapechar="\\", lineterminator="\n"
+            )
+
+
+def _load_infile(cursor, df, table_name, batch_size):
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        _write_infile(df, path, batch_size)
+        variables = ", ".join(f"@v{i}" for i in range(len(df.columns)))
+        assignments = ", ".join(f"`{column}` = NULLIF(@v{i}, '')" for i, column in enumerate(df.columns))
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE `{table_name}` "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '\\\\' "
+            f"LINES TERMINATED BY '\\n' ({variables}) SET {assignments}"
+        )
+    finally:
+        os.remove(path)
+
+
+def _load_batches(cursor, df, table_name, batch_size):
+    columns = ", ".join(f"`{column}`" for column in df.columns)
+    placeholders = ", ".join(["%s"] * len(df.columns))
+    insert_query = f"INSERT INTO `{table_name}` ({columns}) VALUES ({placeholders})"
+
+    for start in range(0, len(df), batch_size):
+        batch = df.iloc[start:start + batch_size].astype(object)
+        batch = batch.where(batch.notna(), None)
+        cursor.executemany(insert_query, list(batch.itertuples(index=False, name=None)))
+
+
+def bulk_load(df, table_name, engine, batch_size=DEFAULT_BATCH_SIZE, use_infile=True):
+    """Append `df` to an existing table with LOAD DATA LOCAL INFILE, falling back to batched inserts.
+
+    Unique checks and foreign key checks are disabled for the duration of the load, so callers
+    are expected to have validated the rows already. (ALTER TABLE ... DISABLE KEYS is left out:
+    the tables are InnoDB, where it does nothing.)
+    """
+    start = time.perf_counter()
+    conn = counted(engine.raw_connection())
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET unique_checks = 0")
+        cursor.execute("SET foreign_key_checks = 0")
+        try:
+            method = "LOAD DATA"
+            try:
+                if not use_infile:
+                    raise RuntimeError("LOAD DATA LOCAL INFILE disabled")
+                _load_infile(cursor, df, table_name, batch_size)
+            except (RuntimeError, engine.dialect.dbapi.Error) as e:
+                print(f"⚠️ LOAD DATA unavailable for {table_name} ({e}); using batched inserts")
+                conn.rollback()
+                method = "batched INSERT"
+                _load_batches(cursor, df, table_name, batch_size)
+        finally:
+            cursor.execute("SET foreign_key_checks = 1")
+            cursor.execute("SET unique_checks = 1")
+        conn.commit()
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"⚡ {len(df):,} rows into {table_name} via {method} in {elapsed:.2f}s "
+          f"({len(df) / max(elapsed, 1e-9):,.0f} rows/sec)")
+    return len(df)
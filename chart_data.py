@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+from query_cache import cached_query
+
+# Every dashboard chart declares the aggregate it plots; the aggregate is computed in SQL so only
+# a handful of rows (one per bin, category or top-N entry) leave the database, whatever the mart size.
+#   histogram: `bins` equal-width bins of `column`
+#   counts:    rows per value of `column`
+#   top_n:     `agg` of `value` per `label`, largest `n` first. The mart charts use AVG: seaborn's
+#              barplot drew the mean of the rows sharing a label before the aggregate moved to SQL.
+CHARTS = {
+    "patient_age_histogram": {"kind": "histogram", "table": "patient_data_mart", "column": "age", "bins": 20},
+    "top_diseases": {
+        "kind": "top_n", "table": "disease_data_mart", "label": "disease_name", "value": "total_cases", "n": 10,
+    },
+    "top_specializations": {
+        "kind": "top_n", "table": "doctor_data_mart", "label": "specialization", "value": "total_patients_seen",
+        "n": 10,
+    },
+    "hospital_revenue": {
+        "kind": "top_n", "table": "hospital_data_mart", "label": "hospital_name", "value": "total_revenue", "n": 20,
+        "agg": "AVG",
+    },
+    "hospital_visits": {
+        "kind": "top_n", "table": "hospital_data_mart", "label": "hospital_name", "value": "total_visits", "n": 20,
+        "agg": "AVG",
+    },
+    "hospital_types": {"kind": "counts", "table": "hospital_data_mart", "column": "type"},
+    "billing_by_payment_method": {
+        "kind": "top_n", "table": "billing_data_mart", "label": "payment_method", "value": "total_billed", "n": 20,
+        "agg": "AVG",
+    },
+    "payment_methods": {"kind": "counts", "table": "billing_data_mart", "column": "payment_method"},
+    "claim_statuses": {"kind": "counts", "table": "billing_data_mart", "column": "claim_status"},
+}
+
+
+def histogram(table, column, bins):
+    """Counts per equal-width bin of `column`, as (bin_start, bin_end, count) rows."""
+    bounds = cached_query(f"SELECT MIN({column}) AS lo, MAX({column}) AS hi FROM {table}")
+    lo, hi = bounds["lo"][0], bounds["hi"][0]
+    if lo is None or pd.isna(lo):
+        return pd.DataFrame(columns=["bin_start", "bin_end", "count"])
+    lo, hi = float(lo), float(hi)
+    width = (hi - lo) / bins or 1.0
+
+    # The maximum falls in the last bin rather than one of its own
+    counts = cached_query(f"""
+        SELECT LEAST(FLOOR(({column} - %s) / %s), %s) AS bin, COUNT(*) AS count
+        FROM {table}
+        WHERE {column} IS NOT NULL
+        GROUP BY bin
+    """, (lo, width, bins - 1))
+    full = np.zeros(bins, dtype="int64")
+    if not counts.empty:
+        full[counts["bin"].astype(int).to_numpy()] = counts["count"].astype("int64").to_numpy()
+    edges = lo + width * np.arange(bins + 1)
+    return pd.DataFrame({"bin_start": edges[:-1], "bin_end": edges[1:], "count": full})
+
+
+def counts(table, column):
+    """Rows per value of `column`, most common first; NULLs are left out."""
+    return cached_query(f"""
+        SELECT {column}, COUNT(*) AS count
+        FROM {table}
+        WHERE {column} IS NOT NULL
+        GROUP BY {column}
+        ORDER BY count DESC
+    """)
+
+
+def top_n(table, label, value, n, agg="SUM"):
+    """The `n` labels with the largest aggregated `value`, largest first."""
+    df = cached_query(f"""
+        SELECT {label}, {agg}({value}) AS {value}
+        FROM {table}
+        GROUP BY {label}
+        ORDER BY {value} DESC
+        LIMIT {int(n)}
+    """)
+    # MySQL returns SUM()/AVG() of DECIMAL columns as Decimal objects; plot them as floats
+    if not df.empty:
+        df[value] = pd.to_numeric(df[value])
+    return df
+
+
+CHART_KINDS = {"histogram": histogram, "counts": counts, "top_n": top_n}
+
+
+def chart_data(chart_id):
+    """The pre-aggregated rows behind a registered chart."""
+    spec = dict(CHARTS[chart_id])
+    return CHART_KINDS[spec.pop("kind")](**spec)
@@ -1,70 +1,291 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+from collections import Counter
+
+import numpy as np
 import pandas as pd
 
-# Load data
-df = pd.read_csv(".data/complete_healthcare(1)_data.csv")
-
-# Check for missing values
-print("🔍 Missing values before cleaning:")
-print(df.isna().sum())
-
-# Fill missing values
-df["alcohol_consumption"].fillna(df["alcohol_consumption"].mode()[0], inplace=True)
-df["exercise_frequency"].fillna(df["exercise_frequency"].mode()[0], inplace=True)
-
-# Drop full duplicate rows (if any)
-df.drop_duplicates(inplace=True)
-
-# Print missing values after cleaning
-print("✅ Missing values after cleaning:")
-print(df.isna().sum())
-
-# ✅ Create Fact Table (Only Numeric + Foreign Keys)
-hospital_visits_fact = df[[
-    "visit_id", "patient_id_x", "disease_id", "billing_id", "visit_date",
-    "hospital_id", "doctor_id", "total_bill_x"
-]].rename(columns={
-    "patient_id_x": "patient_id",
-    "total_bill_x": "total_bill"
-})
-
-# ✅ Create Patient Dimension (Remove Duplicates)
-patient_dim = df[[
-    "patient_id_y", "name", "age", "gender", "location", "blood_type",
-    "weight", "height", "smoker_status", "alcohol_consumption", "exercise_frequency"
-]].drop_duplicates(subset=["patient_id_y"], keep="first").rename(columns={"patient_id_y": "patient_id"})
-
-# ✅ Check for duplicate patient IDs before exporting
-duplicate_patients = patient_dim[patient_dim.duplicated(subset=["patient_id"], keep=False)]
-if not duplicate_patients.empty:
-    print("⚠️ Duplicate patient_id found! Investigate before proceeding.")
-    print(duplicate_patients)
-else:
-    print("✅ No duplicate patient IDs found.")
-
-# ✅ Create Disease Dimension
-disease_dim = df[["disease_id", "disease_name", "category", "severity_level"]].drop_duplicates()
-
-# ✅ Create Doctor Dimension
-doctor_dim = df[["doctor_id", "doctor_name", "specialization", "years_of_experience"]].drop_duplicates()
-
-# ✅ Create Hospital Dimension
-hospital_dim = df[["hospital_id", "hospital_name", "city", "type"]].drop_duplicates()
-
-# ✅ Create Billing Dimension
-billing_dim = df[[
-    "billing_id", "total_bill_y", "insurance_type_y", "claim_status_y", "payment_method"
-]].drop_duplicates().rename(columns={
-    "total_bill_y": "total_bill",
-    "insurance_type_y": "insurance_type",
-    "claim_status_y": "claim_status"
-})
-
-# ✅ Save Cleaned Tables as CSV
-hospital_visits_fact.to_csv("cleaned_hospital_visits_fact.csv", index=False)
-patient_dim.to_csv("cleaned_patient_dim.csv", index=False)
-disease_dim.to_csv("cleaned_disease_dim.csv", index=False)
-doctor_dim.to_csv("cleaned_doctor_dim.csv", index=False)
-hospital_dim.to_csv("cleaned_hospital_dim.csv", index=False)
-billing_dim.to_csv("cleaned_billing_dim.csv", index=False)
-
-print("🚀 Fact and Dimension tables created successfully with optimized schema!")
\ No newline at end of file
+from instrumentation import add_bytes_read, span
+from schema import STAR_SCHEMA
+from storage import TableWriter
+
+RAW_DATA_PATH = ".data/complete_healthcare(1)_data.csv"
+
+# Number of raw rows held in memory at once when no memory budget is given
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Dimension rows that reuse a key with different attributes are written here, one CSV per table
+CONFLICTS_DIR = "conflicts"
+
+# Columns whose missing values are filled with the column mode
+MODE_FILL_COLUMNS = ["alcohol_consumption", "exercise_frequency"]
+
+# Output tables (see schema.STAR_SCHEMA): raw columns to keep, renames, and the raw primary key column
+# (None = keep every row). Dimensions keep the first version of each key; later rows carrying the same
+# key with different attributes are reported as conflicts rather than written as extra rows.
+OUTPUT_TABLES = {
+    "hospital_visits_fact": {
+        "columns": [
+            "visit_id", "patient_id_x", "disease_id", "billing_id", "visit_date",
+            "hospital_id", "doctor_id", "total_bill_x"
+        ],
+        "rename": {"patient_id_x": "patient_id", "total_bill_x": "total_bill"},
+        "key": None,
+    },
+    "patient_dim": {
+        "columns": [
+            "patient_id_y", "name", "age", "gender", "location", "blood_type",
+            "weight", "height", "smoker_status", "alcohol_consumption", "exercise_frequency"
+        ],
+        "rename": {"patient_id_y": "patient_id"},
+        "key": "patient_id_y",
+    },
+    "disease_dim": {
+        "columns": ["disease_id", "disease_name", "category", "severity_level"],
+        "rename": {},
+        "key": "disease_id",
+    },
+    "doctor_dim": {
+        "columns": ["doctor_id", "doctor_name", "specialization", "years_of_experience"],
+        "rename": {},
+        "key": "doctor_id",
+    },
+    "hospital_dim": {
+        "columns": ["hospital_id", "hospital_name", "city", "type"],
+        "rename": {},
+        "key": "hospital_id",
+    },
+    "billing_dim": {
+        "columns": ["billing_id", "total_bill_y", "insurance_type_y", "claim_status_y", "payment_method"],
+        "rename": {
+            "total_bill_y": "total_bill",
+            "insurance_type_y": "insurance_type",
+            "claim_status_y": "claim_status"
+        },
+        "key": "billing_id",
+    },
+}
+
+# pandas dtype of each logical column type (see schema.STAR_SCHEMA) when reading the raw extract.
+# Left to inference, an integer column with a missing value in one chunk comes back as float there,
+# and its rows no longer hash (or print) like the same rows in other chunks.
+RAW_DTYPES_BY_TYPE = {
+    "uuid": "str",
+    "category": "str",
+    "string": "str",
+    "int": "Int64",
+    "float": "float64",
+    "date": "str",
+}
+
+# Raw column -> pandas dtype, for every raw column an output table keeps
+RAW_DTYPES = {
+    column: RAW_DTYPES_BY_TYPE[STAR_SCHEMA[table_name][spec["rename"].get(column, column)]]
+    for table_name, spec in OUTPUT_TABLES.items()
+    for column in spec["columns"]
+}
+
+
+class HashIndex:
+    """On-disk set of 64-bit row hashes, kept in SQLite so it never has to fit in RAM.
+
+    Each hash can carry a second hash, the version, so a key seen again with different
+    attributes can be told apart from a plain repeat.
+    """
+
+    def __init__(self, path, cache_mb=64):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(f"PRAGMA cache_size = -{int(cache_mb * 1024)}")
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen (ns TEXT, h INTEGER, v INTEGER, PRIMARY KEY (ns, h)) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE TEMP TABLE batch (pos INTEGER PRIMARY KEY, h INTEGER, v INTEGER)")
+
+    def _merge(self, ns, positions, hashes, versions):
+        """Add the batch to `ns`; return {position: stored version} for the hashes already there."""
+        self.conn.execute("DELETE FROM batch")
+        self.conn.executemany(
+            "INSERT INTO batch VALUES (?, ?, ?)",
+            zip(positions.tolist(), hashes.tolist(), versions)
+        )
+        known = dict(self.conn.execute(
+            "SELECT b.pos, s.v FROM batch b JOIN seen s ON s.ns = ? AND s.h = b.h", (ns,)
+        ))
+        self.conn.execute("INSERT OR IGNORE INTO seen SELECT ?, h, v FROM batch", (ns,))
+        return known
+
+    def first_seen(self, ns, hashes):
+        """Return a mask that is True for hashes not seen before in namespace `ns`."""
+        hashes = np.asarray(hashes, dtype=np.uint64).view(np.int64)
+        mask = ~pd.Series(hashes).duplicated().to_numpy()
+        positions = np.flatnonzero(mask)
+        known = self._merge(ns, positions, hashes[positions], [None] * len(positions))
+        mask[list(known)] = False
+        return mask
+
+    def first_version(self, ns, keys, versions):
+        """Return (new, conflicts) masks for rows identified by `keys` and described by `versions`.
+
+        `new` is True for the first row of each key not seen before in `ns`. `conflicts` is True for
+        rows whose version differs from the one kept for their key, the first seen.
+        """
+        keys = np.asarray(keys, dtype=np.uint64).view(np.int64)
+        versions = np.asarray(versions, dtype=np.uint64).view(np.int64)
+        new = ~pd.Series(keys).duplicated().to_numpy()
+        positions = np.flatnonzero(new)
+        known = self._merge(ns, positions, keys[positions], versions[positions].tolist())
+
+        kept = pd.Series(versions[positions], index=keys[positions])
+        if known:
+            known_positions = np.fromiter(known.keys(), dtype=np.int64, count=len(known))
+            kept.loc[keys[known_positions]] = np.fromiter(known.values(), dtype=np.int64, count=len(known))
+            new[known_positions] = False
+        conflicts = versions != kept.reindex(keys).to_numpy()
+        return new, conflicts
+
+    def close(self):
+        self.conn.close()
+
+
+def row_hashes(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def conflicts_path(table_name):
+    return os.path.join(CONFLICTS_DIR, f"{table_name}_conflicts.csv")
+
+
+def report_conflicts(rows, table_name):
+    os.makedirs(CONFLICTS_DIR, exist_ok=True)
+    path = conflicts_path(table_name)
+    rows.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+
+def estimate_chunk_size(path, memory_mb):
+    """Pick a chunk size so one chunk (plus the copies made while cleaning it) fits in `memory_mb`."""
+    sample = pd.read_csv(path, nrows=1_000, dtype=RAW_DTYPES)
+    bytes_per_row = max(sample.memory_usage(deep=True).sum() / max(len(sample), 1), 1)
+    # A chunk is copied roughly four times: fill, dedupe hashing and the six projections
+    return max(int(memory_mb * 2**20 / (bytes_per_row * 4)), 1_000)
+
+
+def compute_fill_values(path, chunksize):
+    """First pass: count missing values and compute the fill modes with streaming counters."""
+    missing = None
+    counters = {column: Counter() for column in MODE_FILL_COLUMNS}
+
+    with span("clean_fill_values", source=os.path.basename(path)) as s:
+        add_bytes_read(os.path.getsize(path))
+        s.rows_in = 0
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=RAW_DTYPES):
+            s.rows_in += len(chunk)
+            chunk_missing = chunk.isna().sum()
+            missing = chunk_missing if missing is None else missing.add(chunk_missing, fill_value=0)
+            for column in MODE_FILL_COLUMNS:
+                counters[column].update(chunk[column].dropna().value_counts().to_dict())
+
+    # Match Series.mode(): highest count wins, ties go to the smallest value
+    fill_values = {}
+    for column, counter in counters.items():
+        if not counter:
+            print(f"⚠️ {column} has no values to take a mode from; left unfilled")
+            continue
+        top = max(counter.values())
+        fill_values[column] = min(value for value, count in counter.items() if count == top)
+    return missing.astype(int), fill_values
+
+
+def clean(path=RAW_DATA_PATH, chunksize=DEFAULT_CHUNK_SIZE, index_cache_mb=64, tmp_dir=None,
+          formats=("csv", "parquet")):
+    """Stream the raw extract through cleaning and append each chunk to the six output tables."""
+    with span("clean", source=os.path.basename(path)) as s:
+        missing_before, fill_values = compute_fill_values(path, chunksize)
+
+        print("🔍 Missing values before cleaning:")
+        print(missing_before)
+
+        fd, index_path = tempfile.mkstemp(suffix=".sqlite", dir=tmp_dir)
+        os.close(fd)
+        index = HashIndex(index_path, cache_mb=index_cache_mb)
+        writers = {table_name: TableWriter(table_name, formats) for table_name in OUTPUT_TABLES}
+        missing_after = None
+        conflicts = Counter()
+        s.rows_in, s.rows_out = 0, 0
+
+        for table_name in OUTPUT_TABLES:
+            stale = conflicts_path(table_name)
+            if os.path.exists(stale):
+                os.remove(stale)
+
+        try:
+            add_bytes_read(os.path.getsize(path))
+            for chunk in pd.read_csv(path, chunksize=chunksize, dtype=RAW_DTYPES):
+                s.rows_in += len(chunk)
+
+                # Fill missing values
+                chunk = chunk.fillna(fill_values)
+
+                # Drop full duplicate rows, including duplicates of rows from earlier chunks
+                chunk = chunk[index.first_seen("__raw__", row_hashes(chunk))]
+
+                chunk_missing = chunk.isna().sum()
+                missing_after = chunk_missing if missing_after is None else missing_after.add(chunk_missing, fill_value=0)
+
+                # Every output table is cut from the same chunk; dimensions keep the first row of each key
+                for table_name, spec in OUTPUT_TABLES.items():
+                    key = spec["key"]
+                    if key is None:
+                        table = chunk[spec["columns"]]
+                    else:
+                        attributes = [column for column in spec["columns"] if column != key]
+                        new, conflicting = index.first_version(
+                            table_name, row_hashes(chunk[[key]]), row_hashes(chunk[attributes])
+                        )
+                        table = chunk.loc[new, spec["columns"]]
+                        if conflicting.any():
+                            # Each conflicting version is reported once, however many visits repeat it
+                            rows = chunk.loc[conflicting, spec["columns"]]
+                            rows = rows[index.first_seen(f"{table_name}__conflicts", row_hashes(rows))]
+                            report_conflicts(rows.rename(columns=spec["rename"]), table_name)
+                            conflicts[table_name] += len(rows)
+                    writers[table_name].write(table.rename(columns=spec["rename"]))
+                    s.rows_out += len(table)
+        finally:
+            for writer in writers.values():
+                writer.close()
+            index.close()
+            os.remove(index_path)
+
+    # Print missing values after cleaning
+    print("✅ Missing values after cleaning:")
+    print(missing_after.astype(int))
+
+    for table_name, count in conflicts.items():
+        print(f"⚠️ {table_name}: {count:,} conflicting versions of existing keys; "
+              f"first version kept, others written to {conflicts_path(table_name)}")
+
+    print("🚀 Fact and Dimension tables created successfully with optimized schema!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean the raw healthcare extract into star-schema tables.")
+    parser.add_argument("--input", default=RAW_DATA_PATH)
+    parser.add_argument("--chunksize", type=int, help=f"raw rows per chunk (default {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument("--memory-mb", type=int, help="approximate peak memory budget; derives --chunksize")
+    parser.add_argument("--index-cache-mb", type=int, default=64, help="memory for the on-disk dedupe index")
+    parser.add_argument("--tmp-dir", help="directory for the on-disk dedupe index")
+    parser.add_argument("--formats", default="csv,parquet", help="comma-separated output formats (csv, parquet)")
+    args = parser.parse_args()
+
+    chunksize = args.chunksize
+    if chunksize is None:
+        chunksize = estimate_chunk_size(args.input, args.memory_mb) if args.memory_mb else DEFAULT_CHUNK_SIZE
+
+    clean(
+        args.input, chunksize=chunksize, index_cache_mb=args.index_cache_mb, tmp_dir=args.tmp_dir,
+        formats=args.formats.split(",")
+    )
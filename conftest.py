@@ -0,0 +1,66 @@
+import os
+
+# The analytics run in-process over the cleaned files; no MySQL server is needed
+os.environ.setdefault("db_backend", "duckdb")
+
+import pandas as pd
+import pytest
+
+import clean
+import duckdb_backend
+import kpis
+import query_cache
+import star_engine
+
+
+def raw_extract(visits, patients):
+    """A raw extract whose visits cycle through `patients` patients, every attribute fixed per patient."""
+    rows = []
+    for i in range(visits):
+        p = i % patients
+        row = {column: f"{column}-{p}" for spec in clean.OUTPUT_TABLES.values() for column in spec["columns"]}
+        row.update({
+            "visit_id": f"visit-{i}",
+            "patient_id_x": f"patient-{p}",
+            "patient_id_y": f"patient-{p}",
+            "visit_date": f"2024-{i % 12 + 1:02d}-01",
+            "age": 20 + p % 50,
+            "weight": 70.5,
+            "height": 170.0,
+            "years_of_experience": 10,
+            "total_bill_x": 100.0,
+            "total_bill_y": 100.0,
+            "disease_id": "disease-1",
+            "disease_name": "Flu",
+            "category": "Respiratory",
+            "severity_level": "Low",
+            "doctor_id": "doctor-1",
+            "doctor_name": "Dr One",
+            "specialization": "GP",
+            "hospital_id": "hospital-1",
+            "hospital_name": "General",
+            "city": "Springfield",
+            "type": "Public",
+            "billing_id": f"billing-{i}",
+        })
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def warehouse(tmp_path, monkeypatch):
+    """Clean a raw extract into tmp_path and point the embedded database and engines at it."""
+    monkeypatch.chdir(tmp_path)
+
+    def build(raw, **kwargs):
+        raw.to_csv("raw.csv", index=False)
+        clean.clean("raw.csv", **kwargs)
+        # Drop everything built from a previous tree
+        monkeypatch.setattr(duckdb_backend, "_database", None)
+        monkeypatch.setattr(star_engine, "_engine", None)
+        monkeypatch.setattr(kpis, "_live", {"snapshot": None, "version": None, "expires_at": 0.0})
+        monkeypatch.setitem(query_cache._version, "value", None)
+        query_cache.clear_cache()
+        return tmp_path
+
+    return build
@@ -1,6 +1,17 @@
-import pandas as pd
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from sqlalchemy import create_engine
 
+from bulk_load import DEFAULT_BATCH_SIZE, bulk_load
+from instrumentation import counted, span
+from kpis import refresh_kpi_snapshot
+from storage import read_table
+from surrogate_keys import assign_surrogate_keys
+from watermarks import (
+    bump_data_version, dimension_watermark, ensure_data_version_table, ensure_watermark_table, set_watermark
+)
+
 # MySQL Database Connection Details
 DB_CONFIG = {
     "host": "localhost",
@@ -9,27 +20,105 @@ DB_CONFIG = {
     "database": "healthcare",
 }
 
-# Create SQLAlchemy engine using DB_CONFIG
-engine = create_engine(f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}")
+# Number of dimension tables loaded concurrently (one pooled connection each)
+MAX_WORKERS = 5
+
+# Create SQLAlchemy engine using DB_CONFIG (LOAD DATA LOCAL INFILE enabled for bulk loads)
+engine = create_engine(
+    f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}",
+    connect_args={"allow_local_infile": True},
+    pool_size=MAX_WORKERS,
+)
+
 
+# Load cleaned tables (Parquet when available, CSV otherwise)
+with span("read_dimensions") as s:
+    disease_dim = read_table("disease_dim")
+    doctor_dim = read_table("doctor_dim")
+    hospital_dim = read_table("hospital_dim")
+    billing_dim = read_table("billing_dim")
+    patient_dim = read_table("patient_dim")
+    s.rows_out = sum(map(len, [disease_dim, doctor_dim, hospital_dim, billing_dim, patient_dim]))
 
-# Load CSV files
-disease_dim = pd.read_csv("cleaned_disease_dim.csv")
-doctor_dim = pd.read_csv("cleaned_doctor_dim.csv")
-hospital_dim = pd.read_csv("cleaned_hospital_dim.csv")
-billing_dim = pd.read_csv("cleaned_billing_dim.csv")
-patient_dim=pd.read_csv("cleaned_patient_dim.csv")
-# Function to push DataFrame to MySQL
-def push_to_mysql(df, table_name):
-    df.to_sql(table_name, engine, if_exists="replace", index=False)
+DIMENSIONS = {
+    "disease_dim": disease_dim,
+    "doctor_dim": doctor_dim,
+    "hospital_dim": hospital_dim,
+    "billing_dim": billing_dim,
+    "patient_dim": patient_dim,
+}
+
+
+# Function to push DataFrame to MySQL: recreate the table from the frame's columns, then bulk load
+def push_to_mysql(df, table_name, batch_size=DEFAULT_BATCH_SIZE):
+    df.head(0).to_sql(table_name, engine, if_exists="replace", index=False)
+    bulk_load(df, table_name, engine, batch_size=batch_size)
     print(f"✅ Data pushed to {table_name}")
 
+
+def load_dimension(table_name, df):
+    start = time.perf_counter()
+    with span("dimension_push", rows_in=len(df), table=table_name) as s:
+        # Replace UUID keys with integer surrogate keys before loading
+        keyed = assign_surrogate_keys(df, table_name, engine)
+        push_to_mysql(keyed, table_name)
+        s.rows_out = len(keyed)
+    return time.perf_counter() - start
+
+
+# Function to push all dimension tables concurrently; the tables are independent of each other
+def load_dimensions(max_workers=MAX_WORKERS):
+    start = time.perf_counter()
+    timings = {}
+    failed = []
+
+    # Start the largest tables first so they never end up queued behind the small ones
+    ordered = sorted(DIMENSIONS.items(), key=lambda item: len(item[1]), reverse=True)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(load_dimension, name, df): name for name, df in ordered}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                timings[name] = future.result()
+                print(f"⏱️ {name} loaded in {timings[name]:.2f}s")
+            except Exception as e:
+                failed.append(name)
+                print(f"❌ Error loading {name}: {e}")
+
+    # Invalidate cached dashboard results (see query_cache.py), and record when each dimension
+    # was replaced so datamart.py rebuilds the marts built from it
+    if timings:
+        conn = counted(engine.raw_connection())
+        try:
+            cursor = conn.cursor()
+            ensure_data_version_table(cursor)
+            ensure_watermark_table(cursor)
+            cursor.execute("SELECT NOW(6)")
+            loaded_at = cursor.fetchone()[0]
+            for name in timings:
+                set_watermark(cursor, dimension_watermark(name), loaded_at)
+            bump_data_version(cursor)
+            conn.commit()
+        finally:
+            conn.close()
+
+    wall = time.perf_counter() - start
+    print(f"⏱️ Dimension refresh took {wall:.2f}s wall clock ({sum(timings.values()):.2f}s summed over tables)")
+    return timings, failed
+
+
 # Main function to execute
 if __name__ == "__main__":
-    push_to_mysql(disease_dim, "disease_dim")
-    push_to_mysql(doctor_dim, "doctor_dim")
-    push_to_mysql(hospital_dim, "hospital_dim")
-    push_to_mysql(billing_dim, "billing_dim")
-    push_to_mysql(patient_dim, "patient_dim")
+    timings, failed = load_dimensions()
+
+    # The KPIs are labelled with dimension attributes (names, genders, insurance types, ...), so
+    # the stored snapshot is recomputed against the new rows, as after a fact load
+    if timings:
+        try:
+            refresh_kpi_snapshot()
+        except Exception as e:
+            # On a first load the fact table doesn't exist yet; fact_table.py refreshes it then
+            print(f"⚠️ KPI snapshot not refreshed: {e}")
 
-    print("🎉 All dimension tables successfully loaded into MySQL!")
\ No newline at end of file
+    if not failed:
+        print("🎉 All dimension tables successfully loaded into MySQL!")
\ No newline at end of file
@@ -1,5 +1,16 @@
+import argparse
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
 import pymysql
 
+from instrumentation import counted, span
+from watermarks import (
+    KEY_CHANGES_TABLE, bump_data_version, dimension_watermark, ensure_data_version_table,
+    ensure_key_changes_table, ensure_watermark_table, get_watermark, set_watermark
+)
+
 # Database connection details
 DB_CONFIG = {
     "host": "localhost",
@@ -8,12 +19,14 @@ DB_CONFIG = {
     "database": "healthcare",
 }
 
-# Data mart creation queries
+# Data mart queries. {where} is empty for a full build and restricts the build to the keys
+# touched by newly loaded or corrected visits for an incremental refresh. Each mart keeps the
+# dimension's UUID next to its integer surrogate key.
 DATA_MART_QUERIES = {
     "patient_data_mart": """
-        CREATE TABLE IF NOT EXISTS patient_data_mart AS
         SELECT 
             p.patient_id,
+            p.patient_uuid,
             p.name,
             p.age,
             p.gender,
@@ -28,13 +41,14 @@ DATA_MART_QUERIES = {
             SUM(hf.total_bill) AS total_spent
         FROM patient_dim p
         LEFT JOIN hospital_visits_fact hf ON p.patient_id = hf.patient_id
-        GROUP BY p.patient_id;
+        {where}
+        GROUP BY p.patient_id, p.patient_uuid
     """,
 
     "disease_data_mart": """
-        CREATE TABLE IF NOT EXISTS disease_data_mart AS
         SELECT 
             d.disease_id,
+            d.disease_uuid,
             d.disease_name,
             d.category,
             d.severity_level,
@@ -42,13 +56,14 @@ DATA_MART_QUERIES = {
             SUM(hf.total_bill) AS total_revenue
         FROM disease_dim d
         LEFT JOIN hospital_visits_fact hf ON d.disease_id = hf.disease_id
-        GROUP BY d.disease_id;
+        {where}
+        GROUP BY d.disease_id, d.disease_uuid
     """,
 
     "doctor_data_mart": """
-        CREATE TABLE IF NOT EXISTS doctor_data_mart AS
         SELECT 
             doc.doctor_id,
+            doc.doctor_uuid,
             doc.doctor_name,
             doc.specialization,
             doc.years_of_experience,
@@ -56,13 +71,14 @@ DATA_MART_QUERIES = {
             SUM(hf.total_bill) AS total_revenue_generated
         FROM doctor_dim doc
         LEFT JOIN hospital_visits_fact hf ON doc.doctor_id = hf.doctor_id
-        GROUP BY doc.doctor_id;
+        {where}
+        GROUP BY doc.doctor_id, doc.doctor_uuid
     """,
 
     "hospital_data_mart": """
-        CREATE TABLE IF NOT EXISTS hospital_data_mart AS
         SELECT 
             h.hospital_id,
+            h.hospital_uuid,
             h.hospital_name,
             h.city,
             h.type,
@@ -70,13 +86,14 @@ DATA_MART_QUERIES = {
             SUM(hf.total_bill) AS total_revenue
         FROM hospital_dim h
         LEFT JOIN hospital_visits_fact hf ON h.hospital_id = hf.hospital_id
-        GROUP BY h.hospital_id;
+        {where}
+        GROUP BY h.hospital_id, h.hospital_uuid
     """,
 
     "billing_data_mart": """
-        CREATE TABLE IF NOT EXISTS billing_data_mart AS
         SELECT 
             b.billing_id,
+            b.billing_uuid,
             b.insurance_type,
             b.claim_status,
             b.payment_method,
@@ -84,33 +101,233 @@ DATA_MART_QUERIES = {
             SUM(hf.total_bill) AS total_billed
         FROM billing_dim b
         LEFT JOIN hospital_visits_fact hf ON b.billing_id = hf.billing_id
-        GROUP BY b.billing_id;
+        {where}
+        GROUP BY b.billing_id, b.billing_uuid
     """
 }
 
 
-def create_data_marts():
-    """Connects to MySQL and executes queries to create data marts."""
+# Dimension table each data mart summarises; a mart is rebuilt after its dimension is reloaded
+MART_DIMENSIONS = {
+    "patient_data_mart": "patient_dim",
+    "disease_data_mart": "disease_dim",
+    "doctor_data_mart": "doctor_dim",
+    "hospital_data_mart": "hospital_dim",
+    "billing_data_mart": "billing_dim",
+}
+
+# Key column of each data mart and the alias of the dimension it summarises
+MART_KEYS = {
+    "patient_data_mart": ("p", "patient_id"),
+    "disease_data_mart": ("d", "disease_id"),
+    "doctor_data_mart": ("doc", "doctor_id"),
+    "hospital_data_mart": ("h", "hospital_id"),
+    "billing_data_mart": ("b", "billing_id"),
+}
+
+# Marts that must be built before each mart. The current marts only read the fact and
+# dimension tables, so they are independent; a mart built from another mart lists it here.
+MART_DEPENDENCIES = {mart_name: () for mart_name in DATA_MART_QUERIES}
+
+# Marts built concurrently, each on its own connection
+MAX_WORKERS = 3
+
+# Extra attempts for a failed mart, and the base delay between them in seconds
+MAX_RETRIES = 2
+RETRY_DELAY = 5
+
+
+def mart_exists(cursor, mart_name):
+    cursor.execute("SHOW TABLES LIKE %s", (mart_name,))
+    return cursor.fetchone() is not None
+
+
+def build_mart(cursor, mart_name):
+    """Build a data mart from scratch into a shadow table, then swap it in atomically."""
+    _, key = MART_KEYS[mart_name]
+    shadow, old = f"{mart_name}__shadow", f"{mart_name}__old"
+    cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+    cursor.execute(
+        f"CREATE TABLE {shadow} (PRIMARY KEY ({key})) AS "
+        + DATA_MART_QUERIES[mart_name].format(where="")
+    )
+    rows = cursor.rowcount
+
+    # Readers see either the old mart or the new one, never a half-built table
+    if mart_exists(cursor, mart_name):
+        cursor.execute(f"DROP TABLE IF EXISTS {old}")
+        cursor.execute(f"RENAME TABLE {mart_name} TO {old}, {shadow} TO {mart_name}")
+        cursor.execute(f"DROP TABLE {old}")
+    else:
+        cursor.execute(f"RENAME TABLE {shadow} TO {mart_name}")
+    return rows
+
+
+def refresh_mart(cursor, mart_name, since, until):
+    """Recompute only the mart rows whose key gained or lost visits in (since, until] and upsert them."""
+    alias, key = MART_KEYS[mart_name]
+    cursor.execute(f"SHOW COLUMNS FROM {mart_name}")
+    columns = [row[0] for row in cursor.fetchall()]
+    updates = ", ".join(f"{column} = VALUES({column})" for column in columns if column != key)
+
+    # Keys of the visits loaded since the last refresh, and the keys corrections took visits away from
+    where = (
+        f"WHERE {alias}.{key} IN ("
+        f"SELECT {key} FROM hospital_visits_fact WHERE loaded_at > %s AND loaded_at <= %s "
+        f"UNION SELECT {key} FROM {KEY_CHANGES_TABLE} WHERE changed_at > %s AND changed_at <= %s)"
+    )
+    cursor.execute(
+        f"INSERT INTO {mart_name} "
+        + DATA_MART_QUERIES[mart_name].format(where=where)
+        + f" ON DUPLICATE KEY UPDATE {updates}",
+        (since, until, since, until)
+    )
+    return cursor.rowcount
+
+
+def process_mart(mart_name, until, rebuild=False):
+    """Build or refresh one data mart on its own connection, retrying failed attempts."""
+    watermark_name = f"mart:{mart_name}"
+    # Load time of the dimension rows the mart was last built from
+    dimension_name = f"{watermark_name}:dimension"
+
+    for attempt in range(1, MAX_RETRIES + 2):
+        start = time.perf_counter()
+        conn = counted(pymysql.connect(**DB_CONFIG))
+        try:
+            with span("mart_build", mart=mart_name) as s:
+                cursor = conn.cursor()
+                since, _ = get_watermark(cursor, watermark_name)
+                # Dimension loads replace the whole table, so any row may have new attributes or be new
+                dimension_loaded, _ = get_watermark(cursor, dimension_watermark(MART_DIMENSIONS[mart_name]))
+                built_from, _ = get_watermark(cursor, dimension_name)
+                dimension_changed = dimension_loaded is not None and (
+                    built_from is None or dimension_loaded > built_from
+                )
+
+                if rebuild or since is None or dimension_changed or not mart_exists(cursor, mart_name):
+                    print(f"📌 Creating {mart_name}...")
+                    s.rows_out = build_mart(cursor, mart_name)
+                    print(f"✅ {mart_name} created successfully! ({s.rows_out:,} rows)")
+                elif until is None or until <= since:
+                    s.rows_out = 0
+                    print(f"✅ {mart_name} is up to date.")
+                else:
+                    print(f"🔄 Refreshing {mart_name} with visits loaded after {since}...")
+                    s.rows_out = refresh_mart(cursor, mart_name, since, until)
+                    print(f"✅ {mart_name} refreshed ({s.rows_out:,} rows affected)")
+
+                if until is not None:
+                    set_watermark(cursor, watermark_name, until)
+                if dimension_loaded is not None:
+                    set_watermark(cursor, dimension_name, dimension_loaded)
+                # Invalidate cached dashboard results (see query_cache.py)
+                bump_data_version(cursor)
+                conn.commit()
+            return time.perf_counter() - start
+
+        except pymysql.MySQLError as e:
+            conn.rollback()
+            if attempt > MAX_RETRIES:
+                raise
+            print(f"⚠️ {mart_name} failed (attempt {attempt}): {e}; retrying")
+            time.sleep(RETRY_DELAY * attempt)
+
+        finally:
+            conn.close()
+
+
+def prune_key_changes(until):
+    """Drop the fact key changes every mart has been refreshed past."""
+    conn = counted(pymysql.connect(**DB_CONFIG))
     try:
-        conn = pymysql.connect(**DB_CONFIG)
         cursor = conn.cursor()
+        cursor.execute(f"DELETE FROM {KEY_CHANGES_TABLE} WHERE changed_at <= %s", (until,))
+        conn.commit()
+    finally:
+        conn.close()
 
-        for mart_name, query in DATA_MART_QUERIES.items():
-            print(f"📌 Creating {mart_name}...")
-            cursor.execute(query)
-            print(f"✅ {mart_name} created successfully!")
 
-        conn.commit()
-        print("\n🎉 All data marts have been successfully created!")
+def run_schedule(tasks, dependencies, max_workers):
+    """Run `tasks` (name -> callable) on a thread pool, starting each once its dependencies succeeded."""
+    pending = dict(dependencies)
+    running = {}
+    timings, done, failed = {}, set(), set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for name, deps in list(pending.items()):
+                if any(dep in failed for dep in deps):
+                    print(f"⏭️ Skipping {name}: a dependency failed")
+                    failed.add(name)
+                    del pending[name]
+                elif all(dep in done for dep in deps):
+                    running[pool.submit(tasks[name])] = name
+                    del pending[name]
+
+            if not running:
+                # Whatever is left waits on a dependency that is not scheduled at all
+                failed.update(pending)
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    timings[name] = future.result()
+                    done.add(name)
+                    print(f"⏱️ {name} finished in {timings[name]:.2f}s")
+                except Exception as e:
+                    failed.add(name)
+                    print(f"❌ {name} failed: {e}")
+
+    return timings, failed
+
+
+def create_data_marts(rebuild=False, max_workers=MAX_WORKERS):
+    """Builds missing data marts or refreshes existing ones from new visits, in parallel."""
+    start = time.perf_counter()
+    try:
+        conn = counted(pymysql.connect(**DB_CONFIG))
+        try:
+            cursor = conn.cursor()
+            ensure_watermark_table(cursor)
+            ensure_data_version_table(cursor)
+            ensure_key_changes_table(cursor)
+
+            # Everything loaded up to this point is covered by this run. Fact loads stamp loaded_at
+            # and their key changes as the last statements of their insert transaction, which waits
+            # on the data-version row (see fact_table.push_to_mysql), so no load that commits later
+            # can add rows at or below this mark
+            cursor.execute("SELECT MAX(loaded_at) FROM hospital_visits_fact")
+            until = cursor.fetchone()[0]
+            conn.commit()
+        finally:
+            conn.close()
 
     except pymysql.MySQLError as e:
         print(f"❌ Database Error: {e}")
+        return {}, set(DATA_MART_QUERIES)
 
-    finally:
-        cursor.close()
-        conn.close()
+    tasks = {
+        mart_name: partial(process_mart, mart_name, until, rebuild) for mart_name in DATA_MART_QUERIES
+    }
+    timings, failed = run_schedule(tasks, MART_DEPENDENCIES, max_workers)
+
+    print(f"⏱️ Data marts took {time.perf_counter() - start:.2f}s wall clock "
+          f"({sum(timings.values()):.2f}s summed over marts)")
+    if not failed:
+        if until is not None:
+            prune_key_changes(until)
+        print("\n🎉 All data marts have been successfully created!")
+    return timings, failed
 
 
 # Run script
 if __name__ == "__main__":
-    create_data_marts()
+    parser = argparse.ArgumentParser(description="Build or incrementally refresh the data marts.")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild every mart from scratch")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="marts built concurrently")
+    args = parser.parse_args()
+
+    create_data_marts(rebuild=args.rebuild, max_workers=args.workers)
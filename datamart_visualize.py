@@ -1,41 +1,13 @@
 import streamlit as st
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sqlalchemy import create_engine, text
 
-# Database Connection
-DB_CONFIG = {
-    "host": "localhost",
-    "user": "root",
-    "password": "root",
-    "database": "healthcare",
-}
-
-engine = create_engine(f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}")
-
-# Function to fetch data
-def run_query(query):
-    with engine.connect() as connection:
-        result = connection.execute(text(query))
-        df = pd.DataFrame(result.fetchall(), columns=result.keys())
-    return df
-
-# Functions to fetch data marts
-def get_patient_data_mart():
-    return run_query("SELECT * FROM patient_data_mart")
-
-def get_disease_data_mart():
-    return run_query("SELECT * FROM disease_data_mart")
-
-def get_doctor_data_mart():
-    return run_query("SELECT * FROM doctor_data_mart")
-
-def get_hospital_data_mart():
-    return run_query("SELECT * FROM hospital_data_mart")
-
-def get_billing_data_mart():
-    return run_query("SELECT * FROM billing_data_mart")
+# Database Connection: charts and mart pages are aggregated or paged in SQL on the shared
+# connection pool (see db.py), through an in-process result cache (see query_cache.py)
+from chart_data import chart_data
+# Charts are rendered once per data version and served as cached images (see figure_cache.py)
+from figure_cache import show_figure
+from mart_browser import render_mart_browser
 
 # Streamlit App
 st.set_page_config(page_title="Healthcare Data Marts", layout="wide")
@@ -48,68 +20,77 @@ menu = st.sidebar.radio("Select a Data Mart",
 st.title("Healthcare Data Marts")
 
 if menu == "Patient Data Mart":
-    df = get_patient_data_mart()
     st.subheader("Patient Data Mart")
-    st.dataframe(df)
+    render_mart_browser("patient_data_mart")
 
-    # Visualization: Age Distribution
+    # Visualization: Age Distribution (binned in SQL)
     st.subheader("Patient Age Distribution")
-    fig, ax = plt.subplots()
-    sns.histplot(df["age"], bins=20, kde=True, ax=ax)
-    ax.set_xlabel("Age")
-    ax.set_ylabel("Frequency")
-    st.pyplot(fig)
+    def draw():
+        bins = chart_data("patient_age_histogram")
+        fig, ax = plt.subplots()
+        sns.histplot(
+            x=(bins["bin_start"] + bins["bin_end"]) / 2, weights=bins["count"],
+            bins=list(bins["bin_start"]) + list(bins["bin_end"][-1:]), kde=True, ax=ax
+        )
+        ax.set_xlabel("Age")
+        ax.set_ylabel("Frequency")
+        return fig
+    show_figure("patient_age_histogram", draw)
 
 elif menu == "Disease Data Mart":
-    df = get_disease_data_mart()
     st.subheader("Disease Data Mart")
-    st.dataframe(df)
+    render_mart_browser("disease_data_mart")
 
     # Visualization: Disease Cases
     st.subheader("Most Common Diseases")
-    disease_counts = df.set_index("disease_name")["total_cases"].sort_values(ascending=False)
-    fig, ax = plt.subplots()
-    disease_counts.head(10).plot(kind="bar", color="lightblue", ax=ax)
-    ax.set_ylabel("Total Cases")
-    st.pyplot(fig)
+    def draw():
+        disease_counts = chart_data("top_diseases").set_index("disease_name")["total_cases"]
+        fig, ax = plt.subplots()
+        disease_counts.plot(kind="bar", color="lightblue", ax=ax)
+        ax.set_ylabel("Total Cases")
+        return fig
+    show_figure("top_diseases", draw)
 
 elif menu == "Doctor Data Mart":
-    df = get_doctor_data_mart()
     st.subheader("Doctor Data Mart")
-    st.dataframe(df)
+    render_mart_browser("doctor_data_mart")
 
     # Visualization: Specialization Distribution
     st.subheader("Top Specializations by Patients Seen")
-    specialization_counts = df.groupby("specialization")["total_patients_seen"].sum().sort_values(ascending=False)
-    fig, ax = plt.subplots()
-    specialization_counts.head(10).plot(kind="bar", color="orange", ax=ax)
-    ax.set_ylabel("Patients Seen")
-    st.pyplot(fig)
+    def draw():
+        specialization_counts = chart_data("top_specializations").set_index("specialization")["total_patients_seen"]
+        fig, ax = plt.subplots()
+        specialization_counts.plot(kind="bar", color="orange", ax=ax)
+        ax.set_ylabel("Patients Seen")
+        return fig
+    show_figure("top_specializations", draw)
 
 elif menu == "Hospital Data Mart":
-    df = get_hospital_data_mart()
     st.subheader("Hospital Data Mart")
-    st.dataframe(df)
+    render_mart_browser("hospital_data_mart")
 
     # Visualization: Hospital Type Distribution
     st.subheader("Hospital Type Distribution")
-    hospital_counts = df["type"].value_counts()
-    fig, ax = plt.subplots()
-    hospital_counts.plot(kind="pie", autopct='%1.1f%%', colors=sns.color_palette("pastel"), ax=ax)
-    st.pyplot(fig)
+    def draw():
+        hospital_counts = chart_data("hospital_types").set_index("type")["count"]
+        fig, ax = plt.subplots()
+        hospital_counts.plot(kind="pie", autopct='%1.1f%%', colors=sns.color_palette("pastel"), ax=ax)
+        return fig
+    show_figure("hospital_types", draw)
 
 elif menu == "Billing Data Mart":
-    df = get_billing_data_mart()
     st.subheader("Billing Data Mart")
-    st.dataframe(df)
+    render_mart_browser("billing_data_mart")
 
     # Visualization: Payment Method Distribution
     st.subheader("Payment Methods Used")
-    payment_counts = df["payment_method"].value_counts()
-    fig, ax = plt.subplots()
-    payment_counts.plot(kind="bar", color="purple", ax=ax)
-    ax.set_ylabel("Number of Transactions")
-    st.pyplot(fig)
+    def draw():
+        payment_counts = chart_data("payment_methods").set_index("payment_method")["count"]
+        fig, ax = plt.subplots()
+        payment_counts.plot(kind="bar", color="purple", ax=ax)
+        ax.set_ylabel("Number of Transactions")
+        return fig
+    show_figure("payment_methods", draw)
 
 st.sidebar.markdown("---")
 st.sidebar.text("📊 Healthcare Data Marts Dashboard")
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+
+import pandas as pd
+import pymysql
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL
+
+import duckdb_backend
+from instrumentation import counted
+from query_profiler import QUERY_PROFILING, run_profiled
+
+load_dotenv()
+
+Host=os.getenv('host')
+User=os.getenv('user')
+Password=os.getenv('password')
+Database=os.getenv('database')
+
+# "mysql", or "duckdb" to run the analytics and dashboards in-process over the cleaned_* files
+# (see duckdb_backend.py)
+DB_BACKEND = os.getenv("db_backend", "mysql")
+
+# Pool sizing; override any of these in .env
+POOL_SIZE = int(os.getenv("pool_size", 5))
+POOL_MAX_OVERFLOW = int(os.getenv("pool_max_overflow", 10))
+POOL_TIMEOUT = int(os.getenv("pool_timeout", 30))
+POOL_RECYCLE = int(os.getenv("pool_recycle", 1800))
+
+# One engine (and so one bounded connection pool) per process, shared by every module
+engine = create_engine(
+    URL.create("mysql+pymysql", username=User, password=Password, host=Host, database=Database),
+    connect_args={"cursorclass": pymysql.cursors.DictCursor},
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_recycle=POOL_RECYCLE,
+    pool_pre_ping=True,
+)
+
+_stats_lock = threading.Lock()
+_stats = {"connects": 0, "checkouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    with _stats_lock:
+        _stats["connects"] += 1
+
+
+def get_connection():
+    """Check a DBAPI connection out of the shared pool; close() hands it back to the pool."""
+    if DB_BACKEND == "duckdb":
+        return counted(duckdb_backend.get_connection())
+    start = time.perf_counter()
+    conn = engine.raw_connection()
+    waited = time.perf_counter() - start
+    with _stats_lock:
+        _stats["checkouts"] += 1
+        _stats["wait_seconds"] += waited
+        _stats["max_wait_seconds"] = max(_stats["max_wait_seconds"], waited)
+    # Statements sent on it are counted towards the open instrumentation spans
+    return counted(conn)
+
+
+def query_cursor(conn):
+    """Cursor for a profiled query (see query_profiler.run_profiled).
+
+    pymysql's default cursors read the whole result inside execute(), which would leave nothing to
+    time as fetch; the unbuffered SSDictCursor only reads the rows when they are fetched.
+    """
+    if DB_BACKEND == "mysql" and QUERY_PROFILING:
+        return conn.cursor(pymysql.cursors.SSDictCursor)
+    return conn.cursor()
+
+
+def run_query(query, params=None):
+    """Run a query on a pooled connection and return the rows as a DataFrame."""
+    conn = get_connection()
+    try:
+        with query_cursor(conn) as cursor:
+            if hasattr(cursor, "fetch_df"):
+                # DuckDB hands back columnar results directly, skipping the per-row dicts
+                result = run_profiled(cursor, query, params, lambda c: c.fetch_df())
+            else:
+                result = run_profiled(cursor, query, params, lambda c: pd.DataFrame(c.fetchall()))
+        return result
+    finally:
+        conn.close()
+
+
+def pool_stats():
+    """Pool occupancy plus checkout counts and wait times since the process started."""
+    pool = engine.pool
+    with _stats_lock:
+        stats = dict(_stats)
+    checkouts = stats["checkouts"]
+    return {
+        "pool_size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "connects": stats["connects"],
+        "checkouts": checkouts,
+        "avg_wait_ms": 1000 * stats["wait_seconds"] / checkouts if checkouts else 0.0,
+        "max_wait_ms": 1000 * stats["max_wait_seconds"],
+    }
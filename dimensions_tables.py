@@ -2,6 +2,8 @@ import pymysql
 from dotenv import load_dotenv
 import os
 
+from surrogate_keys import uuid_column
+
 load_dotenv()
 
 Host=os.getenv('host')
@@ -18,7 +20,7 @@ DB_CONFIG = {
 
 
 
-# Tables and their respective ID columns
+# Tables and their respective ID columns (integer surrogate keys, see surrogate_keys.py)
 TABLES = {
     "patient_dim": "patient_id",
     "disease_dim": "disease_id",
@@ -37,10 +39,14 @@ def modify_and_set_primary_keys():
         for table, column in TABLES.items():
             print(f"Processing table: {table}...")
 
-            # Step 1: Modify column type
-            modify_query = f"ALTER TABLE {table} MODIFY {column} VARCHAR(255) NOT NULL;"
+            # Step 1: Modify column types
+            modify_query = f"ALTER TABLE {table} MODIFY {column} INT NOT NULL;"
             cursor.execute(modify_query)
-            print(f" Modified {column} in {table} to VARCHAR(255).")
+            print(f" Modified {column} in {table} to INT.")
+
+            uuid_col = uuid_column(column)
+            cursor.execute(f"ALTER TABLE {table} MODIFY {uuid_col} CHAR(36) NOT NULL;")
+            print(f" Modified {uuid_col} in {table} to CHAR(36).")
 
             # Step 2: Add Primary Key
             try:
@@ -50,6 +56,13 @@ def modify_and_set_primary_keys():
             except pymysql.err.OperationalError as e:
                 print(f"Error adding PRIMARY KEY to {table}: {e}")
 
+            # Step 3: Keep the natural UUID key unique for lookups
+            try:
+                cursor.execute(f"ALTER TABLE {table} ADD UNIQUE KEY uq_{uuid_col} ({uuid_col});")
+                print(f" Added UNIQUE KEY on {uuid_col} in {table}.")
+            except pymysql.err.OperationalError as e:
+                print(f"Error adding UNIQUE KEY to {table}: {e}")
+
         conn.commit()
         print(" All tables processed successfully!")
     
@@ -0,0 +1,186 @@
+import os
+import re
+import threading
+
+from schema import STAR_SCHEMA
+from storage import partition_dir, parquet_available, table_path
+from surrogate_keys import DIMENSION_KEYS, uuid_column
+
+try:
+    import duckdb
+except ImportError:  # the embedded backend is optional; MySQL stays the default
+    duckdb = None
+
+# Embedded, in-process stand-in for the MySQL star schema: every star-schema table is a view over
+# the cleaned_* Parquet (or CSV) files written by clean.py, and every data mart is a view over the
+# mart query, so the analytics modules and dashboards run unchanged with no server. It is read-only;
+# the loaders (data_load.py, fact_table.py, datamart.py) still need MySQL.
+
+_lock = threading.Lock()
+_database = None
+
+# MySQL-only SQL rewritten before it reaches DuckDB
+SHOW_COLUMNS = re.compile(r"^\s*SHOW\s+COLUMNS\s+FROM\s+(\w+)\s*;?\s*$", re.IGNORECASE)
+GROUP_BY = re.compile(r"\bGROUP\s+BY\b", re.IGNORECASE)
+GROUP_BY_END = re.compile(r"\s*\b(ORDER\s+BY|HAVING|LIMIT|WINDOW|QUALIFY)\b", re.IGNORECASE)
+_grouping_fixed = {}
+
+
+def group_by_all(query):
+    """Turn MySQL-style GROUP BY <key> into GROUP BY ALL.
+
+    MySQL accepts selecting columns that are functionally dependent on the grouped primary key
+    (SELECT p.patient_id, p.name ... GROUP BY p.patient_id); DuckDB needs them all grouped.
+    """
+    parts, pos = [], 0
+    for match in GROUP_BY.finditer(query):
+        if match.start() < pos:
+            continue
+        parts.append(query[pos:match.end()] + " ALL")
+        # The grouping list ends at the next clause keyword, a closing parenthesis or a semicolon
+        depth, end = 0, match.end()
+        while end < len(query):
+            char = query[end]
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                if depth == 0:
+                    break
+                depth -= 1
+            elif char == ";" or (depth == 0 and GROUP_BY_END.match(query, end)):
+                break
+            end += 1
+        pos = end
+    parts.append(query[pos:])
+    return "".join(parts)
+
+
+def translate(query, params=None):
+    """Rewrite a MySQL (pymysql paramstyle) query for DuckDB."""
+    show_columns = SHOW_COLUMNS.match(query)
+    if show_columns:
+        return f'SELECT column_name AS "Field", column_type AS "Type" FROM (DESCRIBE {show_columns.group(1)})'
+    query = _grouping_fixed.get(query, query)
+    if params is not None:
+        query = query.replace("%s", "?").replace("%%", "%")
+    return query
+
+
+def _source(table_name):
+    if parquet_available() and os.path.isdir(partition_dir(table_name)):
+        # year=/month= directories; every file holds one month, so visit_date filters skip whole
+        # files on their min/max statistics
+        columns = ", ".join(STAR_SCHEMA[table_name])
+        path = os.path.join(partition_dir(table_name), "*", "*", "*.parquet")
+        return f"(SELECT {columns} FROM read_parquet('{path}', hive_partitioning = true))"
+    if parquet_available() and os.path.exists(table_path(table_name, "parquet")):
+        return f"read_parquet('{table_path(table_name, 'parquet')}')"
+    return f"read_csv_auto('{table_path(table_name, 'csv')}')"
+
+
+def source_version():
+    """Newest modification time (ns) of the cleaned files behind the views.
+
+    Nothing here bumps the data version; a rerun of clean.py rewrites the files instead, so this
+    stands in for it (see query_cache.current_data_version).
+    """
+    paths = []
+    for table_name in STAR_SCHEMA:
+        paths += [table_path(table_name, "csv"), table_path(table_name, "parquet")]
+        for root, _, names in os.walk(partition_dir(table_name)):
+            paths += [os.path.join(root, name) for name in names]
+    return max((os.stat(path).st_mtime_ns for path in paths if os.path.exists(path)), default=0)
+
+
+def _create_database():
+    from datamart import DATA_MART_QUERIES
+
+    database = duckdb.connect()
+    for table_name in STAR_SCHEMA:
+        # The cleaned files have no surrogate keys, so a dimension's key is its UUID: expose it
+        # under the *_uuid name the loaded MySQL tables use as well
+        columns = "*"
+        if table_name in DIMENSION_KEYS:
+            columns = f"*, {DIMENSION_KEYS[table_name]} AS {uuid_column(DIMENSION_KEYS[table_name])}"
+        database.execute(f"CREATE VIEW {table_name} AS SELECT {columns} FROM {_source(table_name)}")
+    database.execute("CREATE MACRO date_format(d, f) AS strftime(d, f)")
+    for mart_name, query in DATA_MART_QUERIES.items():
+        database.execute(f"CREATE VIEW {mart_name} AS {group_by_all(query.format(where=''))}")
+
+    # Nothing is ever loaded here, so the data version table (see watermarks.py) stays at 0 and
+    # there is no stored KPI snapshot; kpis.load_kpi_snapshot() computes one from the views instead
+    database.execute("CREATE TABLE etl_data_version (id TINYINT PRIMARY KEY, version BIGINT NOT NULL)")
+    database.execute("INSERT INTO etl_data_version VALUES (1, 0)")
+    database.execute("CREATE TABLE kpi_snapshot (id TINYINT PRIMARY KEY, computed_at TIMESTAMP, payload VARCHAR)")
+    return database
+
+
+class DuckDBCursor:
+    """DB-API cursor with pymysql DictCursor behaviour over a DuckDB connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = None
+        self.columns = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, query, params=None):
+        sql = translate(query, params)
+        args = list(params) if params is not None else None
+        try:
+            self.result = self.connection.execute(sql, args)
+        except duckdb.BinderException as e:
+            if "GROUP BY" not in str(e):
+                raise
+            # Learn the rewrite once; later runs of the same query go straight to DuckDB
+            _grouping_fixed[query] = group_by_all(query)
+            self.result = self.connection.execute(translate(query, params), args)
+        self.columns = [d[0] for d in self.result.description or []]
+
+    def fetchall(self):
+        return [dict(zip(self.columns, row)) for row in self.result.fetchall()]
+
+    def fetchone(self):
+        row = self.result.fetchone()
+        return None if row is None else dict(zip(self.columns, row))
+
+    def fetch_df(self):
+        return self.result.df()
+
+    def close(self):
+        pass
+
+
+class DuckDBConnection:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def cursor(self):
+        return DuckDBCursor(self.connection)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.connection.close()
+
+
+def get_connection():
+    """A connection to the process-wide embedded database, built on first use."""
+    global _database
+    if duckdb is None:
+        raise ImportError("db_backend=duckdb needs the duckdb package (pip install duckdb)")
+    with _lock:
+        if _database is None:
+            _database = _create_database()
+    # cursor() hands out an independent connection to the same database, safe to use from any thread
+    return DuckDBConnection(_database.cursor())
+
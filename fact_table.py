@@ -1,6 +1,20 @@
+import argparse
+import os
+import uuid
+
 import pandas as pd
 from sqlalchemy import create_engine, text
 
+from bulk_load import DEFAULT_BATCH_SIZE, bulk_load
+from instrumentation import counted, span
+from kpis import refresh_kpi_snapshot
+from storage import read_table
+from surrogate_keys import map_foreign_keys
+from watermarks import (
+    KEY_CHANGES_TABLE, bump_data_version, ensure_data_version_table, ensure_key_changes_table,
+    ensure_watermark_table, get_watermark, set_watermark
+)
+
 # MySQL Database Connection Details
 DB_CONFIG = {
     "host": "localhost",
@@ -9,74 +23,326 @@ DB_CONFIG = {
     "database": "Healthcare",
 }
 
-# Create SQLAlchemy engine using DB_CONFIG
-engine = create_engine(f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}")
+# Create SQLAlchemy engine using DB_CONFIG (LOAD DATA LOCAL INFILE enabled for bulk loads)
+engine = create_engine(
+    f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}",
+    connect_args={"allow_local_infile": True},
+)
+
+# Foreign key columns of the fact table and the dimension each one references
+FOREIGN_KEYS = {
+    "patient_id": "patient_dim",
+    "disease_id": "disease_dim",
+    "billing_id": "billing_dim",
+    "hospital_id": "hospital_dim",
+    "doctor_id": "doctor_dim",
+}
+
+# Rows rejected by foreign key validation are appended here
+QUARANTINE_DIR = "quarantine"
+
+# Name of the fact load's row in the etl_watermarks table
+FACT_WATERMARK = "hospital_visits_fact"
+
+# The fact table is RANGE partitioned by month of visit_date, with a catch-all partition on top
+# that new months are split out of as they are loaded. MySQL does not allow foreign keys on
+# partitioned tables and needs the partitioning column in every unique key, so the primary key
+# is (visit_id, visit_date) and referential integrity is enforced by push_to_mysql's
+# validation against the dimensions instead.
+FUTURE_PARTITION = "p_future"
+
+
+# Function to read cleaned visits on or after `since` (every visit when None) from Parquet or CSV,
+# swapping their UUID foreign keys for the surrogate keys data_load.py stored in the dimension tables
+def read_visits(since=None):
+    filters = [("visit_date", ">=", since)] if since is not None else None
+    with span("fact_read") as s:
+        visits = map_foreign_keys(read_table("hospital_visits_fact", filters=filters), engine)
+        s.rows_out = len(visits)
+    return visits
+
+
+# Function to read the persisted (visit_date, visit_id) high-water mark of the last fact load
+def get_fact_watermark():
+    conn = counted(engine.raw_connection())
+    try:
+        cursor = conn.cursor()
+        ensure_watermark_table(cursor)
+        ensure_data_version_table(cursor)
+        conn.commit()
+        return get_watermark(cursor, FACT_WATERMARK)
+    finally:
+        conn.close()
 
-# Load CSV file for the fact table
-hospital_visits_fact = pd.read_csv("cleaned_hospital_visits_fact.csv")
+
+# Function to list the months of visit dates as first-of-month timestamps
+def visit_months(dates):
+    months = pd.to_datetime(pd.Series(list(dates), dtype=object)).dropna().dt.to_period("M").dt.to_timestamp()
+    return sorted(months.unique())
+
+
+# Function to build the monthly partition definitions for `months`, each holding visits before the next month
+def partition_definitions(months):
+    definitions = [
+        f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{month + pd.offsets.MonthBegin(1):%Y-%m-%d}')"
+        for month in months
+    ]
+    return definitions + [f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE)"]
+
+
+# Function to read the monthly partitions the fact table already has
+def existing_partitions(connection):
+    rows = connection.execute(text("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'hospital_visits_fact' AND PARTITION_NAME IS NOT NULL
+    """)).fetchall()
+    return {row[0] for row in rows}
+
+
+# Function to split partitions for new months out of the catch-all partition before loading them;
+# months at or below the newest existing partition already land in the partition that covers them
+def ensure_partitions(months):
+    with engine.begin() as connection:
+        existing = sorted(name for name in existing_partitions(connection) if name != FUTURE_PARTITION)
+        newest = pd.Timestamp(f"{existing[-1][1:]}01") if existing else None
+        new_months = [month for month in months if newest is None or month > newest]
+        if not new_months:
+            return
+        connection.execute(text(f"""
+            ALTER TABLE hospital_visits_fact REORGANIZE PARTITION {FUTURE_PARTITION} INTO (
+                {", ".join(partition_definitions(new_months))}
+            )
+        """))
+        print(f"🗂️ Added {len(new_months)} monthly partitions to hospital_visits_fact")
 
 
 # Function to create the fact table if it doesn't exist
-def create_fact_table():
-    create_table_query = """
-    CREATE TABLE hospital_visits_fact (
-        visit_id VARCHAR(50) PRIMARY KEY,
-        patient_id VARCHAR(255),
-        disease_id VARCHAR(255),
-        billing_id VARCHAR(255),
-        visit_date DATE,
-        hospital_id VARCHAR(255),
-        doctor_id VARCHAR(255),
+def create_fact_table(months=()):
+    create_table_query = f"""
+    CREATE TABLE IF NOT EXISTS hospital_visits_fact (
+        visit_id VARCHAR(50) NOT NULL,
+        patient_id INT,
+        disease_id INT,
+        billing_id INT,
+        visit_date DATE NOT NULL,
+        hospital_id INT,
+        doctor_id INT,
         total_bill DECIMAL(10, 2),
-        FOREIGN KEY (patient_id) REFERENCES patient_dim(patient_id),
-        FOREIGN KEY (disease_id) REFERENCES disease_dim(disease_id),
-        FOREIGN KEY (billing_id) REFERENCES billing_dim(billing_id),
-        FOREIGN KEY (hospital_id) REFERENCES hospital_dim(hospital_id),
-        FOREIGN KEY (doctor_id) REFERENCES doctor_dim(doctor_id)
+        loaded_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+        PRIMARY KEY (visit_id, visit_date),
+        INDEX idx_loaded_at (loaded_at)
+    )
+    PARTITION BY RANGE COLUMNS (visit_date) (
+        {", ".join(partition_definitions(months))}
     );
     """
     with engine.connect() as connection:
         connection.execute(text(create_table_query))
+
+        # Fact tables created before loaded_at existed get the column added in place
+        if connection.execute(text("SHOW COLUMNS FROM hospital_visits_fact LIKE 'loaded_at'")).first() is None:
+            connection.execute(text("""
+                ALTER TABLE hospital_visits_fact
+                ADD COLUMN loaded_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+                ADD INDEX idx_loaded_at (loaded_at)
+            """))
+
+        # Fact tables created before partitioning existed are converted in place
+        if not existing_partitions(connection):
+            partition_existing_fact_table(connection, months)
         print("✅ Fact table `hospital_visits_fact` created (if not already existing).")
 
 
+# Function to convert an unpartitioned fact table: drop its foreign keys, widen the primary key
+# to include visit_date, and partition it by month over both its own and the incoming visit months
+def partition_existing_fact_table(connection, months):
+    foreign_keys = connection.execute(text("""
+        SELECT CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'hospital_visits_fact' AND CONSTRAINT_TYPE = 'FOREIGN KEY'
+    """)).fetchall()
+    for (name,) in foreign_keys:
+        connection.execute(text(f"ALTER TABLE hospital_visits_fact DROP FOREIGN KEY {name}"))
+
+    stored = connection.execute(text("SELECT DISTINCT visit_date FROM hospital_visits_fact")).fetchall()
+    months = visit_months(list(months) + [row[0] for row in stored])
+    connection.execute(text("""
+        ALTER TABLE hospital_visits_fact
+        MODIFY visit_date DATE NOT NULL,
+        DROP PRIMARY KEY,
+        ADD PRIMARY KEY (visit_id, visit_date)
+    """))
+    connection.execute(text(f"""
+        ALTER TABLE hospital_visits_fact PARTITION BY RANGE COLUMNS (visit_date) (
+            {", ".join(partition_definitions(months))}
+        )
+    """))
+    print(f"🗂️ Partitioned hospital_visits_fact into {len(months)} months")
+
+
 # Function to push DataFrame to MySQL with foreign key validation
-def push_to_mysql(df, table_name):
+def push_to_mysql(df, table_name, batch_size=DEFAULT_BATCH_SIZE, watermark=None):
+    # Every load stages into a table of its own, so concurrent loads never see each other's rows
+    load_id = uuid.uuid4().hex
+    staging_table = f"{table_name}_staging_{load_id[:12]}"
+    joins = "\n".join(
+        f"LEFT JOIN {dim} ON {dim}.{column} = s.{column}" for column, dim in FOREIGN_KEYS.items()
+    )
+    reasons = ", ".join(
+        f"IF({dim}.{column} IS NULL, 'missing {column}', NULL)" for column, dim in FOREIGN_KEYS.items()
+    )
+    missing = " OR ".join(f"{dim}.{column} IS NULL" for column, dim in FOREIGN_KEYS.items())
     try:
-        # Validate foreign keys before inserting data
-        with engine.connect() as connection:
-            # Use 'text' function to execute raw SQL queries properly
-            valid_patient_ids = {row[0] for row in connection.execute(text("SELECT patient_id FROM patient_dim")).fetchall()}
-            valid_disease_ids = {row[0] for row in connection.execute(text("SELECT disease_id FROM disease_dim")).fetchall()}
-            valid_billing_ids = {row[0] for row in connection.execute(text("SELECT billing_id FROM billing_dim")).fetchall()}
-            valid_hospital_ids = {row[0] for row in connection.execute(text("SELECT hospital_id FROM hospital_dim")).fetchall()}
-            valid_doctor_ids = {row[0] for row in connection.execute(text("SELECT doctor_id FROM doctor_dim")).fetchall()}
-
-            # Filter invalid rows
-            valid_data = df[
-                df['patient_id'].isin(valid_patient_ids) &
-                df['disease_id'].isin(valid_disease_ids) &
-                df['billing_id'].isin(valid_billing_ids) &
-                df['hospital_id'].isin(valid_hospital_ids) &
-                df['doctor_id'].isin(valid_doctor_ids)
-            ]
-            
-            if valid_data.empty:
+        with span("fact_validation", rows_in=len(df), table=table_name) as validation:
+            # Rows whose UUIDs never got a surrogate key cannot match any dimension row, and rows
+            # without a visit date have no partition to go to
+            reason = pd.Series("", index=df.index)
+            for column in FOREIGN_KEYS:
+                reason = reason.mask(df[column].isna(), reason + f"unknown {column}; ")
+            reason = reason.mask(df["visit_date"].isna(), reason + "missing visit_date; ")
+            rejected = [df[reason != ""].assign(reason=reason.str.rstrip("; "))]
+            candidates = df[reason == ""]
+
+            # New months get their own partition before any of their rows arrive
+            ensure_partitions(visit_months(candidates["visit_date"]))
+
+            # Stage the batch and let the server anti-join it against the dimension tables
+            with engine.begin() as connection:
+                cursor = connection.connection.cursor()
+                ensure_data_version_table(cursor)
+                ensure_key_changes_table(cursor)
+                connection.execute(text(f"CREATE TABLE {staging_table} LIKE {table_name}"))
+            bulk_load(candidates, staging_table, engine, batch_size=batch_size)
+
+            with engine.begin() as connection:
+                orphans = pd.read_sql(text(f"""
+                    SELECT s.visit_id, CONCAT_WS('; ', {reasons}) AS reason
+                    FROM {staging_table} s
+                    {joins}
+                    WHERE {missing}
+                """), connection)
+            rejected.append(candidates.merge(orphans, on="visit_id"))
+
+            valid_rows = len(candidates) - len(orphans)
+            validation.rows_out = valid_rows
+            if valid_rows == 0:
                 raise ValueError("No valid rows to insert after foreign key validation.")
 
-            # Insert valid data into MySQL table
-            valid_data.to_sql(table_name, engine, if_exists="append", index=False)
-            print(f"✅ Data pushed to {table_name}")
+        with span("fact_insert", rows_in=valid_rows, table=table_name) as insert:
+            with engine.begin() as connection:
+                cursor = connection.connection.cursor()
+
+                # Invalidate cached dashboard results (see query_cache.py). Done first, because it
+                # locks the data-version row until this transaction commits, so the insert step of
+                # a concurrent load waits here and stamps its rows after this one has committed
+                bump_data_version(cursor)
+
+                # Corrections that move a visit to another patient, doctor, ... take it away from the
+                # old key's mart row: keep the old keys so the marts recompute those rows too
+                keys = ", ".join(FOREIGN_KEYS)
+                unchanged = " AND ".join(f"f.{column} <=> s.{column}" for column in FOREIGN_KEYS)
+                connection.execute(text(f"""
+                    INSERT INTO {KEY_CHANGES_TABLE} (load_id, changed_at, {keys})
+                    SELECT :load_id, NOW(6), {", ".join(f"f.{column}" for column in FOREIGN_KEYS)}
+                    FROM {table_name} f
+                    JOIN {staging_table} s ON s.visit_id = f.visit_id
+                    {joins}
+                    WHERE NOT ({missing}) AND NOT ({unchanged})
+                """), {"load_id": load_id})
+
+                # A corrected visit_date moves the visit to another partition: drop its old row first
+                connection.execute(text(f"""
+                    DELETE f FROM {table_name} f
+                    JOIN {staging_table} s ON s.visit_id = f.visit_id
+                    {joins}
+                    WHERE s.visit_date <> f.visit_date AND NOT ({missing})
+                """))
+
+                # Move only the rows that matched every dimension into the fact table; visits that
+                # are already there (re-runs, late corrections) are updated in place
+                columns = ", ".join(df.columns)
+                connection.execute(text(f"""
+                    INSERT INTO {table_name} ({columns})
+                    SELECT {", ".join(f"s.{column}" for column in df.columns)}
+                    FROM {staging_table} s
+                    {joins}
+                    WHERE NOT ({missing})
+                    ON DUPLICATE KEY UPDATE {", ".join(f"{column} = s.{column}" for column in df.columns)}
+                """))
+
+                if watermark is not None:
+                    loaded = candidates[~candidates["visit_id"].isin(orphans["visit_id"])]
+                    advance_watermark(cursor, watermark, loaded)
+
+                # Last statements before the commit: the batch's rows and key changes carry the time it
+                # became visible, so the marts' MAX(loaded_at) watermark never passes uncommitted rows
+                connection.execute(text(
+                    f"UPDATE {KEY_CHANGES_TABLE} SET changed_at = NOW(6) WHERE load_id = :load_id"
+                ), {"load_id": load_id})
+                connection.execute(text(f"""
+                    UPDATE {table_name} f
+                    JOIN {staging_table} s ON s.visit_id = f.visit_id AND s.visit_date = f.visit_date
+                    SET f.loaded_at = NOW(6)
+                """))
+            insert.rows_out = valid_rows
+
+        quarantine(pd.concat(rejected, ignore_index=True), table_name)
+        print(f"✅ Data pushed to {table_name} ({valid_rows:,} rows)")
+        return True
     except Exception as e:
         print(f"❌ Error inserting data into table: {e}")
+        return False
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {staging_table}"))
+
+
+# Function to move the high-water mark forward to the newest (visit_date, visit_id) just loaded
+def advance_watermark(cursor, name, loaded):
+    high_water = loaded["visit_date"].max()
+    high_water_id = loaded.loc[loaded["visit_date"] == high_water, "visit_id"].max()
+
+    current, current_id = get_watermark(cursor, name)
+    if current is None or (pd.Timestamp(high_water), high_water_id) > (pd.Timestamp(current), current_id or ""):
+        set_watermark(cursor, name, pd.Timestamp(high_water).to_pydatetime(), high_water_id)
+        print(f"🔖 {name} watermark moved to {high_water:%Y-%m-%d} / {high_water_id}")
+
+
+# Function to keep rejected rows, with the reason, instead of silently dropping them
+def quarantine(rejected, table_name):
+    if rejected.empty:
+        return
+    os.makedirs(QUARANTINE_DIR, exist_ok=True)
+    path = os.path.join(QUARANTINE_DIR, f"{table_name}_rejects.csv")
+    rejected.assign(rejected_at=pd.Timestamp.now()).to_csv(
+        path, mode="a", header=not os.path.exists(path), index=False
+    )
+    print(f"⚠️ {len(rejected):,} rows failed foreign key validation; written to {path}")
 
 
 # Main function to execute
 if __name__ == "__main__":
-    # Create the fact table if it doesn't exist
-    create_fact_table()
-    
+    parser = argparse.ArgumentParser(description="Load cleaned visits into hospital_visits_fact.")
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and reload every visit")
+    parser.add_argument("--since", help="reload visits on or after this date (for late corrections)")
+    args = parser.parse_args()
+
+    # Only read visits from the watermark day onwards; that day is re-read so same-day
+    # corrections are picked up, and the upsert makes re-reading it harmless
+    since = args.since
+    if since is None and not args.full:
+        since, _ = get_fact_watermark()
+    hospital_visits_fact = read_visits(since)
+    print(f"📥 {len(hospital_visits_fact):,} visits to load" + (f" since {since}" if since else ""))
+
+    # Create the fact table if it doesn't exist, partitioned over the months being loaded
+    create_fact_table(visit_months(hospital_visits_fact["visit_date"]))
+
     # Push data into the fact table
-    push_to_mysql(hospital_visits_fact, "hospital_visits_fact")
-    
-    print("🎉 Fact table successfully loaded into MySQL!")
\ No newline at end of file
+    if not hospital_visits_fact.empty:
+        if not push_to_mysql(hospital_visits_fact, "hospital_visits_fact", watermark=FACT_WATERMARK):
+            raise SystemExit("❌ Fact load failed; the KPI snapshot was left as it was")
+
+        # Precompute the dashboards' KPIs against the new data
+        refresh_kpi_snapshot()
+
+    print("🎉 Fact table successfully loaded into MySQL!")
@@ -0,0 +1,90 @@
+import io
+import threading
+from collections import OrderedDict
+
+import matplotlib
+
+matplotlib.use("Agg")  # figures are only ever rendered to bytes, never shown in a window
+import matplotlib.pyplot as plt
+import streamlit as st
+
+from query_cache import current_data_version
+
+# Image format and resolution of rendered charts
+FIGURE_FORMAT = "png"
+FIGURE_DPI = 100
+
+# Upper bound on the memory held by rendered images; least recently used images go first
+FIGURE_CACHE_MAX_BYTES = 64 * 2**20
+
+_lock = threading.Lock()
+_figures = OrderedDict()  # (chart id, data version, params, format) -> image bytes
+_figures_bytes = 0
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def render_figure(fig, fmt=FIGURE_FORMAT):
+    """Render a figure to image bytes and close it, so pyplot does not keep it alive."""
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format=fmt, dpi=FIGURE_DPI, bbox_inches="tight")
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+def _evict(key):
+    global _figures_bytes
+    _figures_bytes -= len(_figures.pop(key))
+
+
+def cached_figure(chart_id, draw, params=(), fmt=FIGURE_FORMAT):
+    """Rendered image of a chart, drawn only when no image exists for its data version and params.
+
+    `draw()` fetches the chart's data and returns a new matplotlib Figure; on a hit neither the
+    data nor matplotlib is touched.
+    """
+    global _figures_bytes
+    version = current_data_version()
+    key = (chart_id, version, tuple(params), fmt)
+
+    with _lock:
+        image = _figures.get(key)
+        if image is not None:
+            _figures.move_to_end(key)
+            _stats["hits"] += 1
+            return image
+        _stats["misses"] += 1
+
+    image = render_figure(draw(), fmt)
+
+    with _lock:
+        # Images drawn from an older data version can never be served again
+        for stale in [k for k in _figures if k[1] != version]:
+            _evict(stale)
+        if key in _figures:
+            _evict(key)
+        if len(image) <= FIGURE_CACHE_MAX_BYTES:
+            _figures[key] = image
+            _figures_bytes += len(image)
+            while _figures_bytes > FIGURE_CACHE_MAX_BYTES:
+                _evict(next(iter(_figures)))
+                _stats["evictions"] += 1
+    return image
+
+
+def show_figure(chart_id, draw, params=(), fmt=FIGURE_FORMAT):
+    """st.pyplot() replacement that serves the chart from the figure cache."""
+    st.image(cached_figure(chart_id, draw, params, fmt))
+
+
+def clear_figure_cache():
+    global _figures_bytes
+    with _lock:
+        _figures.clear()
+        _figures_bytes = 0
+
+
+def figure_cache_stats():
+    with _lock:
+        return dict(_stats, entries=len(_figures), bytes=_figures_bytes)
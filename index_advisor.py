@@ -0,0 +1,194 @@
+import argparse
+import time
+
+import pandas as pd
+
+from db import DB_BACKEND, get_connection
+
+FACT_TABLE = "hospital_visits_fact"
+
+# Composite covering indexes for the hot aggregates: each holds the grouping key and every fact
+# column the aggregate reads, so MySQL answers from the index alone without touching table rows
+COVERING_INDEXES = {
+    "idx_fact_hospital_bill": ("hospital_id", "total_bill"),
+    "idx_fact_disease_bill": ("disease_id", "total_bill"),
+    "idx_fact_doctor_bill": ("doctor_id", "total_bill"),
+    "idx_fact_billing_bill": ("billing_id", "total_bill"),
+    "idx_fact_patient_bill": ("patient_id", "total_bill"),
+    "idx_fact_doctor_patient": ("doctor_id", "patient_id"),
+    "idx_fact_date_visit": ("visit_date", "visit_id"),
+}
+
+# The query shapes kpis.py, aggregations.py and the dashboards run against the fact table, and
+# the index meant to serve each. {hint} is where the advisor forces or ignores that index.
+QUERY_CATALOG = {
+    "revenue_by_hospital": {
+        "index": "idx_fact_hospital_bill",
+        "sql": """
+            SELECT h.hospital_name, SUM(v.total_bill) AS total_revenue
+            FROM hospital_visits_fact v {hint}
+            JOIN hospital_dim h ON v.hospital_id = h.hospital_id
+            GROUP BY h.hospital_name
+        """,
+    },
+    "revenue_by_disease": {
+        "index": "idx_fact_disease_bill",
+        "sql": """
+            SELECT d.disease_name, SUM(v.total_bill) AS total_revenue
+            FROM hospital_visits_fact v {hint}
+            JOIN disease_dim d ON v.disease_id = d.disease_id
+            GROUP BY d.disease_name
+        """,
+    },
+    "revenue_by_doctor": {
+        "index": "idx_fact_doctor_bill",
+        "sql": """
+            SELECT d.doctor_name, SUM(v.total_bill) AS total_revenue
+            FROM hospital_visits_fact v {hint}
+            JOIN doctor_dim d ON v.doctor_id = d.doctor_id
+            GROUP BY d.doctor_name
+        """,
+    },
+    "revenue_by_insurance_type": {
+        "index": "idx_fact_billing_bill",
+        "sql": """
+            SELECT b.insurance_type, SUM(v.total_bill) AS total_revenue
+            FROM hospital_visits_fact v {hint}
+            JOIN billing_dim b ON v.billing_id = b.billing_id
+            GROUP BY b.insurance_type
+        """,
+    },
+    "revenue_per_patient": {
+        "index": "idx_fact_patient_bill",
+        "sql": """
+            SELECT p.name, SUM(v.total_bill) AS revenue_per_patient
+            FROM hospital_visits_fact v {hint}
+            JOIN patient_dim p ON v.patient_id = p.patient_id
+            GROUP BY p.name
+        """,
+    },
+    "patients_per_doctor": {
+        "index": "idx_fact_doctor_patient",
+        "sql": """
+            SELECT d.doctor_name, COUNT(DISTINCT f.patient_id) AS patient_count
+            FROM hospital_visits_fact f {hint}
+            JOIN doctor_dim d USING (doctor_id)
+            GROUP BY d.doctor_name
+        """,
+    },
+    "hospital_visits_trend": {
+        "index": "idx_fact_date_visit",
+        "sql": """
+            SELECT DATE_FORMAT(v.visit_date, '%Y-%m') AS month, COUNT(DISTINCT v.visit_id) AS total_visits
+            FROM hospital_visits_fact v {hint}
+            GROUP BY month
+            ORDER BY month
+        """,
+    },
+}
+
+# Timed runs per query and hint; the fastest is reported
+REPEAT = 3
+
+
+def existing_indexes(cursor):
+    cursor.execute(f"SHOW INDEX FROM {FACT_TABLE}")
+    return {row["Key_name"] for row in cursor.fetchall()}
+
+
+def create_indexes(cursor, names):
+    """Add the given covering indexes in one ALTER, so the table is only rebuilt once."""
+    additions = ", ".join(f"ADD INDEX {name} ({', '.join(COVERING_INDEXES[name])})" for name in names)
+    cursor.execute(f"ALTER TABLE {FACT_TABLE} {additions}, ALGORITHM=INPLACE, LOCK=NONE")
+    cursor.execute(f"ANALYZE TABLE {FACT_TABLE}")
+    cursor.fetchall()
+
+
+def index_size_bytes(cursor, name):
+    """On-disk size of an index, summed over the fact table's partitions."""
+    cursor.execute("""
+        SELECT SUM(stat_value) * @@innodb_page_size AS size
+        FROM mysql.innodb_index_stats
+        WHERE database_name = DATABASE() AND (table_name = %s OR table_name LIKE %s)
+          AND index_name = %s AND stat_name = 'size'
+    """, (FACT_TABLE, f"{FACT_TABLE}#p#%", name))
+    row = cursor.fetchone()
+    return int(row["size"] or 0)
+
+
+def explain(cursor, sql):
+    cursor.execute("EXPLAIN " + sql)
+    return cursor.fetchall()
+
+
+def is_index_only(plan, name):
+    """True when the plan reads the fact table through `name` without touching table rows."""
+    return any(row.get("key") == name and "Using index" in (row.get("Extra") or "") for row in plan)
+
+
+def time_query(cursor, sql, repeat=REPEAT):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql)
+        cursor.fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def advise(apply=False, repeat=REPEAT):
+    """Check every catalogued query against its covering index.
+
+    Missing indexes are only created when `apply` is set. For each query that has its index, the
+    report holds the index size, whether EXPLAIN shows an index-only read, and the best run time
+    with the index forced vs ignored.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            missing = [name for name in COVERING_INDEXES if name not in existing_indexes(cursor)]
+            if missing and apply:
+                print(f"🔧 Creating {len(missing)} covering indexes: {', '.join(missing)}")
+                create_indexes(cursor, missing)
+                missing = []
+
+            report = []
+            for query_name, entry in QUERY_CATALOG.items():
+                name = entry["index"]
+                if name in missing:
+                    columns = ", ".join(COVERING_INDEXES[name])
+                    print(f"💡 {query_name}: ALTER TABLE {FACT_TABLE} ADD INDEX {name} ({columns});")
+                    continue
+                with_index = entry["sql"].format(hint=f"FORCE INDEX ({name})")
+                without_index = entry["sql"].format(hint=f"IGNORE INDEX ({name})")
+                plan = explain(cursor, with_index)
+                seconds_without = time_query(cursor, without_index, repeat)
+                seconds_with = time_query(cursor, with_index, repeat)
+                report.append({
+                    "query": query_name,
+                    "index": name,
+                    "index_mb": round(index_size_bytes(cursor, name) / 2**20, 2),
+                    "index_only": is_index_only(plan, name),
+                    "ms_without": round(1000 * seconds_without, 2),
+                    "ms_with": round(1000 * seconds_with, 2),
+                    "speedup": round(seconds_without / seconds_with, 2) if seconds_with else None,
+                })
+        conn.commit()
+    finally:
+        conn.close()
+    return pd.DataFrame(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the fact table's covering indexes against the hot queries.")
+    parser.add_argument("--apply", action="store_true", help="create the covering indexes that are missing")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs per query (best is kept)")
+    args = parser.parse_args()
+
+    if DB_BACKEND != "mysql":
+        raise SystemExit(f"❌ The index advisor needs the MySQL backend (db_backend={DB_BACKEND})")
+
+    report = advise(apply=args.apply, repeat=args.repeat)
+    if not report.empty:
+        print("\n📊 Covering index report:")
+        print(report.to_string(index=False))
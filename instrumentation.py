@@ -0,0 +1,297 @@
+import argparse
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+try:
+    import resource
+except ImportError:  # peak memory is only reported where getrusage exists
+    resource = None
+
+try:
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+except ImportError:
+    event = Engine = None
+
+load_dotenv()
+
+# Structured timing spans for the pipeline stages. A span records wall time, rows in and out,
+# bytes read from files, statements sent to the database and the process's peak RSS. Spans nest
+# per thread: bytes and statements count towards every span open on the thread doing the work.
+
+# Where finished spans go: "jsonl" appends one JSON object per span to SPAN_LOG, "prometheus"
+# keeps PROMETHEUS_FILE up to date for node_exporter's textfile collector, "off" drops them.
+# Several sinks can be comma-separated.
+SPAN_SINKS = [sink.strip() for sink in os.getenv("span_sink", "jsonl").split(",") if sink.strip()]
+SPAN_LOG = os.getenv("span_log", "pipeline_spans.jsonl")
+PROMETHEUS_FILE = os.getenv("prometheus_file", "pipeline_spans.prom")
+
+# Shared by every span of this process; set pipeline_run_id to group the scripts of one nightly run
+RUN_ID = os.getenv("pipeline_run_id") or uuid.uuid4().hex[:12]
+
+PROMETHEUS_PREFIX = "pipeline_span"
+
+_local = threading.local()
+_sink_lock = threading.Lock()
+_prometheus_samples = None
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _open_spans():
+    if not hasattr(_local, "spans"):
+        _local.spans = []
+    return _local.spans
+
+
+class Span:
+    def __init__(self, name, rows_in=None, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.bytes_read = 0
+        self.round_trips = 0
+        self.status = "ok"
+        self.error = None
+
+    def __enter__(self):
+        spans = _open_spans()
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = spans[-1].span_id if spans else None
+        self.started_at = datetime.now()
+        self.rss_before = peak_rss_bytes()
+        self.start = time.perf_counter()
+        spans.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        self.peak_rss = peak_rss_bytes()
+        _open_spans().remove(self)
+        if exc is not None:
+            self.status, self.error = "error", f"{exc_type.__name__}: {exc}"
+        emit(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "run_id": RUN_ID,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "attributes": self.attributes,
+            "started_at": self.started_at.isoformat(),
+            "seconds": round(self.seconds, 6),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "bytes_read": self.bytes_read,
+            "round_trips": self.round_trips,
+            "peak_rss_bytes": self.peak_rss,
+            # How far this span pushed the process's memory high-water mark
+            "rss_growth_bytes": self.peak_rss - self.rss_before if self.peak_rss is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+        }
+
+
+def span(name, rows_in=None, **attributes):
+    """Context manager timing a stage: `with span("fact_insert", rows_in=len(df)) as s: ...`."""
+    return Span(name, rows_in, **attributes)
+
+
+def traced(name, **attributes):
+    """Run the decorated function in a span named `name`; rows out is the length of its result."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Span(name, function=fn.__name__, **attributes) as s:
+                result = fn(*args, **kwargs)
+                s.rows_out = len(result) if hasattr(result, "__len__") and not isinstance(result, str) else 1
+                return result
+        return wrapper
+    return decorator
+
+
+def add_bytes_read(n):
+    for s in _open_spans():
+        s.bytes_read += n
+
+
+def add_round_trips(n=1):
+    for s in _open_spans():
+        s.round_trips += n
+
+
+# --- Statement counting ---
+
+class CountingCursor:
+    """DB-API cursor proxy that counts the statements it sends."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        add_round_trips()
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        add_round_trips()
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+
+class CountingConnection:
+    """DB-API connection proxy whose cursors count their statements (see CountingCursor)."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._connection.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def counted(connection):
+    return CountingConnection(connection)
+
+
+if event is not None:
+    # Statements run through any SQLAlchemy engine (read_sql, to_sql, Connection.execute)
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _count_statement(conn, cursor, statement, parameters, context, executemany):
+        add_round_trips()
+
+
+# --- Sinks ---
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prometheus_key(metric, s):
+    labels = {"span": s.name, **{k: v for k, v in s.attributes.items() if v is not None}}
+    rendered = ",".join(f'{re.sub(r"[^a-zA-Z0-9_]", "_", k)}="{_label_value(v)}"' for k, v in labels.items())
+    return f"{PROMETHEUS_PREFIX}_{metric}{{{rendered}}}"
+
+
+def _load_prometheus_samples():
+    """Samples already in the file, so spans written by other scripts of the run are kept."""
+    samples = {}
+    if os.path.exists(PROMETHEUS_FILE):
+        with open(PROMETHEUS_FILE) as f:
+            for line in f:
+                if line.strip() and not line.startswith("#"):
+                    key, _, value = line.rstrip("\n").rpartition(" ")
+                    samples[key] = value
+    return samples
+
+
+def _write_prometheus(s):
+    global _prometheus_samples
+    if _prometheus_samples is None:
+        _prometheus_samples = _load_prometheus_samples()
+
+    values = {
+        "seconds": s.seconds,
+        "rows_in": s.rows_in,
+        "rows_out": s.rows_out,
+        "bytes_read": s.bytes_read,
+        "round_trips": s.round_trips,
+        "peak_rss_bytes": s.peak_rss,
+        "failed": int(s.status != "ok"),
+        "last_end_timestamp_seconds": time.time(),
+    }
+    for metric, value in values.items():
+        if value is not None:
+            _prometheus_samples[_prometheus_key(metric, s)] = repr(float(value))
+
+    lines = []
+    for metric in values:
+        name = f"{PROMETHEUS_PREFIX}_{metric}"
+        samples = [(key, value) for key, value in _prometheus_samples.items() if key.startswith(name + "{")]
+        if samples:
+            lines.append(f"# TYPE {name} gauge")
+            lines += [f"{key} {value}" for key, value in sorted(samples)]
+
+    # Written whole and renamed into place, so the collector never reads a partial file
+    tmp_path = PROMETHEUS_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, PROMETHEUS_FILE)
+
+
+def emit(s):
+    if not SPAN_SINKS or SPAN_SINKS == ["off"]:
+        return
+    with _sink_lock:
+        if "jsonl" in SPAN_SINKS:
+            with open(SPAN_LOG, "a") as f:
+                f.write(json.dumps(s.to_dict(), default=str) + "\n")
+        if "prometheus" in SPAN_SINKS:
+            _write_prometheus(s)
+
+
+# --- Report ---
+
+def summarize(path=SPAN_LOG, run_id=None):
+    """Per-span totals from a JSON-lines log, slowest first; the latest run unless `run_id` is given."""
+    import pandas as pd
+
+    with open(path) as f:
+        spans = pd.DataFrame([json.loads(line) for line in f if line.strip()])
+    run_id = run_id or spans["run_id"].iloc[-1]
+    spans = spans[spans["run_id"] == run_id]
+    return spans.groupby("name").agg(
+        count=("span_id", "count"),
+        seconds=("seconds", "sum"),
+        max_seconds=("seconds", "max"),
+        rows_in=("rows_in", "sum"),
+        rows_out=("rows_out", "sum"),
+        bytes_read=("bytes_read", "sum"),
+        round_trips=("round_trips", "sum"),
+        peak_rss_mb=("peak_rss_bytes", lambda b: b.max() / 2**20),
+        errors=("status", lambda status: int((status != "ok").sum())),
+    ).sort_values("seconds", ascending=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the pipeline spans of one run.")
+    parser.add_argument("log", nargs="?", default=SPAN_LOG, help=f"JSON-lines span log (default {SPAN_LOG})")
+    parser.add_argument("--run-id", help="run to summarize (default: the latest)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log):
+        raise SystemExit(f"❌ No span log at {args.log} (set span_sink=jsonl and run the pipeline)")
+    print("📊 Where the time went, by span:")
+    print(summarize(args.log, args.run_id).to_string())
@@ -1,39 +1,37 @@
-import pymysql
+import json
+import sys
+import threading
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Optional
+
 import pandas as pd
-from dotenv import load_dotenv
-import os
-# Database connection details
-import mysql.connector
 
-load_dotenv()
+# Queries run on the shared connection pool (see db.py)
+from aggregations import run_grouped
+from db import get_connection, run_query
+from instrumentation import traced
+from query_cache import CACHE_TTL, cached_query, current_data_version
+from star_engine import age_groups, get_star_engine
+from watermarks import bump_data_version, ensure_data_version_table
 
-Host=os.getenv('host')
-User=os.getenv('user')
-Password=os.getenv('password')
-Database=os.getenv('database')
 
-# Function to connect to the MySQL database
+# Function to get a pooled connection to the MySQL database; close() returns it to the pool
 def get_db_connection():
-    connection = mysql.connector.connect(
-        host=Host,       
-        user=User,            
-        password=Password,     
-        database=Database
-       
-    )
-    return connection
+    return get_connection()
 
 
 # 1. Total Revenue (Billing) Analysis
+@traced("kpi")
 def get_total_revenue():
     query = "SELECT SUM(total_bill) AS total_revenue FROM hospital_visits_fact"
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df['total_revenue'][0]
 
 
 # 2. Revenue by Disease (Join with disease_dim)
+@traced("kpi")
 def get_revenue_by_disease():
     query = """
     SELECT d.disease_name, SUM(v.total_bill) AS total_revenue
@@ -41,27 +39,27 @@ def get_revenue_by_disease():
     JOIN disease_dim d ON v.disease_id = d.disease_id
     GROUP BY d.disease_name;
     """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df
 
 
 # 3. Revenue by Doctor (Join with doctor_dim)
+@traced("kpi")
 def get_revenue_by_doctor():
     query = """
     SELECT d.doctor_name, SUM(v.total_bill) AS total_revenue
     FROM hospital_visits_fact v
     JOIN doctor_dim d ON v.doctor_id = d.doctor_id
-    GROUP BY d.doctor_name limit 10;
+    GROUP BY d.doctor_name
+    ORDER BY total_revenue DESC
+    LIMIT 10;
     """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df
 
 
 # 4. Revenue by Hospital (Join with hospital_dim)
+@traced("kpi")
 def get_revenue_by_hospital():
     query = """
     SELECT h.hospital_name, SUM(v.total_bill) AS total_revenue
@@ -69,31 +67,28 @@ def get_revenue_by_hospital():
     JOIN hospital_dim h ON v.hospital_id = h.hospital_id
     GROUP BY h.hospital_name;
     """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df
 
 
 # 5. Number of Visits (Volume) Analysis
+@traced("kpi")
 def get_total_visits():
     query = "SELECT COUNT(DISTINCT visit_id) AS total_visits FROM hospital_visits_fact"
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df['total_visits'][0]
 
 
 # 6. Average Revenue per Visit
+@traced("kpi")
 def get_avg_revenue_per_visit():
     query = "SELECT AVG(total_bill) AS avg_revenue_per_visit FROM hospital_visits_fact"
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df['avg_revenue_per_visit'][0]
 
 
 # 7. Revenue per Patient (Join with patient_dim)
+@traced("kpi")
 def get_revenue_per_patient():
     query = """
     SELECT p.name, SUM(v.total_bill) AS revenue_per_patient
@@ -101,13 +96,12 @@ def get_revenue_per_patient():
     JOIN patient_dim p ON v.patient_id = p.patient_id
     GROUP BY p.name;
     """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df
 
 
 # 8. Patient Visits by Gender (Join with patient_dim)
+@traced("kpi")
 def get_visits_by_gender():
     query = """
     SELECT p.gender, COUNT(DISTINCT v.visit_id) AS total_visits
@@ -115,13 +109,12 @@ def get_visits_by_gender():
     JOIN patient_dim p ON v.patient_id = p.patient_id
     GROUP BY p.gender;
     """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df
 
 
 # 9. Patient Visits by Age Group (Join with patient_dim)
+@traced("kpi")
 def get_visits_by_age_group():
     query = """
     SELECT
@@ -136,26 +129,24 @@ def get_visits_by_age_group():
     JOIN patient_dim p ON v.patient_id = p.patient_id
     GROUP BY age_group;
     """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df
 
 
 # 10. Claim Status Breakdown (Join with billing_dim)
+@traced("kpi")
 def get_claim_status_breakdown():
     query = """
     SELECT b.claim_status, COUNT(b.billing_id) AS total_claims
     FROM billing_dim b
     GROUP BY b.claim_status;
     """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df
 
 
 # 11. Revenue by Insurance Type (Join with billing_dim)
+@traced("kpi")
 def get_revenue_by_insurance_type():
     query = """
     SELECT b.insurance_type, SUM(v.total_bill) AS total_revenue
@@ -163,13 +154,12 @@ def get_revenue_by_insurance_type():
     JOIN billing_dim b ON v.billing_id = b.billing_id
     GROUP BY b.insurance_type;
     """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df
 
 
 # 12. Hospital Visits Trend Over Time
+@traced("kpi")
 def get_hospital_visits_trend():
     query = """
     SELECT DATE_FORMAT(v.visit_date, '%Y-%m') AS month, COUNT(DISTINCT v.visit_id) AS total_visits
@@ -177,14 +167,210 @@ def get_hospital_visits_trend():
     GROUP BY month
     ORDER BY month;
     """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    df = run_query(query)
     return df
 
 
+# --- KPI Snapshot ---
+# All of the KPIs above (plus the two headline numbers the dashboards show) computed in one
+# batched evaluation: every fact aggregate, the distinct patient count included, is grouped in the
+# database in one pass over the fact table (see aggregations.grouping_query), with the averages
+# derived from the shared sums. The claim breakdown reads only billing_dim, in a small query of its own.
+
+KPI_SNAPSHOT_TABLE = "kpi_snapshot"
+
+# Live snapshot used while none is stored, until the data version changes or CACHE_TTL passes
+_live_lock = threading.Lock()
+_live = {"snapshot": None, "version": None, "expires_at": 0.0}
+
+# Doctors kept in revenue_by_doctor, like get_revenue_by_doctor()
+TOP_DOCTORS = 10
+
+AGE_GROUP_SQL = """CASE
+    WHEN p.age BETWEEN 0 AND 18 THEN '0-18'
+    WHEN p.age BETWEEN 19 AND 35 THEN '19-35'
+    WHEN p.age BETWEEN 36 AND 60 THEN '36-60'
+    ELSE '60+'
+END"""
+
+# Branch of every fact aggregate in the grouping query: label expression and the alias of the
+# dimension it groups on (see aggregations.DIMENSION_JOINS)
+SNAPSHOT_BRANCHES = {
+    "totals": (None, None),
+    "revenue_by_disease": ("dis.disease_name", "dis"),
+    "revenue_by_doctor": ("doc.doctor_name", "doc"),
+    "specializations": ("doc.specialization", "doc"),
+    "revenue_by_hospital": ("h.hospital_name", "h"),
+    "visits_by_gender": ("p.gender", "p"),
+    "visits_by_age_group": (AGE_GROUP_SQL, "p"),
+    "revenue_by_insurance_type": ("b.insurance_type", "b"),
+    "hospital_visits_trend": ("DATE_FORMAT(f.visit_date, '%Y-%m')", None),
+}
+
+# The same groupings on the star engine (the trend comes from its monthly_trend kernel)
+SNAPSHOT_DIMENSIONS = {
+    "totals": (None, None),
+    "revenue_by_disease": ("disease_dim", "disease_name"),
+    "revenue_by_doctor": ("doctor_dim", "doctor_name"),
+    "specializations": ("doctor_dim", "specialization"),
+    "revenue_by_hospital": ("hospital_dim", "hospital_name"),
+    "visits_by_gender": ("patient_dim", "gender"),
+    "visits_by_age_group": ("patient_dim", "age_group"),
+    "revenue_by_insurance_type": ("billing_dim", "insurance_type"),
+}
+
+
+@dataclass
+class KpiSnapshot:
+    total_revenue: float
+    total_visits: int
+    total_patients: int
+    avg_revenue_per_visit: float
+    most_common_specialization: Optional[str]
+    revenue_by_disease: pd.DataFrame
+    revenue_by_doctor: pd.DataFrame
+    revenue_by_hospital: pd.DataFrame
+    visits_by_gender: pd.DataFrame
+    visits_by_age_group: pd.DataFrame
+    claim_status_breakdown: pd.DataFrame
+    revenue_by_insurance_type: pd.DataFrame
+    hospital_visits_trend: pd.DataFrame
+    computed_at: Optional[datetime] = None
+
+    def to_json(self):
+        payload = {}
+        for field in fields(self):
+            value = getattr(self, field.name)
+            if isinstance(value, pd.DataFrame):
+                value = {"columns": list(value.columns), "data": value.astype(object).values.tolist()}
+            payload[field.name] = value
+        return json.dumps(payload, default=str)
+
+    @classmethod
+    def from_json(cls, text):
+        payload = json.loads(text)
+        for name, value in payload.items():
+            if isinstance(value, dict) and "columns" in value:
+                payload[name] = pd.DataFrame(value["data"], columns=value["columns"])
+        if payload.get("computed_at"):
+            payload["computed_at"] = datetime.fromisoformat(payload["computed_at"])
+        return cls(**payload)
+
+
+def _labelled(totals, label, measure, column):
+    df = totals.rename(columns={"label": label, measure: column})[[label, column]]
+    return df.sort_values(label, ignore_index=True)
+
+
+def _build_snapshot(totals, total_patients, claim_status_breakdown):
+    """Assemble the snapshot from the (label, visits, bills, revenue) rows of every grouping."""
+    overall = totals["totals"]
+    total_revenue = float(overall["revenue"].sum())
+    bills = int(overall["bills"].sum())
+    specializations = totals["specializations"].sort_values("visits", ascending=False)
+    doctors = totals["revenue_by_doctor"].sort_values("revenue", ascending=False).head(TOP_DOCTORS)
+
+    return KpiSnapshot(
+        total_revenue=total_revenue,
+        total_visits=int(overall["visits"].sum()),
+        total_patients=int(total_patients),
+        avg_revenue_per_visit=total_revenue / bills if bills else None,
+        most_common_specialization=specializations["label"].iloc[0] if not specializations.empty else None,
+        revenue_by_disease=_labelled(totals["revenue_by_disease"], "disease_name", "revenue", "total_revenue"),
+        revenue_by_doctor=doctors.rename(columns={"label": "doctor_name", "revenue": "total_revenue"})[
+            ["doctor_name", "total_revenue"]].reset_index(drop=True),
+        revenue_by_hospital=_labelled(totals["revenue_by_hospital"], "hospital_name", "revenue", "total_revenue"),
+        visits_by_gender=_labelled(totals["visits_by_gender"], "gender", "visits", "total_visits"),
+        visits_by_age_group=_labelled(totals["visits_by_age_group"], "age_group", "visits", "total_visits"),
+        claim_status_breakdown=claim_status_breakdown.sort_values("claim_status", ignore_index=True),
+        revenue_by_insurance_type=_labelled(
+            totals["revenue_by_insurance_type"], "insurance_type", "revenue", "total_revenue"),
+        hospital_visits_trend=_labelled(totals["hospital_visits_trend"], "month", "visits", "total_visits"),
+        computed_at=datetime.now().replace(microsecond=0),
+    )
+
+
+def _star_snapshot():
+    star = get_star_engine()
+    if "age_group" not in star.dims["patient_dim"]:
+        star.derive("patient_dim", "age_group", age_groups(star.dims["patient_dim"]["age"]))
+    totals = {name: star.totals_by(*dimension) for name, dimension in SNAPSHOT_DIMENSIONS.items()}
+    trend = star.monthly_trend()
+    totals["hospital_visits_trend"] = pd.DataFrame({"label": trend.index, "visits": trend.to_numpy()})
+
+    claims = star.dims["billing_dim"].groupby("claim_status", as_index=False, dropna=False).agg(
+        total_claims=("billing_id", "count"))
+    return _build_snapshot(totals, len(star.uniques["patient_id"]), claims)
+
+
+@traced("kpi_snapshot")
+def compute_kpi_snapshot(engine="sql"):
+    """Evaluate every KPI server-side, in MySQL, or on the in-process star engine ("numpy")."""
+    if engine == "numpy":
+        return _star_snapshot()
+    totals = run_grouped(SNAPSHOT_BRANCHES, distinct=["totals"])
+    total_patients = totals["totals"]["patients"].sum()
+    return _build_snapshot(totals, total_patients, get_claim_status_breakdown())
+
+
+def save_kpi_snapshot(snapshot):
+    """Store the snapshot as the single row of kpi_snapshot and invalidate cached results."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {KPI_SNAPSHOT_TABLE} (
+                    id TINYINT PRIMARY KEY,
+                    computed_at DATETIME NOT NULL,
+                    payload LONGTEXT NOT NULL
+                )
+            """)
+            ensure_data_version_table(cursor)
+            cursor.execute(
+                f"REPLACE INTO {KPI_SNAPSHOT_TABLE} (id, computed_at, payload) VALUES (1, %s, %s)",
+                (snapshot.computed_at, snapshot.to_json())
+            )
+            bump_data_version(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def refresh_kpi_snapshot(engine="sql"):
+    """Recompute and persist the KPI snapshot; run after every fact load."""
+    snapshot = compute_kpi_snapshot(engine)
+    save_kpi_snapshot(snapshot)
+    print(f"📸 KPI snapshot refreshed at {snapshot.computed_at}")
+    return snapshot
+
+
+def _live_kpi_snapshot():
+    """Snapshot computed in-process when none is stored, kept like a cached query result."""
+    version = current_data_version()
+    with _live_lock:
+        if _live["snapshot"] is None or _live["version"] != version or time.monotonic() >= _live["expires_at"]:
+            _live.update(snapshot=compute_kpi_snapshot(), version=version, expires_at=time.monotonic() + CACHE_TTL)
+        return _live["snapshot"]
+
+
+def load_kpi_snapshot():
+    """Latest persisted KPI snapshot (one primary-key lookup), computed live if none is stored yet."""
+    try:
+        df = cached_query(f"SELECT payload FROM {KPI_SNAPSHOT_TABLE} WHERE id = 1")
+    except Exception as e:
+        print(f"⚠️ No stored KPI snapshot ({e}); computing one")
+        return _live_kpi_snapshot()
+    if df.empty:
+        # Always the case on the DuckDB backend, which never stores one
+        return _live_kpi_snapshot()
+    return KpiSnapshot.from_json(df["payload"][0])
+
+
 # Example of calling the functions
 if __name__ == "__main__":
+    if "--refresh-snapshot" in sys.argv:
+        refresh_kpi_snapshot(engine="numpy" if "--numpy" in sys.argv else "sql")
+
     print("Total Revenue: ", get_total_revenue())
     print("Revenue by Disease: \n", get_revenue_by_disease())
     print("Revenue by Doctor: \n", get_revenue_by_doctor())
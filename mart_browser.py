@@ -0,0 +1,122 @@
+import pandas as pd
+
+from datamart import MART_KEYS
+from query_cache import cached_query
+
+# Rows per page, and the most a single page may ever fetch
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Filter operators offered in the browser, as SQL templates on a validated column name
+FILTER_OPERATORS = {
+    "=": "{column} = %s",
+    "contains": "{column} LIKE CONCAT('%%', %s, '%%')",
+    ">=": "{column} >= %s",
+    "<=": "{column} <= %s",
+}
+
+
+def mart_columns(mart_name):
+    return list(cached_query(f"SHOW COLUMNS FROM {mart_name}")["Field"])
+
+
+def fetch_mart_page(mart_name, columns=None, sort_by=None, descending=False, filters=None,
+                    after=None, page_size=PAGE_SIZE):
+    """Fetch one page of a data mart, filtered, sorted and paginated on the server.
+
+    Pages are keyed on (sort column, mart key) rather than OFFSET, so every page costs the same
+    however deep it is. `after` is the cursor returned with the previous page. Returns the page
+    and the cursor of the next page (None on the last page).
+    """
+    _, key = MART_KEYS[mart_name]
+    available = mart_columns(mart_name)
+    columns = [c for c in (columns or available) if c in available]
+    sort_by = sort_by if sort_by in available else key
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+    where, params = [], []
+    for column, op, value in filters or []:
+        if column in available and op in FILTER_OPERATORS:
+            where.append(FILTER_OPERATORS[op].format(column=column))
+            params.append(value)
+
+    order = "DESC" if descending else "ASC"
+    if after is not None:
+        comparison = "<" if descending else ">"
+        if sort_by == key:
+            where.append(f"{key} {comparison} %s")
+            params.append(after[1])
+        elif after[0] is None:
+            # Already among the NULL sort values, which come last in either direction
+            where.append(f"{sort_by} IS NULL AND {key} {comparison} %s")
+            params.append(after[1])
+        else:
+            # A row-value comparison with a NULL is NULL, so the NULL rows are added explicitly
+            where.append(f"(({sort_by}, {key}) {comparison} (%s, %s) OR {sort_by} IS NULL)")
+            params.extend(after)
+
+    # The sort and key columns are always fetched so the next cursor can be built
+    select = list(dict.fromkeys(columns + [sort_by, key]))
+    query = f"SELECT {', '.join(select)} FROM {mart_name}"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    # Mart keys are never NULL; other columns are (LEFT JOINs leave dimension rows without visits
+    # at NULL), and those rows are put last so the cursor above can step past them
+    order_by = key if sort_by == key else f"{sort_by} IS NULL, {sort_by} {order}, {key}"
+    query += f" ORDER BY {order_by} {order} LIMIT {page_size + 1}"
+
+    page = cached_query(query, params)
+    next_cursor = None
+    if len(page) > page_size:
+        page = page.iloc[:page_size]
+        last = page.iloc[-1]
+        next_cursor = tuple(
+            None if pd.isna(v) else v.item() if hasattr(v, "item") else v for v in (last[sort_by], last[key])
+        )
+    return page[columns] if not page.empty else page, next_cursor
+
+
+def render_mart_browser(mart_name):
+    """Streamlit widget that pages through a data mart instead of loading all of it."""
+    # Imported here so fetch_mart_page() can be used (and tested) without the dashboard stack
+    import streamlit as st
+
+    available = mart_columns(mart_name)
+    _, key = MART_KEYS[mart_name]
+
+    with st.expander("Columns, sorting and filters"):
+        columns = st.multiselect("Columns", available, default=available, key=f"{mart_name}_columns")
+        sort_by = st.selectbox("Sort by", available, index=available.index(key), key=f"{mart_name}_sort")
+        descending = st.checkbox("Descending", key=f"{mart_name}_desc")
+        filter_column = st.selectbox("Filter column", ["(none)"] + available, key=f"{mart_name}_fcol")
+        filter_op = st.selectbox("Operator", list(FILTER_OPERATORS), key=f"{mart_name}_fop")
+        filter_value = st.text_input("Value", key=f"{mart_name}_fval")
+        page_size = st.number_input(
+            "Rows per page", min_value=1, max_value=MAX_PAGE_SIZE, value=PAGE_SIZE, key=f"{mart_name}_size"
+        )
+
+    filters = []
+    if filter_column != "(none)" and filter_value:
+        filters.append((filter_column, filter_op, filter_value))
+
+    # Cursors of the pages visited so far; start over whenever the query itself changes
+    signature = (tuple(columns), sort_by, descending, tuple(filters), page_size)
+    state = st.session_state
+    if state.get(f"{mart_name}_signature") != signature:
+        state[f"{mart_name}_signature"] = signature
+        state[f"{mart_name}_cursors"] = [None]
+    cursors = state[f"{mart_name}_cursors"]
+
+    page, next_cursor = fetch_mart_page(
+        mart_name, columns, sort_by, descending, filters, after=cursors[-1], page_size=int(page_size)
+    )
+    st.dataframe(page)
+
+    previous_col, info_col, next_col = st.columns([1, 2, 1])
+    if previous_col.button("⬅️ Previous", disabled=len(cursors) == 1, key=f"{mart_name}_prev"):
+        cursors.pop()
+        st.rerun()
+    info_col.write(f"Page {len(cursors)}")
+    if next_col.button("Next ➡️", disabled=next_cursor is None, key=f"{mart_name}_next"):
+        cursors.append(next_cursor)
+        st.rerun()
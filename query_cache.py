@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pymysql
+
+import duckdb_backend
+from db import DB_BACKEND, get_connection, run_query
+from query_profiler import normalize_sql
+from watermarks import get_data_version
+
+# Seconds a cached result may be served before it is re-queried
+CACHE_TTL = 300
+
+# Upper bound on the memory held by cached results; least recently used entries go first
+CACHE_MAX_BYTES = 256 * 2**20
+
+# How often the data-version token is re-read; a load becomes visible within this many seconds
+VERSION_CHECK_INTERVAL = 2
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # key -> (result, data version, expiry time, size in bytes)
+_cache_bytes = 0
+_version = {"value": None, "checked_at": 0.0}
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def current_data_version():
+    """The loaders' data-version token, re-read from MySQL at most every VERSION_CHECK_INTERVAL."""
+    now = time.monotonic()
+    if _version["value"] is None or now - _version["checked_at"] >= VERSION_CHECK_INTERVAL:
+        if DB_BACKEND == "duckdb":
+            # Nothing is loaded into the embedded database; a rerun of clean.py rewrites its files instead
+            _version["value"] = duckdb_backend.source_version()
+        else:
+            conn = get_connection()
+            try:
+                with conn.cursor() as cursor:
+                    _version["value"] = get_data_version(cursor)
+            except pymysql.err.ProgrammingError:
+                # Nothing has been loaded since the version table was introduced
+                _version["value"] = 0
+            finally:
+                conn.close()
+        _version["checked_at"] = now
+    return _version["value"]
+
+
+def _evict(key):
+    global _cache_bytes
+    _cache_bytes -= _cache.pop(key)[3]
+
+
+def cached_query(query, params=None, ttl=CACHE_TTL):
+    """run_query() with an in-process result cache keyed by normalized SQL and parameters.
+
+    Entries expire after `ttl` seconds and as soon as a loader bumps the data version.
+    """
+    global _cache_bytes
+    key = (normalize_sql(query), tuple(params) if params is not None else None)
+    version = current_data_version()
+    now = time.monotonic()
+
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            result, entry_version, expires_at, _ = entry
+            if entry_version == version and now < expires_at:
+                _cache.move_to_end(key)
+                _stats["hits"] += 1
+                return result.copy()
+            _evict(key)
+        _stats["misses"] += 1
+
+    result = run_query(query, params)
+    size = int(result.memory_usage(deep=True).sum())
+
+    with _lock:
+        if key in _cache:
+            _evict(key)
+        if size <= CACHE_MAX_BYTES:
+            _cache[key] = (result, version, now + ttl, size)
+            _cache_bytes += size
+            while _cache_bytes > CACHE_MAX_BYTES:
+                _evict(next(iter(_cache)))
+                _stats["evictions"] += 1
+    return result.copy()
+
+
+def clear_cache():
+    global _cache_bytes
+    with _lock:
+        _cache.clear()
+        _cache_bytes = 0
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats, entries=len(_cache), bytes=_cache_bytes, data_version=_version["value"])
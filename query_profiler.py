@@ -0,0 +1,168 @@
+import bisect
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Query-level profiling for the shared query path (db.run_query, aggregations.run_query): every
+# statement is timed in two parts, execute (server work until the first result) and fetch (moving
+# the rows to the client), and attributed to the dashboard or script line that asked for it.
+# Queries slower than SLOW_QUERY_SECONDS also go to a JSON-lines slow-query log, with their
+# EXPLAIN plan when EXPLAIN_SLOW_QUERIES is set.
+
+QUERY_PROFILING = os.getenv("query_profiling", "1") == "1"
+SLOW_QUERY_SECONDS = float(os.getenv("slow_query_seconds", 0.5))
+EXPLAIN_SLOW_QUERIES = os.getenv("explain_slow_queries", "0") == "1"
+SLOW_QUERY_LOG = os.getenv("slow_query_log", "slow_queries.jsonl")
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Latencies kept per query for the percentiles, and slow queries kept in memory for the dashboard
+LATENCY_SAMPLES = 500
+RECENT_SLOW_QUERIES = 100
+
+# Frames in these files are plumbing; a query is attributed to the first frame outside them
+PLUMBING_FILES = {
+    "db.py", "query_cache.py", "query_profiler.py", "instrumentation.py", "duckdb_backend.py", "chart_data.py",
+    "mart_browser.py", "kpis.py", "aggregations.py", "functools.py", "contextlib.py",
+}
+
+_lock = threading.Lock()
+_stats = {}
+_slow = deque(maxlen=RECENT_SLOW_QUERIES)
+
+
+def normalize_sql(query):
+    """Collapse whitespace and trailing semicolons so formatting differences count as one query."""
+    return re.sub(r"\s+", " ", query).strip().rstrip(";").strip()
+
+
+def _caller():
+    frame = sys._getframe(2)
+    while frame is not None and os.path.basename(frame.f_code.co_filename) in PLUMBING_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} ({frame.f_code.co_name})"
+
+
+def explain(cursor, query, params=None):
+    try:
+        cursor.execute("EXPLAIN " + query, params)
+        return cursor.fetchall()
+    except Exception as e:  # the plan is best effort; never fail the query over it
+        return f"EXPLAIN failed: {e}"
+
+
+def record(query, params, caller, execute_seconds, fetch_seconds, rows, cursor=None):
+    seconds = execute_seconds + fetch_seconds
+    key = (caller, normalize_sql(query))
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            entry = _stats[key] = {
+                "calls": 0, "rows": 0, "execute_seconds": 0.0, "fetch_seconds": 0.0, "max_seconds": 0.0,
+                "slow": 0, "histogram": [0] * (len(LATENCY_BUCKETS) + 1),
+                "samples": deque(maxlen=LATENCY_SAMPLES),
+            }
+        entry["calls"] += 1
+        entry["rows"] += rows
+        entry["execute_seconds"] += execute_seconds
+        entry["fetch_seconds"] += fetch_seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        entry["histogram"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        entry["samples"].append(seconds)
+        entry["last_seen"] = datetime.now().replace(microsecond=0)
+        if seconds >= SLOW_QUERY_SECONDS:
+            entry["slow"] += 1
+
+    if seconds < SLOW_QUERY_SECONDS:
+        return
+    slow = {
+        "at": datetime.now().replace(microsecond=0).isoformat(),
+        "caller": caller,
+        "seconds": round(seconds, 6),
+        "execute_seconds": round(execute_seconds, 6),
+        "fetch_seconds": round(fetch_seconds, 6),
+        "rows": rows,
+        "query": normalize_sql(query),
+        "params": None if params is None else [str(p) for p in params],
+    }
+    if EXPLAIN_SLOW_QUERIES and cursor is not None:
+        slow["plan"] = explain(cursor, query, params)
+    with _lock:
+        _slow.append(slow)
+        with open(SLOW_QUERY_LOG, "a") as f:
+            f.write(json.dumps(slow, default=str) + "\n")
+    print(f"🐢 Slow query ({seconds:.2f}s, {rows:,} rows) from {caller}")
+
+
+def run_profiled(cursor, query, params, fetch):
+    """Execute `query` on `cursor`, fetch its result with `fetch(cursor)` and record both timings."""
+    if not QUERY_PROFILING:
+        cursor.execute(query, params)
+        return fetch(cursor)
+    caller = _caller()
+    start = time.perf_counter()
+    cursor.execute(query, params)
+    executed = time.perf_counter()
+    result = fetch(cursor)
+    fetched = time.perf_counter()
+    record(query, params, caller, executed - start, fetched - executed, len(result), cursor)
+    return result
+
+
+def profile_stats():
+    """One row per (caller, query): call count, latency percentiles, execute vs fetch time and rows."""
+    with _lock:
+        entries = [(key, dict(entry, samples=list(entry["samples"]))) for key, entry in _stats.items()]
+    rows = []
+    for (caller, query), entry in entries:
+        total = entry["execute_seconds"] + entry["fetch_seconds"]
+        rows.append({
+            "caller": caller,
+            "query": query,
+            "calls": entry["calls"],
+            "total_ms": 1000 * total,
+            "mean_ms": 1000 * total / entry["calls"],
+            "p50_ms": 1000 * np.percentile(entry["samples"], 50),
+            "p95_ms": 1000 * np.percentile(entry["samples"], 95),
+            "max_ms": 1000 * entry["max_seconds"],
+            "execute_share": entry["execute_seconds"] / total if total else None,
+            "rows_per_call": entry["rows"] / entry["calls"],
+            "slow": entry["slow"],
+            "last_seen": entry["last_seen"],
+        })
+    columns = ["caller", "query", "calls", "total_ms", "mean_ms", "p50_ms", "p95_ms", "max_ms",
+               "execute_share", "rows_per_call", "slow", "last_seen"]
+    return pd.DataFrame(rows, columns=columns).sort_values("total_ms", ascending=False, ignore_index=True)
+
+
+def latency_histogram(caller=None, query=None):
+    """Call counts per latency bucket, for one (caller, query) or summed over all of them."""
+    counts = np.zeros(len(LATENCY_BUCKETS) + 1, dtype=int)
+    with _lock:
+        for (entry_caller, entry_query), entry in _stats.items():
+            if caller in (None, entry_caller) and query in (None, entry_query):
+                counts += entry["histogram"]
+    labels = [f"≤{1000 * bound:g} ms" for bound in LATENCY_BUCKETS] + [f">{1000 * LATENCY_BUCKETS[-1]:g} ms"]
+    return pd.Series(counts, index=pd.Index(labels, name="latency"), name="calls")
+
+
+def slow_queries():
+    with _lock:
+        return list(_slow)
+
+
+def reset_profile():
+    with _lock:
+        _stats.clear()
+        _slow.clear()
@@ -0,0 +1,104 @@
+# Star-schema table definitions shared by the cleaning, storage and loading scripts.
+#
+# Logical column types:
+#   uuid     - 36-character identifier
+#   category - low-cardinality text (dictionary-encoded in Parquet)
+#   string   - free text
+#   int / float / date
+
+STAR_SCHEMA = {
+    "hospital_visits_fact": {
+        "visit_id": "uuid",
+        "patient_id": "uuid",
+        "disease_id": "uuid",
+        "billing_id": "uuid",
+        "visit_date": "date",
+        "hospital_id": "uuid",
+        "doctor_id": "uuid",
+        "total_bill": "float",
+    },
+    "patient_dim": {
+        "patient_id": "uuid",
+        "name": "string",
+        "age": "int",
+        "gender": "category",
+        "location": "string",
+        "blood_type": "category",
+        "weight": "float",
+        "height": "float",
+        "smoker_status": "category",
+        "alcohol_consumption": "category",
+        "exercise_frequency": "category",
+    },
+    "disease_dim": {
+        "disease_id": "uuid",
+        "disease_name": "category",
+        "category": "category",
+        "severity_level": "category",
+    },
+    "doctor_dim": {
+        "doctor_id": "uuid",
+        "doctor_name": "string",
+        "specialization": "category",
+        "years_of_experience": "int",
+    },
+    "hospital_dim": {
+        "hospital_id": "uuid",
+        "hospital_name": "string",
+        "city": "string",
+        "type": "category",
+    },
+    "billing_dim": {
+        "billing_id": "uuid",
+        "total_bill": "float",
+        "insurance_type": "category",
+        "claim_status": "category",
+        "payment_method": "category",
+    },
+}
+
+# Primary key of each table
+PRIMARY_KEYS = {
+    "hospital_visits_fact": "visit_id",
+    "patient_dim": "patient_id",
+    "disease_dim": "disease_id",
+    "doctor_dim": "doctor_id",
+    "hospital_dim": "hospital_id",
+    "billing_dim": "billing_id",
+}
+
+
+def columns_of(table_name, logical_type):
+    return [column for column, kind in STAR_SCHEMA[table_name].items() if kind == logical_type]
+
+
+# Compact pandas dtypes used when a table is loaded into memory (see storage.read_table): text that
+# repeats becomes categorical codes, unique identifiers and free text Arrow-backed strings
+PANDAS_DTYPES = {
+    "uuid": "string[pyarrow]",
+    "category": "category",
+    "string": "string[pyarrow]",
+    "int": "int32",
+    "float": "float64",
+    "date": "datetime64[ns]",
+}
+
+# Columns whose values allow a narrower dtype than their logical type
+COLUMN_DTYPES = {
+    "hospital_visits_fact": {
+        # Foreign keys repeat on every visit: store each UUID once plus a small integer code per row
+        "patient_id": "category",
+        "disease_id": "category",
+        "billing_id": "category",
+        "hospital_id": "category",
+        "doctor_id": "category",
+    },
+    "patient_dim": {"age": "int8", "weight": "float32", "height": "float32"},
+    "doctor_dim": {"years_of_experience": "int8"},
+}
+
+
+def pandas_dtypes(table_name):
+    dtypes = {column: PANDAS_DTYPES[kind] for column, kind in STAR_SCHEMA[table_name].items()}
+    dtypes.update(COLUMN_DTYPES.get(table_name, {}))
+    return dtypes
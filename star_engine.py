@@ -0,0 +1,222 @@
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from schema import PRIMARY_KEYS
+from storage import read_table
+
+# In-process star-schema engine over NumPy arrays: every fact foreign key (and the visit month)
+# is held as an integer code per visit, dimension attributes as categorical codes per dimension
+# row, and aggregates are np.bincount passes over those codes, with no SQL and no joins.
+
+FACT_TABLE = "hospital_visits_fact"
+
+# Fact foreign key -> dimension table it references
+FOREIGN_KEYS = {
+    "patient_id": "patient_dim",
+    "disease_id": "disease_dim",
+    "billing_id": "billing_dim",
+    "hospital_id": "hospital_dim",
+    "doctor_id": "doctor_dim",
+}
+
+# Group-key combinations with at most this many slots are counted densely with one bincount;
+# larger ones are first compacted with np.unique
+DENSE_GROUP_LIMIT = 2**24
+
+
+class StarEngine:
+    def __init__(self, fact, dims):
+        self.dims = {dim: df.drop_duplicates(PRIMARY_KEYS[dim]).reset_index(drop=True) for dim, df in dims.items()}
+        self.visits = len(fact)
+
+        bill = fact["total_bill"].to_numpy(dtype="float64", na_value=np.nan)
+        self.has_bill = ~np.isnan(bill)
+        self.bill = np.where(self.has_bill, bill, 0.0)
+
+        # Per key: the code of every visit (-1 for NULL) and the distinct values the codes index
+        self.codes, self.uniques = {}, {}
+        for key in FOREIGN_KEYS:
+            codes, uniques = pd.factorize(fact[key])
+            self.codes[key], self.uniques[key] = codes.astype("int32"), np.asarray(uniques, dtype=object)
+        months = pd.to_datetime(fact["visit_date"]).to_numpy().astype("datetime64[M]")
+        codes, uniques = pd.factorize(months)
+        self.codes["month"] = codes.astype("int32")
+        self.uniques["month"] = np.asarray(pd.DatetimeIndex(uniques).strftime("%Y-%m"), dtype=object)
+
+        # Dimension row of every visit, per foreign key (-1 for NULL keys and keys the dimension lacks)
+        self.dim_rows = {}
+        for key, dim in FOREIGN_KEYS.items():
+            rows = pd.Index(self.dims[dim][key]).get_indexer(self.uniques[key]).astype("int32")
+            self.dim_rows[key] = np.where(self.codes[key] >= 0, rows[self.codes[key]], -1)
+        self._attributes = {}
+        self._visit_attributes = {}
+
+    @classmethod
+    def from_files(cls):
+        """Load the star schema from the cleaned_* Parquet/CSV files written by clean.py."""
+        fact = read_table(FACT_TABLE, columns=[*FOREIGN_KEYS, "visit_date", "total_bill"])
+        return cls(fact, {dim: read_table(dim) for dim in FOREIGN_KEYS.values()})
+
+    # --- Dimension attributes ---
+
+    def derive(self, dim, name, values):
+        """Add a computed attribute (an age group, say) to a dimension so it can be grouped on."""
+        self.dims[dim] = self.dims[dim].assign(**{name: values})
+        self._attributes.pop((dim, name), None)
+        self._visit_attributes.pop((dim, name), None)
+
+    def _attribute(self, dim, attribute):
+        """Categorical codes of a dimension attribute per dimension row; NULL is a category too."""
+        if (dim, attribute) not in self._attributes:
+            codes, labels = pd.factorize(self.dims[dim][attribute], use_na_sentinel=False)
+            self._attributes[(dim, attribute)] = codes, labels
+        return self._attributes[(dim, attribute)]
+
+    def _visit_groups(self, dim, attribute):
+        """Attribute code of every visit that joins to `dim`, and the mask of those visits."""
+        if (dim, attribute) not in self._visit_attributes:
+            rows = self.dim_rows[PRIMARY_KEYS[dim]]
+            joined = rows >= 0
+            attribute_codes, labels = self._attribute(dim, attribute)
+            self._visit_attributes[(dim, attribute)] = attribute_codes[rows[joined]], labels, joined
+        return self._visit_attributes[(dim, attribute)]
+
+    # --- Kernels ---
+
+    def total_revenue(self):
+        return float(self.bill.sum())
+
+    def total_visits(self):
+        return self.visits
+
+    def avg_revenue_per_visit(self):
+        bills = int(self.has_bill.sum())
+        return self.total_revenue() / bills if bills else None
+
+    def revenue_by(self, dim, attribute):
+        """SUM(total_bill) per value of a dimension attribute (inner join, like the SQL)."""
+        groups, labels, joined = self._visit_groups(dim, attribute)
+        sums = np.bincount(groups, weights=self.bill[joined], minlength=len(labels))
+        return pd.Series(sums, index=pd.Index(labels, name=attribute), name="total_revenue")
+
+    def visits_by(self, dim, attribute):
+        """Visit count per value of a dimension attribute."""
+        groups, labels, _ = self._visit_groups(dim, attribute)
+        counts = np.bincount(groups, minlength=len(labels))
+        return pd.Series(counts, index=pd.Index(labels, name=attribute), name="total_visits")
+
+    def totals_by(self, dim=None, attribute=None):
+        """Visits, non-null bills and revenue per value of a dimension attribute (one row when None).
+
+        Same columns as a branch of aggregations.grouping_query, so the rollups work on either engine.
+        """
+        if dim is None:
+            return pd.DataFrame({
+                "label": [None], "visits": [self.visits], "bills": [int(self.has_bill.sum())],
+                "revenue": [self.total_revenue()],
+            })
+        groups, labels, joined = self._visit_groups(dim, attribute)
+        totals = pd.DataFrame({
+            "label": labels,
+            "visits": np.bincount(groups, minlength=len(labels)),
+            "bills": np.bincount(groups, weights=self.has_bill[joined], minlength=len(labels)).astype("int64"),
+            "revenue": np.bincount(groups, weights=self.bill[joined], minlength=len(labels)),
+        })
+        # Attribute values no visit joins to are left out, like the SQL inner join
+        return totals[totals["visits"] > 0].reset_index(drop=True)
+
+    def monthly_trend(self):
+        """Visits per 'YYYY-MM' month, in month order; visits without a date come last."""
+        codes = self.codes["month"]
+        labels = np.append(self.uniques["month"], None)
+        counts = np.bincount(np.where(codes >= 0, codes, len(labels) - 1), minlength=len(labels))
+        # 'YYYY-MM' labels sort in month order; the NULL slot stays last and is dropped when empty
+        order = np.append(np.argsort(self.uniques["month"], kind="stable"), len(labels) - 1)
+        order = order[(counts[order] > 0) | (order < len(labels) - 1)]
+        return pd.Series(counts[order], index=pd.Index(labels[order], name="month"), name="total_visits")
+
+    # --- Grouped fact scan ---
+
+    def fact_parts(self, keys):
+        """Visits, non-null bills and revenue per combination of `keys`.
+
+        The in-process stand-in for grouping the fact table by `keys`; the COUNT(DISTINCT) metrics
+        of aggregations.METRICS are computed from it.
+        """
+        if not keys:
+            return pd.DataFrame({
+                "visits": [self.visits], "bills": [int(self.has_bill.sum())], "revenue": [self.total_revenue()],
+            })
+
+        # NULL goes in an extra slot after each key's distinct values
+        sizes = [len(self.uniques[key]) + 1 for key in keys]
+        codes = [np.where(self.codes[key] >= 0, self.codes[key], size - 1) for key, size in zip(keys, sizes)]
+        slots = int(np.prod(sizes, dtype=object))
+
+        if slots <= DENSE_GROUP_LIMIT:
+            combined = np.ravel_multi_index(codes, sizes)
+            visits = np.bincount(combined, minlength=slots)
+            groups = np.flatnonzero(visits)
+            visits = visits[groups]
+            bills = np.bincount(combined, weights=self.has_bill, minlength=slots)[groups]
+            revenue = np.bincount(combined, weights=self.bill, minlength=slots)[groups]
+            group_codes = np.unravel_index(groups, sizes)
+        else:
+            unique_codes, inverse = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            visits = np.bincount(inverse)
+            bills = np.bincount(inverse, weights=self.has_bill)
+            revenue = np.bincount(inverse, weights=self.bill)
+            group_codes = unique_codes.T
+
+        parts = {key: np.append(self.uniques[key], None)[group] for key, group in zip(keys, group_codes)}
+        parts.update(visits=visits, bills=bills.astype("int64"), revenue=revenue)
+        return pd.DataFrame(parts)
+
+
+_lock = threading.Lock()
+_engine = None
+
+
+def age_groups(age):
+    """Bucket ages like the SQL CASE in kpis.py; a missing age falls through to "60+" there too."""
+    masks = [age.between(low, high).fillna(False).to_numpy(bool) for low, high in ((0, 18), (19, 35), (36, 60))]
+    return np.select(masks, ["0-18", "19-35", "36-60"], "60+")
+
+
+def get_star_engine(reload=False):
+    """The process-wide engine, loaded from the cleaned files on first use (or when `reload`)."""
+    global _engine
+    with _lock:
+        if _engine is None or reload:
+            _engine = StarEngine.from_files()
+    return _engine
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    engine = get_star_engine()
+    print(f"📦 Loaded {engine.total_visits():,} visits in {time.perf_counter() - start:.2f}s")
+
+    engine.derive("patient_dim", "age_group", age_groups(engine.dims["patient_dim"]["age"]))
+    kernels = {
+        "Total Revenue": engine.total_revenue,
+        "Average Revenue per Visit": engine.avg_revenue_per_visit,
+        "Revenue by Hospital": lambda: engine.revenue_by("hospital_dim", "hospital_name"),
+        "Revenue by Disease": lambda: engine.revenue_by("disease_dim", "disease_name"),
+        "Revenue by Doctor": lambda: engine.revenue_by("doctor_dim", "doctor_name"),
+        "Revenue by Insurance Type": lambda: engine.revenue_by("billing_dim", "insurance_type"),
+        "Visits by Gender": lambda: engine.visits_by("patient_dim", "gender"),
+        "Visits by Age Group": lambda: engine.visits_by("patient_dim", "age_group"),
+        "Hospital Visits Trend": engine.monthly_trend,
+    }
+    for label, kernel in kernels.items():
+        start = time.perf_counter()
+        result = kernel()
+        print(f"⏱️ {label}: {1000 * (time.perf_counter() - start):.3f} ms")
+        if "-v" in sys.argv:
+            print(result)
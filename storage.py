@@ -0,0 +1,277 @@
+import argparse
+import operator
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import add_bytes_read
+from schema import STAR_SCHEMA, columns_of, pandas_dtypes
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional; CSV is always written
+    pa = ds = pq = None
+
+DATA_DIR = "."
+
+ARROW_TYPES = {
+    "uuid": "string",
+    "category": "string",
+    "string": "string",
+    "int": "int64",
+    "float": "float64",
+    "date": "date32",
+}
+
+
+# Tables whose Parquet output is split into year=YYYY/month=M directories on a date column, so
+# date-filtered reads only open the months they need
+PARTITIONED_TABLES = {
+    "hospital_visits_fact": "visit_date",
+}
+
+
+def table_path(table_name, fmt):
+    return os.path.join(DATA_DIR, f"cleaned_{table_name}.{fmt}")
+
+
+def partition_dir(table_name):
+    return os.path.join(DATA_DIR, f"cleaned_{table_name}")
+
+
+def hive_partitioning():
+    return ds.partitioning(pa.schema([("year", pa.int16()), ("month", pa.int8())]), flavor="hive")
+
+
+def parquet_available():
+    return pq is not None
+
+
+def arrow_schema(table_name):
+    return pa.schema([
+        (column, pa.type_for_alias(ARROW_TYPES[kind])) for column, kind in STAR_SCHEMA[table_name].items()
+    ])
+
+
+def dictionary_columns(table_name):
+    """UUID and category columns repeat heavily, so store them dictionary-encoded."""
+    return columns_of(table_name, "uuid") + columns_of(table_name, "category")
+
+
+class TableWriter:
+    """Writes one star-schema table chunk by chunk as CSV and, when pyarrow is installed, Parquet."""
+
+    def __init__(self, table_name, formats=("csv", "parquet")):
+        self.table_name = table_name
+        self.formats = [fmt for fmt in formats if fmt != "parquet" or parquet_available()]
+        self.partition_column = PARTITIONED_TABLES.get(table_name)
+        self.csv_started = False
+        self.parquet_writer = None
+        self.partition_writers = {}  # (year, month) -> ParquetWriter
+
+        # read_table prefers Parquet, so never leave a stale copy next to fresh output
+        if self.partition_column is not None or "parquet" not in self.formats:
+            if os.path.exists(table_path(table_name, "parquet")):
+                os.remove(table_path(table_name, "parquet"))
+        if os.path.isdir(partition_dir(table_name)):
+            shutil.rmtree(partition_dir(table_name))
+
+    def write(self, df):
+        if "csv" in self.formats:
+            df.to_csv(
+                table_path(self.table_name, "csv"),
+                mode="a" if self.csv_started else "w", header=not self.csv_started, index=False
+            )
+            self.csv_started = True
+
+        if "parquet" in self.formats:
+            schema = arrow_schema(self.table_name)
+            dates = {column: pd.to_datetime(df[column]) for column in columns_of(self.table_name, "date")}
+            df = df.assign(**dates)
+            if self.partition_column is not None:
+                self.write_partitions(df, schema)
+                return
+            table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = self.open_parquet(table_path(self.table_name, "parquet"), schema)
+            self.parquet_writer.write_table(table)
+
+    def open_parquet(self, path, schema):
+        return pq.ParquetWriter(path, schema, use_dictionary=dictionary_columns(self.table_name), compression="zstd")
+
+    def write_partitions(self, df, schema):
+        """Append each row to the file of its year/month partition (rows without a date go to year=0)."""
+        dates = df[self.partition_column]
+        years = dates.dt.year.fillna(0).astype(int)
+        months = dates.dt.month.fillna(0).astype(int)
+        for (year, month), rows in df.groupby([years, months], sort=False):
+            writer = self.partition_writers.get((year, month))
+            if writer is None:
+                directory = os.path.join(partition_dir(self.table_name), f"year={year}", f"month={month}")
+                os.makedirs(directory, exist_ok=True)
+                writer = self.open_parquet(os.path.join(directory, "part-0.parquet"), schema)
+                self.partition_writers[(year, month)] = writer
+            writer.write_table(pa.Table.from_pandas(rows, schema=schema, preserve_index=False))
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        for writer in self.partition_writers.values():
+            writer.close()
+
+
+# Comparison operators accepted in read_table filters (same spelling as pyarrow)
+FILTER_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# Rows per chunk when a filtered read has to fall back to CSV
+CSV_CHUNK_SIZE = 500_000
+
+
+def read_table(table_name, columns=None, filters=None, compact=True):
+    """Load a cleaned table, reading only `columns`, from Parquet when present and CSV otherwise.
+
+    `filters` is a list of (column, op, value) predicates that must all hold, e.g.
+    [("visit_date", ">=", "2024-01-01")]. Parquet row groups that cannot match are skipped.
+    Columns come back in the compact dtypes of schema.pandas_dtypes unless `compact` is False.
+    """
+    df = _read_table(table_name, columns, filters)
+    return compact_dtypes(df, table_name) if compact else df
+
+
+def _read_table(table_name, columns=None, filters=None):
+    date_columns = columns_of(table_name, "date")
+    filters = [
+        (column, op, pd.Timestamp(value) if column in date_columns else value)
+        for column, op, value in filters or []
+    ]
+
+    if parquet_available() and os.path.isdir(partition_dir(table_name)):
+        return read_partitioned(table_name, columns, filters)
+
+    parquet_path = table_path(table_name, "parquet")
+    if parquet_available() and os.path.exists(parquet_path):
+        categories = [c for c in columns_of(table_name, "category") if columns is None or c in columns]
+        arrow_filters = [
+            (column, op, value.date() if column in date_columns else value) for column, op, value in filters
+        ]
+        add_bytes_read(os.path.getsize(parquet_path))
+        table = pq.read_table(
+            parquet_path, columns=columns, filters=arrow_filters or None, read_dictionary=categories
+        )
+        return table.to_pandas(date_as_object=False)
+
+    wanted = columns or list(STAR_SCHEMA[table_name])
+    dates = [c for c in date_columns if c in wanted or any(c == f[0] for f in filters)]
+    path = table_path(table_name, "csv")
+    add_bytes_read(os.path.getsize(path))
+    if not filters:
+        return pd.read_csv(path, usecols=columns, parse_dates=dates)
+
+    usecols = None if columns is None else list(dict.fromkeys(columns + [f[0] for f in filters]))
+    chunks = []
+    for chunk in pd.read_csv(path, usecols=usecols, parse_dates=dates, chunksize=CSV_CHUNK_SIZE):
+        mask = pd.Series(True, index=chunk.index)
+        for column, op, value in filters:
+            mask &= FILTER_OPERATORS[op](chunk[column], value)
+        chunks.append(chunk.loc[mask, wanted])
+    return pd.concat(chunks, ignore_index=True)
+
+
+def partition_filter(column, op, value):
+    """Predicate on the year/month partition keys implied by a filter on the partitioning date.
+
+    It only ever keeps more months than the date filter itself, so it is safe to AND in; whole
+    year=/month= directories that fail it are never opened.
+    """
+    year, month = ds.field("year"), ds.field("month")
+    value = pd.Timestamp(value)
+    if op in ("<", "<="):
+        return (year < value.year) | ((year == value.year) & (month <= value.month))
+    if op in (">", ">="):
+        return (year > value.year) | ((year == value.year) & (month >= value.month))
+    if op == "==":
+        return (year == value.year) & (month == value.month)
+    return None
+
+
+def read_partitioned(table_name, columns=None, filters=()):
+    """read_table() for a year/month partitioned Parquet directory, pruning partitions on date filters."""
+    dataset = ds.dataset(partition_dir(table_name), format="parquet", partitioning=hive_partitioning())
+    date_columns = columns_of(table_name, "date")
+    partition_column = PARTITIONED_TABLES[table_name]
+
+    expression = None
+    for column, op, value in filters:
+        predicates = [FILTER_OPERATORS[op](ds.field(column), value.date() if column in date_columns else value)]
+        if column == partition_column:
+            predicates.append(partition_filter(column, op, value))
+        for predicate in predicates:
+            if predicate is not None:
+                expression = predicate if expression is None else expression & predicate
+
+    add_bytes_read(sum(os.path.getsize(fragment.path) for fragment in dataset.get_fragments(filter=expression)))
+    table = dataset.to_table(columns=columns or list(STAR_SCHEMA[table_name]), filter=expression)
+    return table.to_pandas(date_as_object=False)
+
+
+def compact_dtypes(df, table_name):
+    """Convert a loaded table to its compact dtypes (see schema.pandas_dtypes).
+
+    Integer columns holding missing values get the nullable dtype of the same width, and a column
+    whose values do not fit its narrow dtype is left as it is.
+    """
+    converted = {}
+    for column, dtype in pandas_dtypes(table_name).items():
+        if column not in df or df[column].dtype == dtype:
+            continue
+        if dtype == "string[pyarrow]" and pa is None:
+            continue
+        if dtype.startswith("int"):
+            values = df[column].dropna()
+            info = np.iinfo(dtype)
+            if not values.empty and (values.min() < info.min or values.max() > info.max):
+                continue
+            if len(values) < len(df):
+                dtype = dtype.capitalize()
+        converted[column] = dtype
+    return df.astype(converted) if converted else df
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def memory_report(table_names=STAR_SCHEMA):
+    """In-memory size of every cleaned table as pandas infers it from the CSV vs in compact dtypes."""
+    rows = []
+    for table_name in table_names:
+        before = pd.read_csv(table_path(table_name, "csv"))
+        after = read_table(table_name)
+        rows.append({
+            "table": table_name,
+            "rows": len(after),
+            "default_mb": round(memory_mb(before), 2),
+            "compact_mb": round(memory_mb(after), 2),
+            "ratio": round(memory_mb(before) / memory_mb(after), 1) if len(after) else None,
+        })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the in-memory footprint of the cleaned tables.")
+    parser.add_argument("tables", nargs="*", default=list(STAR_SCHEMA))
+    args = parser.parse_args()
+
+    print("🧠 Memory per table, default dtypes vs compact dtypes:")
+    print(memory_report(args.tables).to_string(index=False))
@@ -1,54 +1,30 @@
 import streamlit as st
 import matplotlib.pyplot as plt
 import seaborn as sns
-import pymysql
-import pandas as pd
 
 # --- Database Connection ---
-def connect_db():
-    return pymysql.connect(
-        host="localhost",
-        user="root",
-        password="root",
-        database="healthcare",
-        cursorclass=pymysql.cursors.DictCursor
-    )
-
-# Function to execute SQL query
-def run_query(query):
-    conn = connect_db()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(query)
-            result = pd.DataFrame(cursor.fetchall())
-        return result
-    finally:
-        conn.close()
+# Queries run on the shared connection pool (see db.py) through an in-process result cache
+# (see query_cache.py); both live for the whole Streamlit process, so reruns and other
+# sessions are served from memory until the TTL expires or a loader bumps the data version
+from query_cache import cached_query
+# Charts are rendered once per data version and served as cached images (see figure_cache.py)
+from figure_cache import show_figure
+from kpis import load_kpi_snapshot
 
 
 # --- KPI Functions ---
+# Served from the precomputed KPI snapshot (see kpis.py): one primary-key lookup per page
 def get_total_revenue():
-    query = "SELECT SUM(total_bill) AS total_revenue FROM hospital_visits_fact"
-    return run_query(query).iloc[0, 0]
+    return load_kpi_snapshot().total_revenue
 
 def get_total_visits():
-    query = "SELECT COUNT(DISTINCT visit_id) AS total_visits FROM hospital_visits_fact"
-    return run_query(query).iloc[0, 0]
+    return load_kpi_snapshot().total_visits
 
 def get_total_patients():
-    query = "SELECT COUNT(DISTINCT patient_id) AS total_patients FROM hospital_visits_fact"
-    return run_query(query).iloc[0, 0]
+    return load_kpi_snapshot().total_patients
 
 def get_most_common_specialization():
-    query = """
-    SELECT d.specialization, COUNT(f.doctor_id) AS count
-    FROM hospital_visits_fact f
-    JOIN doctor_dim d USING (doctor_id)
-    GROUP BY d.specialization
-    ORDER BY count DESC
-    LIMIT 1;
-    """
-    return run_query(query).iloc[0, 0]
+    return load_kpi_snapshot().most_common_specialization
 
 def get_disease_category_counts():
     query = """
@@ -57,7 +33,7 @@ def get_disease_category_counts():
     JOIN disease_dim d USING (disease_id)
     GROUP BY d.category;
     """
-    return run_query(query)
+    return cached_query(query)
 
 def get_hospital_revenue():
     query = """
@@ -66,7 +42,7 @@ def get_hospital_revenue():
     JOIN hospital_dim h USING (hospital_id)
     GROUP BY h.hospital_name;
     """
-    return run_query(query)
+    return cached_query(query)
 
 # --- Streamlit Dashboard ---
 st.set_page_config(page_title="Healthcare Dashboard", layout="wide")
@@ -125,18 +101,22 @@ elif menu == "Aggregations":
     agg_choice = st.selectbox("Select an Aggregation", agg_options)
 
     if agg_choice == "Disease Category Counts":
-        df = get_disease_category_counts()
-        fig, ax = plt.subplots()
-        ax.pie(df["disease_count"], labels=df["category"], autopct='%1.1f%%', startangle=90)
-        ax.set_title("Disease Category Distribution")
-        st.pyplot(fig)
+        def draw():
+            df = get_disease_category_counts()
+            fig, ax = plt.subplots()
+            ax.pie(df["disease_count"], labels=df["category"], autopct='%1.1f%%', startangle=90)
+            ax.set_title("Disease Category Distribution")
+            return fig
+        show_figure("disease_category_counts", draw)
 
     elif agg_choice == "Hospital Revenue":
-        df = get_hospital_revenue()
-        fig, ax = plt.subplots()
-        ax.pie(df["revenue"], labels=df["hospital_name"], autopct='%1.1f%%', startangle=90)
-        ax.set_title("Revenue by Hospital")
-        st.pyplot(fig)
+        def draw():
+            df = get_hospital_revenue()
+            fig, ax = plt.subplots()
+            ax.pie(df["revenue"], labels=df["hospital_name"], autopct='%1.1f%%', startangle=90)
+            ax.set_title("Revenue by Hospital")
+            return fig
+        show_figure("hospital_revenue_pie", draw)
 
     elif agg_choice == "Average Bill by Insurance Type":
         query = """
@@ -145,13 +125,15 @@ elif menu == "Aggregations":
         JOIN billing_dim b USING (billing_id)
         GROUP BY b.insurance_type;
         """
-        df = run_query(query)
-        fig, ax = plt.subplots()
-        sns.barplot(x="insurance_type", y="avg_bill", data=df, ax=ax)
-        ax.set_title("Average Bill by Insurance Type")
-        ax.set_xlabel("Insurance Type")
-        ax.set_ylabel("Average Bill ($)")
-        st.pyplot(fig)
+        def draw():
+            df = cached_query(query)
+            fig, ax = plt.subplots()
+            sns.barplot(x="insurance_type", y="avg_bill", data=df, ax=ax)
+            ax.set_title("Average Bill by Insurance Type")
+            ax.set_xlabel("Insurance Type")
+            ax.set_ylabel("Average Bill ($)")
+            return fig
+        show_figure("avg_bill_by_insurance_type", draw)
 
     elif agg_choice == "Patient Visits by Age Group":
         query = """
@@ -169,11 +151,12 @@ elif menu == "Aggregations":
         GROUP BY age_group
         ORDER BY age_group;
         """
-        df = run_query(query)
-        fig, ax = plt.subplots()
-        sns.barplot(x="age_group", y="visit_count", data=df, ax=ax)
-        ax.set_title("Patient Visits by Age Group")
-        ax.set_xlabel("Age Group")
-        ax.set_ylabel("Number of Visits")
-        st.pyplot(fig)
-
+        def draw():
+            df = cached_query(query)
+            fig, ax = plt.subplots()
+            sns.barplot(x="age_group", y="visit_count", data=df, ax=ax)
+            ax.set_title("Patient Visits by Age Group")
+            ax.set_xlabel("Age Group")
+            ax.set_ylabel("Number of Visits")
+            return fig
+        show_figure("visits_by_age_group", draw)
@@ -0,0 +1,108 @@
+import os
+
+import pandas as pd
+from sqlalchemy import inspect
+
+from schema import PRIMARY_KEYS
+
+# UUID -> integer key maps, one CSV per dimension, kept across incremental loads. The loaded
+# dimension tables hold the same pairs and win over these files, which are only a local copy.
+KEYMAP_DIR = "keymaps"
+
+# Dimension rows without a UUID key are set aside here, next to fact_table.py's rejected visits
+QUARANTINE_DIR = "quarantine"
+
+DIMENSION_KEYS = {table: key for table, key in PRIMARY_KEYS.items() if table.endswith("_dim")}
+
+
+def uuid_column(key):
+    # patient_id -> patient_uuid
+    return key[:-len("_id")] + "_uuid"
+
+
+def keymap_path(dim_table):
+    return os.path.join(KEYMAP_DIR, f"{dim_table}_keys.csv")
+
+
+def load_key_map(dim_table, engine=None):
+    """The dimension's UUID -> key pairs: the local file, overridden by the loaded table's when `engine` is given."""
+    key = DIMENSION_KEYS[dim_table]
+    natural_key = uuid_column(key)
+    path = keymap_path(dim_table)
+    if os.path.exists(path):
+        key_map = pd.read_csv(path, dtype={natural_key: "object", key: "int64"})
+    else:
+        key_map = pd.DataFrame({natural_key: pd.Series(dtype="object"), key: pd.Series(dtype="int64")})
+    if engine is None:
+        return key_map
+
+    # A lost key map, or a load from another host, must not re-key rows the fact table references
+    inspector = inspect(engine)
+    if not inspector.has_table(dim_table):
+        return key_map
+    if natural_key not in {column["name"] for column in inspector.get_columns(dim_table)}:
+        return key_map
+    stored = pd.read_sql(
+        f"SELECT {natural_key}, {key} FROM {dim_table} WHERE {natural_key} IS NOT NULL", engine
+    ).astype({natural_key: "object", key: "int64"})
+    local = key_map[~key_map[natural_key].isin(stored[natural_key]) & ~key_map[key].isin(stored[key])]
+    if len(local) < len(key_map):
+        print(f"⚠️ {dim_table}: {len(key_map) - len(local)} local surrogate keys disagree with the table; using the table's")
+    return pd.concat([stored, local], ignore_index=True)
+
+
+def save_key_map(dim_table, key_map):
+    os.makedirs(KEYMAP_DIR, exist_ok=True)
+    tmp_path = keymap_path(dim_table) + ".tmp"
+    key_map.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, keymap_path(dim_table))
+
+
+def quarantine_missing_keys(rejected, dim_table):
+    os.makedirs(QUARANTINE_DIR, exist_ok=True)
+    path = os.path.join(QUARANTINE_DIR, f"{dim_table}_rejects.csv")
+    rejected.assign(reason=f"missing {DIMENSION_KEYS[dim_table]}", rejected_at=pd.Timestamp.now()).to_csv(
+        path, mode="a", header=not os.path.exists(path), index=False
+    )
+    print(f"⚠️ {dim_table}: {len(rejected):,} rows without a key; written to {path}")
+
+
+def assign_surrogate_keys(df, dim_table, engine=None):
+    """Give every dimension row a dense integer key; UUIDs seen in earlier loads keep their key.
+
+    With `engine`, the keys already in the loaded dimension table are kept too, so the local key
+    map can be lost without re-keying anything. Rows without a UUID can't be keyed or referenced
+    and are quarantined instead.
+    """
+    key = DIMENSION_KEYS[dim_table]
+    natural_key = uuid_column(key)
+    key_map = load_key_map(dim_table, engine)
+
+    missing = df[key].isna()
+    if missing.any():
+        quarantine_missing_keys(df[missing], dim_table)
+        df = df[~missing]
+
+    uuids = df[key].astype("object")
+    unseen = uuids[~uuids.isin(key_map[natural_key])].dropna().drop_duplicates()
+    if not unseen.empty:
+        start = int(key_map[key].max()) + 1 if not key_map.empty else 1
+        new_keys = pd.DataFrame({natural_key: unseen.to_numpy(), key: range(start, start + len(unseen))})
+        key_map = pd.concat([key_map, new_keys], ignore_index=True)
+    save_key_map(dim_table, key_map)
+
+    keyed = df.rename(columns={key: natural_key})
+    keyed.insert(0, key, uuids.map(key_map.set_index(natural_key)[key]).astype("int64"))
+    print(f"🔑 {dim_table}: {len(unseen)} new surrogate keys ({len(key_map)} total)")
+    return keyed
+
+
+def map_foreign_keys(fact, engine=None):
+    """Swap the fact table's UUID foreign keys for integer keys; UUIDs with no key become NA."""
+    fact = fact.copy()
+    for dim_table, key in DIMENSION_KEYS.items():
+        if key not in fact:
+            continue
+        key_map = load_key_map(dim_table, engine).set_index(uuid_column(key))[key]
+        fact[key] = fact[key].astype("object").map(key_map).astype("Int64")
+    return fact
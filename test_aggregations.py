@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+import aggregations
+from conftest import raw_extract
+
+
+def records(rows):
+    """Rows as a frame in a fixed order, with numbers compared as floats."""
+    df = pd.DataFrame(rows)
+    df = df.astype({column: float for column in df.columns if pd.api.types.is_numeric_dtype(df[column])})
+    return df.sort_values(list(df.columns), ignore_index=True)
+
+
+@pytest.mark.parametrize("engine", ["sql", "numpy"])
+def test_one_pass_matches_the_individual_queries(warehouse, engine):
+    raw = raw_extract(visits=600, patients=100)
+    raw["doctor_id"] = [f"doctor-{i % 7}" for i in range(len(raw))]
+    raw["doctor_name"] = [f"Dr {i % 7}" for i in range(len(raw))]
+    raw["hospital_id"] = [f"hospital-{i % 3}" for i in range(len(raw))]
+    raw["hospital_name"] = [f"Hospital {i % 3}" for i in range(len(raw))]
+    raw["total_bill_x"] = [float(i % 11) for i in range(len(raw))]
+    warehouse(raw)
+
+    results = aggregations.run_aggregations(engine=engine)
+
+    for name, query in aggregations.QUERIES.items():
+        pd.testing.assert_frame_equal(records(results[name]), records(aggregations.run_query(query)), obj=name)
+
+
+@pytest.mark.parametrize("backend", ["mysql", "duckdb"])
+def test_metrics_are_one_statement(backend):
+    query = aggregations.grouping_query(
+        {name: metric["branch"] for name, metric in aggregations.METRICS.items()},
+        distinct=["patient_statistics", "patients_per_doctor"],
+        backend=backend,
+    )
+    assert query.count("hospital_visits_fact") == 1
+    assert "COUNT(DISTINCT" in query
@@ -0,0 +1,82 @@
+import pandas as pd
+
+import clean
+from conftest import raw_extract
+
+
+def test_same_key_across_chunks_with_missing_integer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    raw = raw_extract(visits=3_000, patients=500)
+    # A patient seen only once, in the second chunk, without an age: that chunk's age column
+    # is all integers but one missing value
+    raw.loc[1_500, ["patient_id_x", "patient_id_y"]] = "patient-once"
+    raw["age"] = raw["age"].astype("Int64")
+    raw.loc[1_500, "age"] = pd.NA
+    # Exact duplicates of a row from the first chunk and of the row with the missing age
+    raw = pd.concat([raw, raw.iloc[[10, 1_500]]], ignore_index=True)
+    raw.to_csv("raw.csv", index=False)
+
+    clean.clean("raw.csv", chunksize=1_000, formats=("csv",))
+
+    assert not (tmp_path / clean.CONFLICTS_DIR).exists()
+    patients = pd.read_csv("cleaned_patient_dim.csv", dtype=str)
+    assert len(patients) == 501
+    assert not patients["age"].str.contains(".", regex=False, na=False).any()
+    assert len(pd.read_csv("cleaned_hospital_visits_fact.csv")) == 3_000
+
+
+def test_conflicting_versions_are_reported(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    raw = raw_extract(visits=3_000, patients=500)
+    raw.loc[2_500, "age"] = 99
+    raw.to_csv("raw.csv", index=False)
+
+    clean.clean("raw.csv", chunksize=1_000, formats=("csv",))
+
+    patients = pd.read_csv("cleaned_patient_dim.csv")
+    assert len(patients) == 500
+    assert patients.loc[patients["patient_id"] == "patient-0", "age"].item() == 20
+    conflicts = pd.read_csv(clean.conflicts_path("patient_dim"))
+    assert conflicts[["patient_id", "age"]].values.tolist() == [["patient-0", 99]]
+
+
+def cleaned_tables():
+    tables = {}
+    for table_name, spec in clean.OUTPUT_TABLES.items():
+        key = spec["rename"].get(spec["key"], spec["key"]) or "visit_id"
+        tables[table_name] = pd.read_csv(f"cleaned_{table_name}.csv", dtype=str).sort_values(key, ignore_index=True)
+    return tables
+
+
+def test_output_does_not_depend_on_the_chunk_size(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    raw = raw_extract(visits=1_000, patients=150)
+    # Missing values to fill with the mode, and duplicate visits spread over the chunks
+    raw["alcohol_consumption"] = [[None, "Low", "High"][i % 150 % 3] for i in range(len(raw))]
+    raw = pd.concat([raw, raw.iloc[::7]], ignore_index=True)
+    raw.to_csv("raw.csv", index=False)
+
+    clean.clean("raw.csv", chunksize=len(raw), formats=("csv",))
+    whole = cleaned_tables()
+    clean.clean("raw.csv", chunksize=97, formats=("csv",))
+    chunked = cleaned_tables()
+
+    for table_name in clean.OUTPUT_TABLES:
+        pd.testing.assert_frame_equal(chunked[table_name], whole[table_name], obj=table_name)
+    assert len(whole["hospital_visits_fact"]) == 1_000
+
+
+def test_fill_mode_is_taken_over_every_chunk(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    raw = raw_extract(visits=600, patients=600)
+    # "Low" leads in the first chunk only; "High" and "Rare" tie overall and the smaller value wins
+    raw["exercise_frequency"] = ["Low"] * 150 + ["High"] * 200 + ["Rare"] * 200 + [None] * 50
+    raw["alcohol_consumption"] = None
+    raw.to_csv("raw.csv", index=False)
+
+    clean.clean("raw.csv", chunksize=200, formats=("csv",))
+
+    patients = pd.read_csv("cleaned_patient_dim.csv")
+    assert patients["exercise_frequency"].value_counts().to_dict() == {"High": 250, "Rare": 200, "Low": 150}
+    # A column with no values at all is left unfilled instead of failing the run
+    assert patients["alcohol_consumption"].isna().all()
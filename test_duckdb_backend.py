@@ -0,0 +1,49 @@
+import duckdb_backend
+from conftest import raw_extract
+from db import run_query
+
+
+def test_group_by_key_becomes_group_by_all():
+    query = """
+        SELECT p.patient_id, p.name, (SELECT MAX(age) FROM patient_dim GROUP BY gender LIMIT 1) AS oldest
+        FROM patient_dim p JOIN (SELECT patient_id FROM hospital_visits_fact GROUP BY patient_id) f USING (patient_id)
+        GROUP BY p.patient_id HAVING COUNT(*) > 1 ORDER BY p.name;
+    """
+    assert duckdb_backend.group_by_all(query) == (
+        query.replace("GROUP BY gender", "GROUP BY ALL")
+        .replace("GROUP BY patient_id)", "GROUP BY ALL)")
+        .replace("GROUP BY p.patient_id", "GROUP BY ALL")
+    )
+
+
+def test_mysql_placeholders_and_show_columns_are_translated():
+    assert duckdb_backend.translate(
+        "SELECT * FROM t WHERE a = %s AND b LIKE CONCAT('%%', %s)", ["x", "y"]
+    ) == "SELECT * FROM t WHERE a = ? AND b LIKE CONCAT('%', ?)"
+    # Without parameters pymysql leaves the query untouched, so no escapes are undone
+    assert duckdb_backend.translate("SELECT '%%'") == "SELECT '%%'"
+    assert duckdb_backend.translate("show columns from patient_dim;").startswith(
+        'SELECT column_name AS "Field"'
+    )
+
+
+def test_mysql_queries_run_on_the_cleaned_files(warehouse):
+    warehouse(raw_extract(visits=24, patients=6))
+
+    columns = run_query("SHOW COLUMNS FROM patient_data_mart")["Field"].tolist()
+    assert columns[:2] == ["patient_id", "patient_uuid"]
+
+    query = """
+        SELECT p.patient_id, p.name, COUNT(*) AS visits, DATE_FORMAT(MIN(f.visit_date), '%%Y-%%m') AS first_month
+        FROM hospital_visits_fact f JOIN patient_dim p USING (patient_id)
+        WHERE p.age >= %s
+        GROUP BY p.patient_id
+        ORDER BY p.patient_id
+    """
+    visits = run_query(query, [22])
+    assert visits["patient_id"].tolist() == [f"patient-{p}" for p in range(2, 6)]
+    assert visits["visits"].tolist() == [4] * 4
+    assert visits["first_month"].tolist() == [f"2024-{p + 1:02d}" for p in range(2, 6)]
+    # The GROUP BY rewrite is learnt from the first run and reused
+    assert query in duckdb_backend._grouping_fixed
+    assert run_query(query, [22]).equals(visits)
@@ -0,0 +1,25 @@
+import pandas as pd
+
+import fact_table
+
+
+def test_rejected_rows_are_appended_to_the_quarantine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first = pd.DataFrame({"visit_id": ["v1", "v2"], "reason": ["unknown patient_id", "missing visit_date"]})
+    second = pd.DataFrame({"visit_id": ["v3"], "reason": ["unknown doctor_id; unknown hospital_id"]})
+
+    fact_table.quarantine(first, "hospital_visits_fact")
+    fact_table.quarantine(first.iloc[:0], "hospital_visits_fact")
+    fact_table.quarantine(second, "hospital_visits_fact")
+
+    rejects = pd.read_csv(tmp_path / fact_table.QUARANTINE_DIR / "hospital_visits_fact_rejects.csv")
+    assert rejects[["visit_id", "reason"]].values.tolist() == [
+        ["v1", "unknown patient_id"], ["v2", "missing visit_date"], ["v3", "unknown doctor_id; unknown hospital_id"],
+    ]
+    assert rejects["rejected_at"].notna().all()
+
+
+def test_nothing_is_written_without_rejects(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fact_table.quarantine(pd.DataFrame({"visit_id": [], "reason": []}), "hospital_visits_fact")
+    assert not (tmp_path / fact_table.QUARANTINE_DIR).exists()
@@ -0,0 +1,33 @@
+import pandas as pd
+
+import kpis
+from conftest import raw_extract
+
+
+def normalized(df):
+    """Rows in a fixed order with plain dtypes; the engines label in different dtypes and break ties differently."""
+    df = df.astype({column: object for column in df.columns if not pd.api.types.is_numeric_dtype(df[column])})
+    return df.sort_values(list(df.columns), ignore_index=True)
+
+
+def test_numpy_snapshot_matches_sql_with_missing_ages(warehouse):
+    raw = raw_extract(visits=600, patients=100)
+    # Every known age is under 60
+    raw["age"] = (20 + raw.index % 100 % 40).astype("Int64")
+    raw.loc[raw["patient_id_x"].isin(["patient-3", "patient-7"]), "age"] = pd.NA
+    warehouse(raw)
+
+    sql = kpis.compute_kpi_snapshot("sql")
+    numpy = kpis.compute_kpi_snapshot("numpy")
+
+    age_groups = numpy.visits_by_age_group.set_index("age_group")["total_visits"]
+    # Patients without an age fall into the CASE's ELSE branch
+    assert age_groups["60+"] == 12
+    for field in kpis.fields(kpis.KpiSnapshot):
+        if field.name == "computed_at":
+            continue
+        expected, actual = getattr(sql, field.name), getattr(numpy, field.name)
+        if isinstance(expected, pd.DataFrame):
+            pd.testing.assert_frame_equal(normalized(actual), normalized(expected), check_dtype=False)
+        else:
+            assert actual == expected, field.name
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+import mart_browser
+from conftest import raw_extract
+
+NO_AGE = {0, 3, 7}
+
+
+@pytest.fixture
+def patients(warehouse):
+    # Ten patients, three without an age and the rest sharing three ages
+    raw = raw_extract(visits=10, patients=10)
+    raw["age"] = [pd.NA if i in NO_AGE else 20 + i % 3 for i in range(len(raw))]
+    warehouse(raw)
+    ages = {f"patient-{i}": None if i in NO_AGE else 20 + i % 3 for i in range(10)}
+    return ages
+
+
+def all_pages(page_size, **kwargs):
+    ids, pages, after = [], 0, None
+    while True:
+        page, after = mart_browser.fetch_mart_page("patient_data_mart", after=after, page_size=page_size, **kwargs)
+        ids += list(page["patient_id"])
+        pages += 1
+        if after is None:
+            return ids, pages
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_run_through_null_sort_values(patients, descending):
+    ids, pages = all_pages(3, columns=["patient_id", "age"], sort_by="age", descending=descending)
+
+    aged = sorted((age, key) for key, age in patients.items() if age is not None)
+    missing = sorted(key for key, age in patients.items() if age is None)
+    if descending:
+        aged, missing = aged[::-1], missing[::-1]
+    # NULL ages come last in either direction, each group ordered by the key as a tie-breaker
+    assert ids == [key for _, key in aged] + missing
+    assert pages == 4
+
+
+def test_page_size_is_clamped(patients, monkeypatch):
+    page, after = mart_browser.fetch_mart_page("patient_data_mart", page_size=0)
+    assert len(page) == 1 and after is not None
+
+    monkeypatch.setattr(mart_browser, "MAX_PAGE_SIZE", 4)
+    page, after = mart_browser.fetch_mart_page("patient_data_mart", page_size=1_000)
+    assert len(page) == 4
+    assert after == (page["patient_id"].iloc[-1], page["patient_id"].iloc[-1])
+
+
+def test_unknown_columns_and_filters_are_ignored(patients):
+    page, after = mart_browser.fetch_mart_page(
+        "patient_data_mart", columns=["patient_id", "age; DROP TABLE x"], sort_by="nope",
+        filters=[("age", ">=", 21), ("age; --", "=", 1), ("age", "LIKE", "%")],
+    )
+    assert list(page.columns) == ["patient_id"]
+    assert sorted(page["patient_id"]) == sorted(key for key, age in patients.items() if age is not None and age >= 21)
+    assert after is None
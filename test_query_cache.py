@@ -0,0 +1,70 @@
+import clean
+import query_cache
+from conftest import raw_extract
+
+VISITS = "SELECT COUNT(*) AS visits FROM hospital_visits_fact"
+
+
+def test_rerunning_clean_invalidates_duckdb_results(warehouse, monkeypatch):
+    monkeypatch.setattr(query_cache, "VERSION_CHECK_INTERVAL", 0)
+    warehouse(raw_extract(visits=300, patients=50))
+    before = query_cache.current_data_version()
+    assert query_cache.cached_query(VISITS)["visits"][0] == 300
+
+    raw_extract(visits=200, patients=50).to_csv("raw.csv", index=False)
+    clean.clean("raw.csv")
+
+    assert query_cache.current_data_version() != before
+    assert query_cache.cached_query(VISITS)["visits"][0] == 200
+
+
+def test_entries_expire_after_their_ttl(warehouse, monkeypatch):
+    warehouse(raw_extract(visits=30, patients=5))
+    clock = [1_000.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: clock[0])
+    misses = query_cache.cache_stats()["misses"]
+
+    query_cache.cached_query(VISITS, ttl=60)
+    clock[0] += 59
+    query_cache.cached_query(VISITS, ttl=60)
+    assert query_cache.cache_stats()["misses"] == misses + 1
+
+    clock[0] += 2
+    query_cache.cached_query(VISITS, ttl=60)
+    assert query_cache.cache_stats()["misses"] == misses + 2
+
+
+def test_least_recently_used_entry_is_evicted_first(warehouse, monkeypatch):
+    warehouse(raw_extract(visits=30, patients=5))
+    first, second, third = (f"SELECT {n} AS n" for n in range(3))
+    size = int(query_cache.cached_query(first).memory_usage(deep=True).sum())
+    query_cache.clear_cache()
+    monkeypatch.setattr(query_cache, "CACHE_MAX_BYTES", 2 * size)
+
+    query_cache.cached_query(first)
+    query_cache.cached_query(second)
+    query_cache.cached_query(first)
+    query_cache.cached_query(third)
+
+    stats = query_cache.cache_stats()
+    assert (stats["entries"], stats["bytes"]) == (2, 2 * size)
+    hits = stats["hits"]
+    query_cache.cached_query(first)
+    query_cache.cached_query(third)
+    assert query_cache.cache_stats()["hits"] == hits + 2
+    query_cache.cached_query(second)
+    assert query_cache.cache_stats()["hits"] == hits + 2
+
+
+def test_a_new_data_version_drops_cached_results(warehouse, monkeypatch):
+    warehouse(raw_extract(visits=30, patients=5))
+    monkeypatch.setattr(query_cache, "VERSION_CHECK_INTERVAL", 0)
+    query_cache.cached_query(VISITS)
+    hits = query_cache.cache_stats()["hits"]
+    query_cache.cached_query(VISITS)
+    assert query_cache.cache_stats()["hits"] == hits + 1
+
+    monkeypatch.setattr(query_cache.duckdb_backend, "source_version", lambda: -1)
+    query_cache.cached_query(VISITS)
+    assert query_cache.cache_stats()["hits"] == hits + 1
+    assert query_cache.cache_stats()["data_version"] == -1
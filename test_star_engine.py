@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import star_engine
+from star_engine import FOREIGN_KEYS, StarEngine, age_groups
+
+
+@pytest.fixture
+def engine():
+    # Six visits: one without a hospital, one at a hospital the dimension lacks, one without a
+    # bill and one without a date
+    fact = pd.DataFrame({
+        "patient_id": ["p1", "p1", "p2", "p3", "p3", "p3"],
+        "disease_id": ["d1"] * 6,
+        "billing_id": [f"b{i}" for i in range(6)],
+        "hospital_id": ["h1", "h1", "h2", None, "h9", "h2"],
+        "doctor_id": ["doc1"] * 6,
+        "visit_date": ["2024-02-03", "2024-01-15", "2024-02-20", None, "2023-12-31", "2024-01-01"],
+        "total_bill": [10.0, 20.0, np.nan, 40.0, 50.0, 60.0],
+    })
+    dims = {dim: pd.DataFrame({key: fact[key].dropna().unique()}) for key, dim in FOREIGN_KEYS.items()}
+    dims["hospital_dim"] = pd.DataFrame({
+        "hospital_id": ["h1", "h2", "h3", "h1"], "city": ["North", "South", "South", "North"],
+    })
+    dims["patient_dim"] = dims["patient_dim"].assign(age=[17.0, 36.0, np.nan])
+    return StarEngine(fact, dims)
+
+
+def test_grouped_totals_follow_the_inner_join(engine):
+    assert engine.total_visits() == 6
+    assert engine.total_revenue() == 180.0
+    assert engine.avg_revenue_per_visit() == 36.0
+
+    # The visits without a hospital, or at one the dimension lacks, drop out; h3 has no visits
+    totals = engine.totals_by("hospital_dim", "city").set_index("label")
+    assert totals.to_dict("index") == {
+        "North": {"visits": 2, "bills": 2, "revenue": 30.0},
+        "South": {"visits": 2, "bills": 1, "revenue": 60.0},
+    }
+    assert engine.revenue_by("hospital_dim", "city").to_dict() == {"North": 30.0, "South": 60.0}
+    assert engine.visits_by("hospital_dim", "city").to_dict() == {"North": 2, "South": 2}
+
+
+def test_monthly_trend_is_in_month_order_with_missing_dates_last(engine):
+    trend = engine.monthly_trend()
+    assert list(trend.index[:-1]) == ["2023-12", "2024-01", "2024-02"]
+    assert pd.isna(trend.index[-1])
+    assert list(trend) == [1, 2, 2, 1]
+
+
+def test_sparse_grouping_matches_the_dense_one(engine, monkeypatch):
+    keys = ["patient_id", "hospital_id"]
+    dense = engine.fact_parts(keys)
+    monkeypatch.setattr(star_engine, "DENSE_GROUP_LIMIT", 0)
+    sparse = engine.fact_parts(keys)
+
+    def ordered(df):
+        return df.astype({key: str for key in keys}).sort_values(keys, ignore_index=True)
+
+    pd.testing.assert_frame_equal(ordered(dense), ordered(sparse))
+    assert dense["visits"].sum() == 6
+    assert dense["bills"].sum() == 5
+
+
+def test_age_groups_put_missing_ages_with_the_oldest():
+    ages = pd.Series([0, 18, 19, 35, 36, 60, 61, None], dtype="Int64")
+    assert list(age_groups(ages)) == ["0-18", "0-18", "19-35", "19-35", "36-60", "36-60", "60+", "60+"]
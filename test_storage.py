@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+import pytest
+
+import storage
+from conftest import raw_extract
+from instrumentation import span
+
+SINCE_NOVEMBER = [("visit_date", ">=", "2024-11-01")]
+
+
+def as_csv(monkeypatch):
+    # Without pyarrow read_table falls back to the CSV copy written next to the Parquet output
+    monkeypatch.setattr(storage, "pq", None)
+
+
+def rows(df, key):
+    return df.astype(str).sort_values(key, ignore_index=True)
+
+
+@pytest.fixture
+def tables(warehouse):
+    raw = raw_extract(visits=240, patients=40)
+    raw["total_bill_x"] = [float(i % 7) for i in range(len(raw))]
+    return warehouse(raw)
+
+
+@pytest.mark.parametrize("table_name, key, filters", [
+    ("hospital_visits_fact", "visit_id", SINCE_NOVEMBER + [("total_bill", "<", 3.0)]),
+    ("patient_dim", "patient_id", [("age", ">=", 40)]),
+])
+def test_filtered_reads_match_the_csv(tables, monkeypatch, table_name, key, filters):
+    columns = [key, filters[-1][0]]
+    parquet = storage.read_table(table_name, columns=columns, filters=filters)
+    as_csv(monkeypatch)
+    csv = storage.read_table(table_name, columns=columns, filters=filters)
+
+    assert list(parquet.columns) == columns
+    assert len(parquet) > 0
+    pd.testing.assert_frame_equal(rows(parquet, key), rows(csv, key))
+
+
+def test_date_filters_only_open_matching_months(tables):
+    months = storage.partition_dir("hospital_visits_fact")
+    assert sorted(os.listdir(os.path.join(months, "year=2024")), key=lambda m: int(m[6:])) == [
+        f"month={m}" for m in range(1, 13)
+    ]
+    wanted = sum(
+        os.path.getsize(os.path.join(months, "year=2024", f"month={m}", "part-0.parquet")) for m in (11, 12)
+    )
+
+    with span("read") as s:
+        visits = storage.read_table("hospital_visits_fact", filters=SINCE_NOVEMBER)
+
+    assert s.bytes_read == wanted
+    assert set(visits["visit_date"].dt.month) == {11, 12}
+    assert len(visits) == 40
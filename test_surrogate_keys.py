@@ -0,0 +1,61 @@
+import shutil
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+import surrogate_keys
+
+
+def doctors(*uuids):
+    return pd.DataFrame({"doctor_id": list(uuids), "doctor_name": [f"Dr {uuid}" for uuid in uuids]})
+
+
+def test_keys_are_stable_across_loads(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first = surrogate_keys.assign_surrogate_keys(doctors("a", "b", "c"), "doctor_dim")
+    second = surrogate_keys.assign_surrogate_keys(doctors("c", "d", "a"), "doctor_dim")
+
+    assert first[["doctor_uuid", "doctor_id"]].values.tolist() == [["a", 1], ["b", 2], ["c", 3]]
+    assert second[["doctor_uuid", "doctor_id"]].values.tolist() == [["c", 3], ["d", 4], ["a", 1]]
+
+
+def test_lost_key_map_is_seeded_from_the_loaded_table(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    engine = create_engine(f"sqlite:///{tmp_path / 'warehouse.db'}")
+    keyed = surrogate_keys.assign_surrogate_keys(doctors("a", "b", "c"), "doctor_dim", engine)
+    keyed.to_sql("doctor_dim", engine, index=False)
+    shutil.rmtree(surrogate_keys.KEYMAP_DIR)
+
+    reloaded = surrogate_keys.assign_surrogate_keys(doctors("d", "c", "a"), "doctor_dim", engine)
+
+    assert reloaded[["doctor_uuid", "doctor_id"]].values.tolist() == [["d", 4], ["c", 3], ["a", 1]]
+
+
+def test_loaded_table_wins_over_a_stale_key_map(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    engine = create_engine(f"sqlite:///{tmp_path / 'warehouse.db'}")
+    pd.DataFrame({"doctor_id": [1, 2], "doctor_uuid": ["a", "b"]}).to_sql("doctor_dim", engine, index=False)
+    # Written on another host: "x" took key 2, which the table gives to "b"
+    surrogate_keys.save_key_map("doctor_dim", pd.DataFrame({"doctor_uuid": ["a", "x"], "doctor_id": [1, 2]}))
+
+    keyed = surrogate_keys.assign_surrogate_keys(doctors("b", "x"), "doctor_dim", engine)
+
+    assert keyed[["doctor_uuid", "doctor_id"]].values.tolist() == [["b", 2], ["x", 3]]
+
+
+def test_rows_without_a_uuid_are_quarantined(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    keyed = surrogate_keys.assign_surrogate_keys(doctors("a", None, "b"), "doctor_dim")
+
+    assert keyed["doctor_uuid"].tolist() == ["a", "b"]
+    rejects = pd.read_csv(tmp_path / surrogate_keys.QUARANTINE_DIR / "doctor_dim_rejects.csv")
+    assert rejects["reason"].tolist() == ["missing doctor_id"]
+
+
+def test_unknown_foreign_keys_become_missing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    surrogate_keys.assign_surrogate_keys(doctors("a", "b"), "doctor_dim")
+
+    fact = surrogate_keys.map_foreign_keys(pd.DataFrame({"visit_id": ["v1", "v2"], "doctor_id": ["b", "zzz"]}))
+
+    assert fact["doctor_id"].tolist() == [2, pd.NA]
@@ -0,0 +1,93 @@
+import datetime
+
+# High-water marks of the incremental loads, one row per loader (fact load, each data mart, ...)
+WATERMARK_TABLE = "etl_watermarks"
+
+
+def ensure_watermark_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            name VARCHAR(64) PRIMARY KEY,
+            high_water DATETIME(6) NOT NULL,
+            high_water_id VARCHAR(50),
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def get_watermark(cursor, name):
+    """Return (high_water, high_water_id) for `name`, or (None, None) if it has never run."""
+    cursor.execute(f"SELECT high_water, high_water_id FROM {WATERMARK_TABLE} WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    if row is None:
+        return None, None
+    if isinstance(row, dict):
+        return row["high_water"], row["high_water_id"]
+    return row[0], row[1]
+
+
+def set_watermark(cursor, name, high_water, high_water_id=None):
+    if isinstance(high_water, datetime.date) and not isinstance(high_water, datetime.datetime):
+        high_water = datetime.datetime.combine(high_water, datetime.time())
+    cursor.execute(f"""
+        INSERT INTO {WATERMARK_TABLE} (name, high_water, high_water_id) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE high_water = VALUES(high_water), high_water_id = VALUES(high_water_id)
+    """, (name, high_water, high_water_id))
+
+
+# Single-row counter bumped by every loader after it commits new data; caches of query
+# results compare it against the version they were filled under
+DATA_VERSION_TABLE = "etl_data_version"
+
+
+def ensure_data_version_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DATA_VERSION_TABLE} (
+            id TINYINT PRIMARY KEY,
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def get_data_version(cursor):
+    cursor.execute(f"SELECT version FROM {DATA_VERSION_TABLE} WHERE id = 1")
+    row = cursor.fetchone()
+    if row is None:
+        return 0
+    return row["version"] if isinstance(row, dict) else row[0]
+
+
+def bump_data_version(cursor):
+    # No DDL here: CREATE TABLE would implicitly commit the caller's open transaction, so
+    # loaders call ensure_data_version_table() before they start loading
+    cursor.execute(f"""
+        INSERT INTO {DATA_VERSION_TABLE} (id, version) VALUES (1, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """)
+
+
+def dimension_watermark(table_name):
+    """Name of the watermark a dimension load sets to the time its rows were replaced."""
+    return f"dim:{table_name}"
+
+
+# Foreign keys a fact load took away from visits it corrected, stamped like loaded_at, so the
+# marts also recompute the dimension rows that lost those visits
+KEY_CHANGES_TABLE = "etl_fact_key_changes"
+
+
+def ensure_key_changes_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {KEY_CHANGES_TABLE} (
+            load_id CHAR(32) NOT NULL,
+            changed_at DATETIME(6) NOT NULL,
+            patient_id INT,
+            disease_id INT,
+            billing_id INT,
+            hospital_id INT,
+            doctor_id INT,
+            INDEX idx_changed_at (changed_at),
+            INDEX idx_load_id (load_id)
+        )
+    """)